@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+""" bench_calendar.py:
+    Calendar sync and lookup benchmark.  Runs GoogleCalSync against the
+    fake calendar backend at a range of calendar sizes and times the full
+    sync, the schedule rebuild (convert_data), incremental syncs, the
+    fallback full sync after a sync token expires, and the per-message
+    lookups.  Results are written as JSON so runs can be compared between
+    commits.  Daily recurring events can be added to compare reading every
+    instance with expanding the series locally.
+
+    python3 benchmarks/bench_calendar.py --events 1000 10000 100000 \
+        --output calendar.json
+    python3 benchmarks/bench_calendar.py --events 0 --recurring 50 \
+        --expand-recurring
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.fake_calendar import DEVICES
+from bob_schedule_service.fake_calendar import FakeCalendarService
+from bob_schedule_service.goog_cal import GoogleCalSync
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Helper Functions ************************************************************
+def timed(func, *args):
+    """ returns the seconds taken by one call """
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def time_lookups(cal, lookups):
+    """ returns the mean microseconds per call of each lookup path """
+    results = {}
+    for name, func in (('check_schedule', cal.check_schedule),
+                       ('sched_by_name', cal.sched_by_name),
+                       ('next_transition', cal.next_transition)):
+        start = time.perf_counter()
+        for i in range(lookups):
+            func(DEVICES[i % len(DEVICES)])
+        results[name + '_us'] = 1e6 * (time.perf_counter() - start) / lookups
+    return results
+
+
+def run_size(args, event_count, credential_dir):
+    """ benchmarks one calendar size """
+    logger = logging.getLogger('bench_calendar')
+    backend = FakeCalendarService(
+        event_count=event_count, latency=args.latency,
+        max_page_size=args.page_size, recurring_count=args.recurring,
+        logger=logger)
+    cal = GoogleCalSync(
+        cal_id='fake', credential_dir=credential_dir, logger=logger,
+        backend=backend, expand_recurring=args.expand_recurring,
+        recurrence_horizon=datetime.timedelta(days=args.horizon_days))
+    cal.page_size = args.page_size
+    result = {'events': event_count,
+              'recurring_events': args.recurring,
+              'stored_events': len(cal.event_store),
+              'stored_bytes': len(json.dumps(list(cal.event_store.values()))),
+              'schedule_entries': len(cal.schedule)}
+
+    # Full sync, then the rebuild on its own
+    cal.sync_token = None
+    calls = backend.calls
+    result['full_sync_s'] = timed(cal.update_schedule)
+    result['full_sync_api_calls'] = backend.calls - calls
+    result['convert_data_s'] = min(timed(cal.convert_data)
+                                   for _ in range(args.repeat))
+
+    # Incremental sync with a handful of changed events
+    for key in backend.order[:args.changes]:
+        backend.put(backend.event_map[key])
+    result['incremental_sync_s'] = timed(cal.update_schedule)
+
+    # Full sync forced by an expired sync token
+    backend.expire_sync_tokens()
+    result['expired_token_sync_s'] = timed(cal.update_schedule)
+
+    result.update(time_lookups(cal, args.lookups))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--events', type=int, nargs='+',
+                        default=[100, 1000, 10000],
+                        help='calendar sizes to benchmark')
+    parser.add_argument('--page-size', type=int, default=250,
+                        help='events per API page')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to each fake API call')
+    parser.add_argument('--recurring', type=int, default=0,
+                        help='daily recurring events added to the calendar')
+    parser.add_argument('--expand-recurring', action='store_true',
+                        help='read recurring events as masters and expand locally')
+    parser.add_argument('--horizon-days', type=float, default=7,
+                        help='days ahead to expand recurring events')
+    parser.add_argument('--changes', type=int, default=10,
+                        help='events changed before the incremental sync')
+    parser.add_argument('--lookups', type=int, default=10000,
+                        help='calls timed for each lookup path')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='convert_data runs, the fastest is kept')
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON results to')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=getattr(logging, args.log_level))
+
+    with tempfile.TemporaryDirectory() as credential_dir:
+        sizes = [run_size(args, count, credential_dir) for count in args.events]
+    result = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'page_size': args.page_size,
+            'latency': args.latency,
+            'expand_recurring': args.expand_recurring,
+            'horizon_days': args.horizon_days,
+            'changes': args.changes,
+            'lookups': args.lookups},
+        'results': sizes}
+    print(json.dumps(result, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
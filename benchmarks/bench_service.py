@@ -0,0 +1,456 @@
+#!/usr/bin/python3
+""" bench_service.py:
+    End-to-end throughput and latency benchmark.  Runs the service pipeline
+    from start_service in a child process on local ports, backed by the
+    fake calendar API, and drives heartbeat and get_device_scheduled_state
+    traffic at it from stand-in automation services.  Results are written
+    as JSON so runs can be compared between commits.
+
+    python3 benchmarks/bench_service.py --concurrency 8 --duration 10 \
+        --output results.json --baseline previous.json
+
+    Give --loop more than once to run the same workload on each event
+    loop in turn and compare them, eg. --loop asyncio --loop uvloop
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.fake_calendar import FakeCalendarService
+from bob_schedule_service.goog_cal import GoogleCalSync
+from bob_schedule_service.start_service import create_service
+from bob_schedule_service.start_service import start_tasks
+from bob_schedule_service.start_service import start_workers
+from bob_schedule_service.start_service import stop_tasks
+from bob_schedule_service.tools.event_loop import install_loop_policy
+from bob_schedule_service.tools.metrics import Metrics
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+MESSAGE_TYPES = {
+    'heartbeat': '100',
+    'heartbeat_ack': '101',
+    'get_device_scheduled_state': '302',
+    'get_device_scheduled_state_ack': '303',
+    'subscribe_device_scheduled_state': '304',
+    'subscribe_device_scheduled_state_ack': '305',
+    'device_scheduled_state_change': '306',
+    'get_device_scheduled_states': '308',
+    'get_device_scheduled_states_ack': '309',
+    'get_service_stats': '310',
+    'get_service_stats_ack': '311'}
+# The client pipelines newline terminated requests over one connection
+DELIVERY_SETTINGS = {'framing': 'newline'}
+DEVICES = ['fylt1', 'fylt2', 'bylt1', 'lrlt1', 'br1lt1', 'br2lt1', 'br3lt1']
+
+
+# Helper Functions ************************************************************
+def free_port(low=20000, high=60000):
+    """ returns an unused local port inside the range the message field
+    checkers accept """
+    while True:
+        port = random.randint(low, high)
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            try:
+                sock.bind(('127.0.0.1', port))
+            except OSError:
+                continue
+            return port
+
+
+def percentile(values, pct):
+    """ nearest rank percentile of a list of values """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(values):
+    """ latency summary in milliseconds """
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None}
+
+
+def process_usage():
+    """ returns cpu seconds used and peak rss (kB) of this process and
+    any worker processes it has waited for """
+    if resource is None:
+        return time.process_time(), None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    max_rss = max(usage.ru_maxrss, children.ru_maxrss)
+    if sys.platform == 'darwin':
+        max_rss = max_rss // 1024
+    return (usage.ru_utime + usage.ru_stime +
+            children.ru_utime + children.ru_stime), max_rss
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Service Side ****************************************************************
+@asyncio.coroutine
+def wait_for_port(loop, port, timeout=10.0):
+    """ waits until a local port accepts connections """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = yield from asyncio.open_connection('127.0.0.1', port, loop=loop)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            yield from asyncio.sleep(0.05, loop=loop)
+        else:
+            writer.close()
+            return
+
+
+def serve(args):
+    """ runs the service pipeline until stdin is closed, then prints the
+    process cpu and memory usage as JSON """
+    logging.basicConfig(stream=sys.stderr, level=getattr(logging, args.log_level))
+    logger = logging.getLogger('master')
+    loop_name = install_loop_policy(args.loop[0], logger=logger)
+    service_addresses = {
+        'automation_addr': '127.0.0.1',
+        'automation_port': str(args.automation_port),
+        'schedule_addr': '127.0.0.1',
+        'schedule_port': str(args.port)}
+    metrics = Metrics(logger=logger)
+    backend = FakeCalendarService(
+        event_count=args.calendar_events, devices=DEVICES,
+        latency=args.calendar_latency, logger=logger)
+    schedule = GoogleCalSync(
+        cal_id='fake', credential_dir=args.credential_dir, logger=logger,
+        metrics=metrics, backend=backend)
+    workers = None
+    if args.workers > 0:
+        workers = start_workers(
+            logger, schedule, service_addresses, MESSAGE_TYPES, args.workers,
+            delivery_settings=DELIVERY_SETTINGS)
+    loop = asyncio.get_event_loop()
+    comm_handler, scheduler, maintask = create_service(
+        loop, logger, schedule, service_addresses, MESSAGE_TYPES, metrics=metrics,
+        delivery_settings=DELIVERY_SETTINGS)
+    maintask.hb_interval = args.heartbeat_interval
+    if workers is not None:
+        workers.scheduler = scheduler
+        workers.connect(loop)
+    msg_in_server = start_tasks(
+        loop, logger, comm_handler, scheduler, maintask, service_addresses,
+        serve=workers is None)
+
+    # Stop once the parent closes stdin
+    def wait_for_stop():
+        sys.stdin.read()
+        loop.call_soon_threadsafe(loop.stop)
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+
+    # Workers bind the shared port after they are forked
+    if workers is not None:
+        loop.run_until_complete(wait_for_port(loop, args.port))
+
+    cpu_start, _ = process_usage()
+    wall_start = time.monotonic()
+    print('READY', flush=True)
+    loop.run_forever()
+    if workers is not None:
+        workers.stop()
+    cpu_end, max_rss = process_usage()
+    wall_seconds = time.monotonic() - wall_start
+    stop_tasks(loop, logger, msg_in_server, comm_handler)
+    loop.close()
+    print(json.dumps({
+        'cpu_seconds': cpu_end - cpu_start,
+        'wall_seconds': wall_seconds,
+        'max_rss_kb': max_rss,
+        'event_loop': loop_name,
+        'send_failures': sum(comm_handler.send_failures.values())}), flush=True)
+
+
+# Load Generator **************************************************************
+class StandIn(object):
+    """ Stand-in automation service.  Accepts the service's outgoing
+    messages, ACKs them and completes whichever request is waiting """
+    def __init__(self, loop):
+        self.loop = loop
+        self.port = None
+        self.server = None
+        self.waiting = None
+        self.heartbeats = 0
+
+    @asyncio.coroutine
+    def start(self):
+        while self.server is None:
+            self.port = free_port()
+            try:
+                self.server = yield from asyncio.start_server(
+                    self.handle, host='127.0.0.1', port=self.port, loop=self.loop)
+            except OSError:
+                self.server = None
+
+    @asyncio.coroutine
+    def handle(self, reader, writer):
+        while True:
+            data = yield from reader.readline()
+            if not data:
+                break
+            fields = data.decode().rstrip('\n').split(',')
+            writer.write(fields[0].encode() + b'\n')
+            if len(fields) > 5 and fields[5] == MESSAGE_TYPES['heartbeat']:
+                # Periodic heartbeat from the service, not a response
+                self.heartbeats += 1
+            elif self.waiting is not None and not self.waiting.done():
+                self.waiting.set_result(data)
+        writer.close()
+
+
+@asyncio.coroutine
+def worker(loop, args, stand_in, deadline, results):
+    """ closed loop client: sends a request, waits for the service's ACK
+    and then for the response at the stand-in, then sends the next """
+    reader, writer = yield from asyncio.open_connection(
+        '127.0.0.1', args.port, loop=loop)
+    ref = 100
+    while time.monotonic() < deadline:
+        ref = ref + 1 if ref < 999 else 100
+        if random.random() < args.heartbeat_ratio:
+            msg_type, payload = 'heartbeat', ''
+        else:
+            msg_type = 'get_device_scheduled_state'
+            payload = ',' + random.choice(DEVICES)
+        msg = '%s,127.0.0.1,%s,127.0.0.1,%s,%s%s\n' % (
+            ref, args.port, stand_in.port, MESSAGE_TYPES[msg_type], payload)
+        stand_in.waiting = asyncio.Future(loop=loop)
+        start = time.perf_counter()
+        try:
+            writer.write(msg.encode())
+            ack = yield from asyncio.wait_for(reader.readline(), args.timeout, loop=loop)
+            acked = time.perf_counter()
+            if not ack:
+                raise ConnectionError('service closed the connection')
+            yield from asyncio.wait_for(stand_in.waiting, args.timeout, loop=loop)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            results['errors'] += 1
+            continue
+        done = time.perf_counter()
+        results['ack'].append((acked - start) * 1000.0)
+        results[msg_type].append((done - start) * 1000.0)
+    writer.close()
+
+
+@asyncio.coroutine
+def drive(loop, args):
+    """ starts the stand-ins and workers, returns the raw results """
+    results = {'ack': [], 'heartbeat': [], 'get_device_scheduled_state': [],
+               'errors': 0}
+    stand_ins = [StandIn(loop) for i in range(args.concurrency)]
+    for stand_in in stand_ins:
+        yield from stand_in.start()
+    # Warm up the connection pool and calendar lookups without recording
+    warmup = {'ack': [], 'heartbeat': [], 'get_device_scheduled_state': [],
+              'errors': 0}
+    yield from asyncio.gather(*[
+        worker(loop, args, stand_in, time.monotonic() + args.warmup, warmup)
+        for stand_in in stand_ins], loop=loop)
+    started = time.monotonic()
+    yield from asyncio.gather(*[
+        worker(loop, args, stand_in, started + args.duration, results)
+        for stand_in in stand_ins], loop=loop)
+    results['elapsed'] = time.monotonic() - started
+    for stand_in in stand_ins:
+        stand_in.server.close()
+    return results
+
+
+def run_benchmark(args, loop_name='asyncio'):
+    """ starts the service in a child process on the named event loop,
+    drives load at it and returns the result document.  The load generator
+    always uses the asyncio loop so only the service side changes """
+    args.port = free_port()
+    args.automation_port = free_port()
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve',
+         '--port', str(args.port),
+         '--automation-port', str(args.automation_port),
+         '--credential-dir', args.credential_dir,
+         '--heartbeat-interval', str(args.heartbeat_interval),
+         '--calendar-events', str(args.calendar_events),
+         '--workers', str(args.workers),
+         '--calendar-latency', str(args.calendar_latency),
+         '--loop', loop_name,
+         '--log-level', args.log_level],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        if child.stdout.readline().strip() != b'READY':
+            raise RuntimeError('service failed to start')
+        loop = asyncio.get_event_loop()
+        results = loop.run_until_complete(drive(loop, args))
+        child.stdin.close()
+        usage = json.loads(child.stdout.readline().decode())
+        child.wait(timeout=10)
+    finally:
+        if child.poll() is None:
+            child.kill()
+
+    completed = len(results['heartbeat']) + len(results['get_device_scheduled_state'])
+    latency = results['heartbeat'] + results['get_device_scheduled_state']
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'heartbeat_ratio': args.heartbeat_ratio,
+            'timeout': args.timeout,
+            'calendar_events': args.calendar_events,
+            'workers': args.workers,
+            'event_loop': loop_name,
+            'calendar_latency': args.calendar_latency},
+        'results': {
+            'completed': completed,
+            'errors': results['errors'],
+            'elapsed_seconds': results['elapsed'],
+            'msgs_per_sec': completed / results['elapsed'],
+            'latency_ms': summarize(latency),
+            'ack_latency_ms': summarize(results['ack']),
+            'heartbeat_latency_ms': summarize(results['heartbeat']),
+            'get_device_scheduled_state_latency_ms':
+                summarize(results['get_device_scheduled_state']),
+            'service_cpu_seconds': usage['cpu_seconds'],
+            'service_cpu_percent': 100.0 * usage['cpu_seconds'] / usage['wall_seconds'],
+            'service_max_rss_kb': usage['max_rss_kb'],
+            'service_event_loop': usage['event_loop'],
+            'service_send_failures': usage['send_failures']}}
+
+
+def loop_label(result):
+    """ names the event loop a run used, noting any fallback """
+    requested = result['config'].get('event_loop', 'asyncio')
+    used = result['results'].get('service_event_loop', 'asyncio')
+    if requested == used:
+        return used
+    return '%s (unavailable, ran %s)' % (requested, used)
+
+
+def compare(result, baseline):
+    """ prints the change in headline numbers against a previous run """
+    for key, path in [('msgs/s', ('msgs_per_sec',)),
+                      ('p50 ms', ('latency_ms', 'p50')),
+                      ('p99 ms', ('latency_ms', 'p99')),
+                      ('cpu %', ('service_cpu_percent',)),
+                      ('rss kB', ('service_max_rss_kb',))]:
+        new, old = result['results'], baseline['results']
+        for step in path:
+            new, old = new.get(step), old.get(step)
+        if new is None or not old:
+            continue
+        print('%-8s %12.3f -> %12.3f (%+.1f%%)' % (
+            key, old, new, 100.0 * (new - old) / old))
+
+
+# Main ************************************************************************
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='number of closed loop clients')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds to record results for')
+    parser.add_argument('--warmup', type=float, default=1.0,
+                        help='seconds of unrecorded traffic before the run')
+    parser.add_argument('--heartbeat-ratio', type=float, default=0.2,
+                        help='fraction of requests that are heartbeats')
+    parser.add_argument('--timeout', type=float, default=5.0,
+                        help='seconds to wait for an ACK or response')
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON results to')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results of a previous run to compare with')
+    parser.add_argument('--credential-dir', default=os.path.join(
+        os.path.expanduser('~'), '.credentials'))
+    parser.add_argument('--heartbeat-interval', type=float, default=60)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='worker processes sharing the service port')
+    parser.add_argument('--calendar-events', type=int, default=42,
+                        help='events served by the fake calendar')
+    parser.add_argument('--calendar-latency', type=float, default=0.0,
+                        help='seconds added to each fake calendar API call')
+    parser.add_argument('--loop', action='append', default=None,
+                        help='event loop for the service (asyncio, uvloop or '
+                             'module:PolicyClass).  Repeat to compare loops')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--automation-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    results = [run_benchmark(args, loop_name) for loop_name in args.loop or ['asyncio']]
+    document = results[0] if len(results) == 1 else results
+    print(json.dumps(document, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(document, output, indent=2)
+    for result in results[1:]:
+        print('%s vs %s:' % (loop_label(result), loop_label(results[0])))
+        compare(result, results[0])
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            baselines = json.load(baseline)
+        if isinstance(baselines, dict):
+            baselines = [baselines]
+        for result in results:
+            # Compare against the baseline run on the same loop if there is one
+            baseline = next((x for x in baselines if x['config'].get('event_loop', 'asyncio')
+                             == result['config']['event_loop']), baselines[0])
+            print('%s vs baseline:' % loop_label(result))
+            compare(result, baseline)
+
+
+if __name__ == "__main__":
+    main()
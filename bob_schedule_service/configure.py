@@ -9,40 +9,116 @@ import datetime
 import logging
 import logging.handlers
 import os
+import queue
 import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from bob_schedule_service.schedule import Sched
 from bob_schedule_service.goog_cal import GoogleCalSync
+from bob_schedule_service.fake_calendar import FakeCalendarService
+from bob_schedule_service.multi_cal import MultiCalendarSync
+from bob_schedule_service.tools.event_loop import install_loop_policy
+from bob_schedule_service.tools.log_sampling import SampledLogger
 
 
-# Log Filter for Individual file/functions ************************************
-class MyLogHandlerFilter(logging.Filter):
-    def __init__(self, file_name, func_name):
-        self.file_name = file_name
-        self.func_name = func_name
+# Log Router for Individual file/functions ************************************
+class LogRouter(logging.Handler):
+    """ Single handler that passes each record on to only the handlers
+    registered for its source file and/or function.  An empty file or
+    function name in a route matches any value.  The handler list for
+    each (filename, funcName) pair is worked out the first time the pair
+    is seen and reused after that """
+    def __init__(self):
+        self.routes = {}
+        self.destinations = {}
         super().__init__()
 
-    def filter(self, record):
-        if len(self.file_name) != 0 and len(self.func_name) != 0:
-            if record.filename == self.file_name and record.funcName == self.func_name:
-                return True
-            else:
-                return False
-        elif len(self.file_name) != 0 and len(self.func_name) == 0:
-            if record.filename == self.file_name:
-                return True
-            else:
-                return False
-        elif len(self.file_name) == 0 and len(self.func_name) != 0:
-            if record.funcName == self.func_name:
-                return True
-            else:
+    def add_route(self, handler, file_name='', func_name=''):
+        self.routes.setdefault((file_name, func_name), []).append(handler)
+        self.destinations = {}
+
+    def lookup(self, file_name, func_name):
+        key = (file_name, func_name)
+        try:
+            return self.destinations[key]
+        except KeyError:
+            pass
+        handlers = []
+        for route in [key, (file_name, ''), ('', func_name), ('', '')]:
+            for handler in self.routes.get(route, []):
+                if handler not in handlers:
+                    handlers.append(handler)
+        self.destinations[key] = tuple(handlers)
+        return self.destinations[key]
+
+    def emit(self, record):
+        for handler in self.lookup(record.filename, record.funcName):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def close(self):
+        for handlers in self.routes.values():
+            for handler in handlers:
+                handler.close()
+        super().close()
+
+
+# Bounded, non-blocking queue handler *****************************************
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """ Hands log records to a QueueListener thread without formatting
+    them first, so the caller only pays for a queue put.  When the queue
+    is full the drop policy decides what happens: "oldest" discards the
+    oldest queued record, "newest" discards the new record and "block"
+    waits for the listener to catch up.  Dropped records are counted and
+    reported through the queue once there is room again """
+    def __init__(self, log_queue, drop_policy='oldest'):
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.unreported = 0
+        super().__init__(log_queue)
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread.  Arguments are
+        # formatted late, so they should not be mutated after logging
+        return record
+
+    def put(self, record):
+        if self.drop_policy == 'block':
+            self.queue.put(record)
+            return True
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            pass
+        if self.drop_policy == 'oldest':
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
                 return False
-        elif len(self.file_name) == 0 and len(self.func_name) == 0:
+            self.dropped += 1
+            self.unreported += 1
             return True
-        else:
-            return False
+        return False
+
+    def enqueue(self, record):
+        if self.unreported and self.queue.qsize() < self.queue.maxsize - 1:
+            self.queue.put_nowait(logging.makeLogRecord({
+                'name': record.name,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'funcName': 'enqueue',
+                'filename': 'configure.py',
+                'msg': 'Log queue full, %s record(s) dropped',
+                'args': (self.unreported,)}))
+            self.unreported = 0
+        if not self.put(record):
+            self.dropped += 1
+            self.unreported += 1
 
 
 # Authorship Info *************************************************************
@@ -65,8 +141,10 @@ class ConfigureService(object):
         self.credentials = None
         self.schedule = None
         self.handlers = []
-        self.filters = []
         self.formatters = []
+        self.router = LogRouter()
+        self.log_queue = None
+        self.log_listener = None
         # Define connection to configuration file
         self.config_file = configparser.ConfigParser()
         self.cred_file = configparser.ConfigParser()
@@ -85,8 +163,7 @@ class ConfigureService(object):
         self.ch.setLevel(logging.INFO)
         self.cf = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         self.ch.setFormatter(self.cf)
-        self.logger.addHandler(self.ch)
-        self.logger.info('Console logger handler created and applied')
+        self.handlers.append(self.ch)
         # File handler
         self.fh = logging.handlers.TimedRotatingFileHandler(
             os.path.join(self.log_path, "Debug.log"),
@@ -100,11 +177,9 @@ class ConfigureService(object):
             '%(funcName)-22s %(message)s'
         )
         self.fh.setFormatter(self.ff)
-        self.logger.addHandler(self.fh)
-        self.logger.info('File logger handler created and applied')
+        self.handlers.append(self.fh)
 
         # Extra handlers defined by config.ini
-        self.i = 0
         for key, value in self.config_file.items('EXTRA LOG HANDLERS'):
             self.file_name = str()
             self.func_name = str()
@@ -120,33 +195,137 @@ class ConfigureService(object):
             self.log_file_name = self.log_file_name + ".log"
 
             # Create individual handler for this function name
-            self.handlers.append(
-                logging.handlers.TimedRotatingFileHandler(
-                    os.path.join(self.log_path, self.log_file_name),
-                    when='d',
-                    interval=1,
-                    backupCount=4
-                )
-            )
-            # Create filter based on function name and apply to handler
-            self.filters.append(
-                MyLogHandlerFilter(
-                    file_name=self.file_name,
-                    func_name=self.func_name
-                )
+            self.handler = logging.handlers.TimedRotatingFileHandler(
+                os.path.join(self.log_path, self.log_file_name),
+                when='d',
+                interval=1,
+                backupCount=4
             )
-            self.handlers[self.i].addFilter(self.filters[self.i])
             # Create formatter and apply to handler
             self.formatters.append(logging.Formatter('%(asctime)-25s %(levelname)-10s %(message)s'))
-            self.handlers[self.i].setFormatter(self.formatters[self.i])
-            # Add handler to logger
-            self.logger.addHandler(self.handlers[self.i])
-            self.i += 1
+            self.handler.setFormatter(self.formatters[-1])
+            # Route records from this file / function name to the handler
+            self.router.add_route(
+                self.handler,
+                file_name=self.file_name,
+                func_name=self.func_name
+            )
+        if len(self.router.routes) > 0:
+            self.handlers.append(self.router)
+
+        # Either attach handlers directly, or run them on a listener thread
+        # so the event loop only has to queue each record
+        if self.config_file.getboolean('LOG FILES', 'queue_logging', fallback=False):
+            self.log_queue = queue.Queue(
+                self.config_file.getint('LOG FILES', 'queue_size', fallback=10000))
+            self.qh = BoundedQueueHandler(
+                self.log_queue,
+                drop_policy=self.config_file.get(
+                    'LOG FILES', 'queue_drop_policy', fallback='oldest'))
+            self.logger.addHandler(self.qh)
+            self.log_listener = logging.handlers.QueueListener(
+                self.log_queue, *self.handlers, respect_handler_level=True)
+            self.log_listener.start()
+            self.logger.info('Queued log handlers created and applied')
+        else:
+            for handler in self.handlers:
+                self.logger.addHandler(handler)
+            self.logger.info('Log handlers created and applied')
 
         # Return configured objects to main program
         return self.logger
 
 
+    def get_hot_path_logger(self):
+        # Wrap the master logger for per-message code.  The debug mode is
+        # read once here so disabled debug calls cost a single no-op call
+        self.config_file.read(self.filename)
+        self.hot_path_logger = SampledLogger(
+            self.logger,
+            mode=self.config_file.get('LOG FILES', 'hot_path_debug', fallback='on'),
+            sample_rate=self.config_file.getint(
+                'LOG FILES', 'hot_path_sample_rate', fallback=100))
+        self.logger.info('Hot path debug logging mode: %s', self.hot_path_logger.mode)
+        return self.hot_path_logger
+
+
+    def close_logger(self):
+        # Flush queued log records and stop the listener thread
+        if self.log_listener is not None:
+            self.log_listener.stop()
+            self.log_listener = None
+
+
+    def restart_log_listener(self):
+        # A forked process doesn't inherit the listener thread.  Its copy
+        # of the queue may hold records the parent writes itself, and any
+        # lock held by another thread at the fork is never released, so
+        # give this process its own queue, queue handler and handler locks
+        # before starting its listener
+        if self.log_listener is not None:
+            for handler in self.handlers + [
+                    handler for route in self.router.routes.values()
+                    for handler in route]:
+                handler.createLock()
+            self.logger.removeHandler(self.qh)
+            self.log_queue = queue.Queue(self.log_queue.maxsize)
+            self.qh = BoundedQueueHandler(self.log_queue, drop_policy=self.qh.drop_policy)
+            self.logger.addHandler(self.qh)
+            self.log_listener = logging.handlers.QueueListener(
+                self.log_queue, *self.handlers, respect_handler_level=True)
+            self.log_listener.start()
+
+
+    def get_worker_count(self):
+        # Number of worker processes sharing the schedule port.  Zero runs
+        # everything in a single process
+        self.config_file.read(self.filename)
+        return self.config_file.getint('PROCESSES', 'workers', fallback=0)
+
+
+    def get_ref_settings(self):
+        # Message ref number width and sequencing, and how long a sent
+        # message waits for its ACK.  Three digit refs suit older services
+        self.config_file.read(self.filename)
+        return {
+            'digits': self.config_file.getint('MESSAGE REFS', 'digits', fallback=3),
+            'per_dest': self.config_file.getboolean(
+                'MESSAGE REFS', 'per_destination', fallback=False),
+            'ack_timeout': self.config_file.getfloat(
+                'MESSAGE REFS', 'ack_timeout', fallback=30.0)}
+
+
+    def get_delivery_settings(self):
+        # How long to wait for each ACK and how often to retry messages
+        # that aren't ACKed before giving up on them.  framing is "legacy"
+        # (one unterminated message per connection, as older services
+        # send) or "newline" when every peer terminates its messages.
+        # Delivery is at least once.  Resent messages can be recognised for
+        # duplicate_window seconds (0, the default, turns this off), which
+        # has to be shorter than peers take to reuse refs
+        self.config_file.read(self.filename)
+        return {
+            'send_timeout': self.config_file.getfloat(
+                'DELIVERY', 'send_timeout', fallback=5.0),
+            'max_retries': self.config_file.getint('DELIVERY', 'max_retries', fallback=5),
+            'retry_delay': self.config_file.getfloat(
+                'DELIVERY', 'retry_delay', fallback=0.5),
+            'max_retry_delay': self.config_file.getfloat(
+                'DELIVERY', 'max_retry_delay', fallback=30.0),
+            'framing': self.config_file.get('DELIVERY', 'framing', fallback='legacy'),
+            'duplicate_window': self.config_file.getfloat(
+                'DELIVERY', 'duplicate_window', fallback=0.0)}
+
+
+    def set_event_loop_policy(self):
+        # Install the configured event loop (eg. uvloop) before any loop is
+        # created.  Falls back to the asyncio loop if it isn't installed
+        self.config_file.read(self.filename)
+        return install_loop_policy(
+            self.config_file.get('PROCESSES', 'event_loop', fallback='asyncio'),
+            logger=self.logger)
+
+
     def get_servers(self):
         # Create dict with all services defined in INI file
         self.config_file.read(self.filename)
@@ -177,7 +356,24 @@ class ConfigureService(object):
         return self.credentials
 
 
-    def get_schedule(self):
+    def get_fake_calendar(self):
+        """ returns a fake calendar API backend set up from the fake_*
+        settings in the CALENDAR section """
+        return FakeCalendarService(
+            event_count=self.config_file.getint(
+                'CALENDAR', 'fake_event_count', fallback=1000),
+            latency=self.config_file.getfloat(
+                'CALENDAR', 'fake_latency', fallback=0.0),
+            max_page_size=self.config_file.getint(
+                'CALENDAR', 'fake_page_size', fallback=2500),
+            error_rate=self.config_file.getfloat(
+                'CALENDAR', 'fake_error_rate', fallback=0.0),
+            recurring_count=self.config_file.getint(
+                'CALENDAR', 'fake_recurring_count', fallback=0),
+            logger=self.logger)
+
+
+    def get_schedule(self, metrics=None):
         # Define connection to configuration file
         self.config_file.read(self.filename)
         self.cred_file.read(self.credentials)
@@ -193,13 +389,47 @@ class ConfigureService(object):
             self.logger.debug('Setting client secret file to: [%s]', self.clientSecretFile)
         except:
             self.calId = self.credentialDir = self.clientSecretFile = None
+        self.snapshotFile = self.config_file.get('CALENDAR', 'snapshot_file', fallback=None)
+        self.logger.debug('Setting schedule snapshot file to: [%s]', self.snapshotFile)
+        # Recurring events can be expanded here instead of by google
+        self.expandRecurring = self.config_file.getboolean(
+            'CALENDAR', 'expand_recurring', fallback=False)
+        self.recurrenceHorizon = datetime.timedelta(days=self.config_file.getfloat(
+            'CALENDAR', 'recurrence_horizon_days', fallback=7))
+        # Several calendars can be given as a comma separated list
+        self.calIds = [cal_id.strip() for cal_id in (self.calId or '').split(',')
+                       if cal_id.strip()]
+        # Use the fake calendar backend for load testing when configured
+        self.calBackends = {}
+        if self.config_file.get('CALENDAR', 'backend', fallback='google') == 'fake':
+            self.calIds = self.calIds or ['fake']
+            for cal_id in self.calIds:
+                self.calBackends[cal_id] = self.get_fake_calendar()
+            self.logger.info('Using fake calendar backend for %s', self.calIds)
         # Create connection to calendar
-        if self.calId is not None:
+        if len(self.calIds) > 1:
+            self.schedule = MultiCalendarSync(
+                cal_ids=self.calIds,
+                credential_dir=self.credentialDir,
+                client_secret=self.clientSecretFile,
+                snapshot_file=self.snapshotFile,
+                logger=self.logger,
+                metrics=metrics,
+                backends=self.calBackends,
+                expand_recurring=self.expandRecurring,
+                recurrence_horizon=self.recurrenceHorizon)
+            self.logger.debug('Created calendar object: [%s]', self.schedule)
+        elif self.calIds:
             self.schedule = GoogleCalSync(
-                cal_id=self.calId,
+                cal_id=self.calIds[0],
                 credential_dir=self.credentialDir,
                 client_secret=self.clientSecretFile,
-                logger=self.logger)
+                snapshot_file=self.snapshotFile,
+                logger=self.logger,
+                metrics=metrics,
+                backend=self.calBackends.get(self.calIds[0]),
+                expand_recurring=self.expandRecurring,
+                recurrence_horizon=self.recurrenceHorizon)
             self.logger.debug('Created calendar object: [%s]', self.schedule)
         else:
             self.logger.error('Error creating calendar object')
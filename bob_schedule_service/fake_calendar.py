@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+""" fake_calendar.py:
+    In-process stand-in for the google calendar API, used as a calendar
+    backend for load testing and benchmarks
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import datetime
+import json
+import logging
+import random
+import threading
+import itertools
+import os
+import sys
+import time
+from apiclient import errors
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.recurrence import occurrences
+from bob_schedule_service.recurrence import parse_recurrence
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+DEVICES = ['fylt1', 'fylt2', 'bylt1', 'ewlt1', 'cclt1', 'lrlt1', 'lrlt2',
+           'drlt1', 'br1lt1', 'br1lt2', 'br2lt1', 'br2lt2', 'br3lt1', 'br3lt2']
+
+
+# Helper Functions ************************************************************
+def generate_events(count, devices=None, start=None, spacing=None,
+                    duration=None):
+    """ returns a list of calendar events spread round-robin across the
+    devices.  Each device gets back to back events starting an hour
+    before start, so some are running and the rest are upcoming """
+    devices = devices or DEVICES
+    start = start or datetime.datetime.now(datetime.timezone.utc).astimezone()
+    start = start.replace(second=0, microsecond=0)
+    spacing = spacing or datetime.timedelta(hours=4)
+    duration = duration or datetime.timedelta(hours=2)
+    events = []
+    for i in range(count):
+        name = devices[i % len(devices)]
+        begin = start + spacing * (i // len(devices)) - datetime.timedelta(hours=1)
+        events.append({
+            'id': 'evt%06d' % i,
+            'status': 'confirmed',
+            'summary': name,
+            'start': {'dateTime': begin.isoformat()},
+            'end': {'dateTime': (begin + duration).isoformat()}})
+    return events
+
+
+def generate_recurring_events(count, devices=None, start=None,
+                              duration=None, rule='RRULE:FREQ=DAILY'):
+    """ returns a list of recurring calendar events spread round-robin
+    across the devices.  Each one repeats by rule, with the first
+    occurrence starting an hour before start """
+    devices = devices or DEVICES
+    start = start or datetime.datetime.now(datetime.timezone.utc).astimezone()
+    start = start.replace(second=0, microsecond=0) - datetime.timedelta(hours=1)
+    duration = duration or datetime.timedelta(hours=2)
+    events = []
+    for i in range(count):
+        begin = start + datetime.timedelta(minutes=i // len(devices))
+        events.append({
+            'id': 'rec%06d' % i,
+            'status': 'confirmed',
+            'summary': devices[i % len(devices)],
+            'start': {'dateTime': begin.isoformat()},
+            'end': {'dateTime': (begin + duration).isoformat()},
+            'recurrence': [rule]})
+    return events
+
+
+def event_end(event):
+    """ parses an event's end time as an aware datetime.  Times without a
+    UTC offset are taken as local time """
+    value = event['end']['dateTime']
+    end = datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    offset = value[19:].lstrip('.0123456789')
+    if offset == 'Z':
+        return end.replace(tzinfo=datetime.timezone.utc)
+    if offset[:1] in ('+', '-'):
+        sign = -1 if offset[0] == '-' else 1
+        return end.replace(tzinfo=datetime.timezone(sign * datetime.timedelta(
+            hours=int(offset[1:3]), minutes=int(offset[4:6]))))
+    return end.astimezone()
+
+
+class FakeResponse(dict):
+    """ minimal http response object carried by errors.HttpError """
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = 'Fake calendar error %s' % status
+
+
+# Fake Calendar Service Class Def *********************************************
+class FakeCalendarService(object):
+    """ Answers events().list(...).execute() calls the way the google
+    calendar API does: results are paged by maxResults (capped at
+    max_page_size), full reads honour timeMin and return a nextSyncToken,
+    and reads with a syncToken return only events changed since that
+    token was issued, including cancelled ones.  Calls can be slowed down
+    with latency and made to fail with queued or random HTTP errors.
+    Recurring events are returned as their master event, or expanded into
+    instances up to instance_horizon ahead when singleEvents is set """
+    def __init__(self, events=None, event_count=0, devices=None, latency=0.0,
+                 max_page_size=2500, error_rate=0.0, seed=None, logger=None,
+                 recurring_count=0, instance_horizon=datetime.timedelta(days=365)):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.instance_horizon = instance_horizon
+        self.random = random.Random(seed)
+        self.pending_errors = []
+        self.calls = 0
+        self.version = 0
+        self.expired_before = 0
+        self.event_map = {}
+        self.ends = {}
+        self.changed = {}
+        self.order = []
+        # Matching events for the query being paged through, so each page
+        # doesn't filter the whole calendar again
+        self.query = None
+        self.query_items = []
+        for event in events or generate_events(event_count, devices=devices):
+            self.put(event)
+        for event in generate_recurring_events(recurring_count, devices=devices):
+            self.put(event)
+
+    # Calendar changes ********************************************************
+    def put(self, event):
+        """ adds or replaces an event, marking it changed """
+        with self.lock:
+            self.version += 1
+            if event['id'] not in self.event_map:
+                self.order.append(event['id'])
+            self.event_map[event['id']] = dict(event)
+            if 'end' in event:
+                self.ends[event['id']] = event_end(event)
+            self.changed[event['id']] = self.version
+
+    def cancel(self, event_id):
+        """ cancels an event, so incremental reads report it as cancelled
+        and full reads leave it out """
+        with self.lock:
+            self.version += 1
+            self.event_map[event_id] = {'id': event_id, 'status': 'cancelled'}
+            self.changed[event_id] = self.version
+
+    def expire_sync_tokens(self):
+        """ makes every sync token issued so far fail with HTTP 410 """
+        with self.lock:
+            self.expired_before = self.version + 1
+
+    def fail_next(self, status, count=1):
+        """ queues HTTP errors for the next calls """
+        with self.lock:
+            self.pending_errors.extend([status] * count)
+
+    # API shaped interface ****************************************************
+    def events(self):
+        return self
+
+    def list(self, **kwargs):
+        return FakeRequest(self, kwargs)
+
+    def execute_list(self, kwargs):
+        """ builds one page of results for a list request """
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            if self.pending_errors:
+                self.raise_error(self.pending_errors.pop(0))
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.raise_error(503)
+            page_size = min(int(kwargs.get('maxResults', 250)), self.max_page_size)
+            offset = int(kwargs.get('pageToken', 0))
+            items = self.match(kwargs)
+            result = {'items': [dict(x) for x in items[offset:offset + page_size]]}
+            if offset + page_size < len(items):
+                result['nextPageToken'] = str(offset + page_size)
+            else:
+                result['nextSyncToken'] = 'sync-%d' % self.version
+        return result
+
+    def match(self, kwargs):
+        """ returns the events a list request selects, in calendar order """
+        single_events = bool(kwargs.get('singleEvents'))
+        query = (kwargs.get('syncToken'), kwargs.get('timeMin'), single_events,
+                 self.version)
+        if query == self.query:
+            return self.query_items
+        if 'syncToken' in kwargs:
+            since = int(kwargs['syncToken'].split('-')[1])
+            if since < self.expired_before:
+                self.raise_error(410)
+            items = [self.event_map[key] for key in self.order
+                     if self.changed[key] > since]
+        else:
+            # Cancelled instances of a recurring event are still listed
+            # when the series is returned as its master event
+            items = [self.event_map[key] for key in self.order
+                     if self.event_map[key].get('status') != 'cancelled' or (
+                         not single_events and 'recurringEventId' in self.event_map[key])]
+        if single_events:
+            items = self.expand(items)
+        if 'syncToken' not in kwargs and 'timeMin' in kwargs:
+            time_min = datetime.datetime.strptime(
+                kwargs['timeMin'][:19], '%Y-%m-%dT%H:%M:%S').replace(
+                    tzinfo=datetime.timezone.utc)
+            items = [x for x in items if 'recurrence' in x or 'end' not in x
+                     or (self.ends[x['id']] if x['id'] in self.ends
+                         else event_end(x)) > time_min]
+        self.query = query
+        self.query_items = items
+        return items
+
+    def expand(self, items):
+        """ replaces recurring master events with their instances, leaving
+        out instances that have been moved or cancelled """
+        horizon = datetime.datetime.now() + self.instance_horizon
+        replaced = set((x['recurringEventId'], x['originalStartTime']['dateTime'][:19])
+                       for x in self.event_map.values() if 'recurringEventId' in x)
+        expanded = []
+        for item in items:
+            if 'recurrence' not in item:
+                expanded.append(item)
+                continue
+            rule, exdates = parse_recurrence(item['recurrence'])
+            start = datetime.datetime.strptime(
+                item['start']['dateTime'][:19], '%Y-%m-%dT%H:%M:%S')
+            duration = event_end(item) - event_end({'end': item['start']})
+            for when in itertools.takewhile(lambda x: x < horizon,
+                                            occurrences(start, rule, exdates)):
+                begin = when.astimezone()
+                if (item['id'], begin.isoformat()[:19]) in replaced:
+                    continue
+                expanded.append({
+                    'id': '%s_%s' % (item['id'], when.strftime('%Y%m%dT%H%M%S')),
+                    'status': 'confirmed',
+                    'summary': item['summary'],
+                    'recurringEventId': item['id'],
+                    'originalStartTime': {'dateTime': begin.isoformat()},
+                    'start': {'dateTime': begin.isoformat()},
+                    'end': {'dateTime': (begin + duration).isoformat()}})
+        return expanded
+
+    def raise_error(self, status):
+        self.logger.debug('Fake calendar returning HTTP %s', status)
+        raise errors.HttpError(
+            FakeResponse(status),
+            json.dumps({'error': {'code': status, 'message': 'fake'}}).encode())
+
+
+class FakeRequest(object):
+    """ deferred list request, run when execute() is called """
+    def __init__(self, service, kwargs):
+        self.service = service
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.service.execute_list(self.kwargs)
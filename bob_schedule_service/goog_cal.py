@@ -4,19 +4,28 @@
 
 # Import Required Libraries (Standard, Third Party, Local) ********************
 #from __future__ import print_function
+import asyncio
 import copy
 import datetime
+import json
 import logging
 import os
 import sys
+import time
+import itertools
 import httplib2
 from apiclient import discovery
+from apiclient import errors
 from oauth2client import client
 from oauth2client import tools
 from oauth2client.file import Storage
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from bob_schedule_service.schedule import Sched
+from bob_schedule_service.schedule import SchedIndex
+from bob_schedule_service.recurrence import occurrences
+from bob_schedule_service.recurrence import parse_recurrence
+from bob_schedule_service.tools.metrics import Metrics
 
 
 # Authorship Info *************************************************************
@@ -30,12 +39,40 @@ __email__ = "csmaue@gmail.com"
 __status__ = "Development"
 
 
+# Event fields kept in the schedule snapshot file
+SNAPSHOT_FIELDS = ('id', 'status', 'summary', 'start', 'end', 'recurrence',
+                   'recurringEventId', 'originalStartTime')
+
+
 # Class Definitions ***********************************************************
 class GoogleCalSync(object):
-    """ Class and methods necessary to read items from a google calendar  """
-    def __init__(self, cal_id=None, credential_dir=None, client_secret=None, logger=None):
+    """ Class and methods necessary to read items from a google calendar.
+    Events are read through a calendar API service object.  By default that
+    is the google API client, built on first use from the stored
+    credentials.  Any object answering events().list(...).execute() the
+    same way can be passed in as backend instead, such as the
+    FakeCalendarService used for load testing.
+    With expand_recurring set, recurring events are read as a single
+    master event and expanded here, only as far ahead as
+    recurrence_horizon, instead of google sending every instance """
+    def __init__(self, cal_id=None, credential_dir=None, client_secret=None,
+                 snapshot_file=None, logger=None, metrics=None, backend=None,
+                 initial_sync=True, expand_recurring=False,
+                 recurrence_horizon=datetime.timedelta(days=7)):
         # Configure loggers
         self.logger = logger or logging.getLogger(__name__)
+        self.metrics = metrics or Metrics(logger=self.logger)
+        self.metrics.describe('calendar_syncs_total', 'counter',
+                              'Calendar reads, by result')
+        self.metrics.describe('calendar_sync_seconds', 'histogram',
+                              'Time to read changes from the calendar API')
+        self.metrics.describe('schedule_build_seconds', 'histogram',
+                              'Time to rebuild the schedule index')
+        self.metrics.describe('calendar_events', 'gauge',
+                              'Upcoming events held in the schedule')
+        self.metrics.describe('calendar_last_sync_timestamp', 'gauge',
+                              'Unix time of the last successful calendar read')
+        self.metrics.gauge('calendar_events', lambda: len(self.event_store))
         # Import calendar ID
         self.logger.debug('Configuring for calendar ID: [%s]', cal_id)
         self.cal_id = cal_id
@@ -68,16 +105,31 @@ class GoogleCalSync(object):
         self.flow = None
         # Define Schedule objects
         self.http = None
-        self.service = None
+        self.service = backend
         self.now = None
         self.result = None
         self.events = None
+        self.event_store = {}
+        self.sync_token = None
+        self.page_size = 250
+        self.expand_recurring = expand_recurring
+        self.recurrence_horizon = recurrence_horizon
         self.newCmd = False
         self.schedule = []
+        self.index = SchedIndex(logger=self.logger)
         self.result_list = []
         self._last_run = datetime.datetime.now() + datetime.timedelta(hours=-2)
-        self.update_schedule()
-        
+        self._last_attempt = self._last_run
+        self.retry_interval = datetime.timedelta(minutes=1)
+        self.refresh_task = None
+        self.refresh_callbacks = []
+        # Start from the on-disk snapshot when there is one, so the service
+        # can answer lookups without waiting on the calendar API.  The first
+        # read can be left to the caller, which lets several calendars be
+        # read at the same time
+        self.snapshot_file = snapshot_file
+        if self.load_snapshot() is not True and initial_sync:
+            self.update_schedule()
 
 
     def get_credentials(self):
@@ -99,42 +151,224 @@ class GoogleCalSync(object):
         return self.credentials
 
 
+    def get_service(self):
+        """ returns the calendar API service object, building it on first
+        use so later reads reuse the same authorized connection.  A backend
+        given at construction is returned as-is """
+        if self.service is None:
+            self.credentials = self.get_credentials()
+            self.http = self.credentials.authorize(httplib2.Http())
+            self.service = discovery.build('calendar', 'v3', http=self.http)
+        return self.service
+
+
+    def read_pages(self, **kwargs):
+        """ performs an events().list call, following nextPageToken until
+        every page has been read.  Returns the combined list of events and
+        the nextSyncToken from the final page """
+        items = []
+        while True:
+            self.result = self.get_service().events().list(
+                calendarId=self.cal_id,
+                maxResults=self.page_size,
+                singleEvents=not self.expand_recurring,
+                **kwargs
+                ).execute()
+            items.extend(self.result.get('items', []))
+            if self.result.get('nextPageToken') is None:
+                return items, self.result.get('nextSyncToken')
+            kwargs['pageToken'] = self.result['nextPageToken']
+
+
+    def is_sync_token_expired(self, exc):
+        """ returns true if an API error means the stored sync token is no
+        longer valid (HTTP 410 Gone) """
+        return getattr(getattr(exc, 'resp', None), 'status', None) == 410
+
+
     def read_data(self):
-        """ Returns all events for the next 14 days using the
-        google calendar API """
-        self.credentials = self.get_credentials()
-        self.http = self.credentials.authorize(httplib2.Http())
-        self.service = discovery.build('calendar', 'v3', http=self.http)
-        self.now = datetime.datetime.utcnow().isoformat() + 'Z'
-        # Perform call to Google calendar API
-        self.result = self.service.events().list(
-            calendarId=self.cal_id,
-            timeMin=self.now,
-            maxResults=100,
-            singleEvents=True,
-            orderBy="startTime"
-            ).execute()
-        self.events = self.result.get('items', [])
+        """ Returns all upcoming events using the google calendar API.  The
+        first read fetches every event from now on.  Later reads pass the
+        stored sync token so only events changed or cancelled since the
+        last read are downloaded, falling back to a full read if the
+        token has expired.  Returns True once the read succeeds, even if
+        no events are left, so the schedule is rebuilt without them; a
+        failed read raises instead """
+        event_store = None
+        if self.sync_token is not None:
+            try:
+                items, sync_token = self.read_pages(syncToken=self.sync_token)
+                self.logger.debug('Incremental sync returned [%s] changes', len(items))
+                event_store = dict(self.event_store)
+            except errors.HttpError as exc:
+                if not self.is_sync_token_expired(exc):
+                    raise
+                self.logger.info('Calendar sync token expired, performing full sync')
+        if event_store is None:
+            self.now = datetime.datetime.utcnow().isoformat() + 'Z'
+            items, sync_token = self.read_pages(timeMin=self.now)
+            self.logger.debug('Full sync returned [%s] events', len(items))
+            event_store = {}
+        # Apply changes, dropping cancelled events and events already over.
+        # Cancelled instances of recurring events are kept when expanding
+        # locally, as they remove that occurrence from the series
+        for event in items:
+            if event.get('status') == 'cancelled' and not (
+                    self.expand_recurring and 'recurringEventId' in event):
+                event_store.pop(event['id'], None)
+            else:
+                event_store[event['id']] = event
+        self.prune_events(event_store)
+        self.event_store = event_store
+        self.sync_token = sync_token
+        self.events = list(self.event_store.values())
         # Check if read operation returned any data
         if not self.events:
             self.logger.debug("No upcoming events found")
-            return False
         else:
             self.logger.debug('Events found')
-            return True
+        return True
+
+
+    def read_calendar(self):
+        """ read_data with timing and result metrics """
+        start = time.perf_counter()
+        try:
+            result = self.read_data()
+        except Exception:
+            self.metrics.inc('calendar_syncs_total', result='error')
+            raise
+        finally:
+            self.metrics.observe('calendar_sync_seconds', time.perf_counter() - start)
+        self.metrics.inc('calendar_syncs_total', result='ok' if self.events else 'empty')
+        self.metrics.set('calendar_last_sync_timestamp', time.time())
+        return result
+
+
+    def prune_events(self, event_store):
+        """ removes events that have already ended from an event store.
+        Recurring event masters are kept, and cancelled instances (which
+        have no end) are removed once their original start has passed """
+        now = datetime.datetime.now()
+        for key in [key for key, event in event_store.items()
+                    if 'recurrence' not in event and (
+                        self.extract_end(event) if 'end' in event
+                        else self.extract_original_start(event)) < now]:
+            del event_store[key]
+
+
+    def save_snapshot(self):
+        """ writes the current events and sync token to the snapshot file.
+        Only the fields needed to rebuild the schedule are kept, and the
+        file is replaced atomically so a crash can't leave it truncated """
+        if self.snapshot_file is None:
+            return
+        snapshot = {
+            'saved': self._last_run.isoformat(),
+            'sync_token': self.sync_token,
+            'events': [
+                dict((field, event[field]) for field in SNAPSHOT_FIELDS
+                     if field in event)
+                for event in self.event_store.values()]
+        }
+        temp_file = self.snapshot_file + '.tmp'
+        try:
+            with open(temp_file, 'w') as file:
+                json.dump(snapshot, file, separators=(',', ':'))
+            os.replace(temp_file, self.snapshot_file)
+            self.logger.debug('Schedule snapshot saved to [%s]', self.snapshot_file)
+        except OSError:
+            self.logger.warning('Could not save schedule snapshot to [%s]',
+                                self.snapshot_file)
+
+
+    def load_snapshot(self):
+        """ loads events and sync token from the snapshot file, if present,
+        and builds the schedule from them.  Returns true if a snapshot was
+        loaded """
+        if self.snapshot_file is None or not os.path.exists(self.snapshot_file):
+            return False
+        try:
+            with open(self.snapshot_file) as file:
+                snapshot = json.load(file)
+            saved = datetime.datetime.strptime(snapshot['saved'][:19],
+                                               '%Y-%m-%dT%H:%M:%S')
+            event_store = dict((event['id'], event) for event in snapshot['events'])
+            self.prune_events(event_store)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.logger.warning('Could not load schedule snapshot from [%s]',
+                                self.snapshot_file)
+            return False
+        self.event_store = event_store
+        self.sync_token = snapshot['sync_token']
+        self.events = list(self.event_store.values())
+        self.convert_data()
+        self._last_run = saved
+        self.logger.info('Loaded [%s] events from schedule snapshot saved at %s',
+                         len(self.events), saved)
+        return True
+
+
+    def build_schedule(self, events):
+        """ converts an event list to a schedule list and the per-device
+        index used for lookups, without touching the current snapshot """
+        start = time.perf_counter()
+        schedule = []
+        # Cycle through raw event list and convert to a usable format
+        for name, sched_start, sched_end in self.schedule_items(events):
+            schedule.append(Sched(
+                logger=self.logger,
+                name=name,
+                start=sched_start,
+                end=sched_end))
+        index = SchedIndex(schedule, logger=self.logger)
+        self.metrics.observe('schedule_build_seconds', time.perf_counter() - start)
+        return schedule, index
+
+
+    def schedule_items(self, events):
+        """ yields the name, start and end of every scheduled period in an
+        event list.  When expanding recurring events locally, each master
+        event is expanded lazily from now until the horizon, skipping its
+        EXDATEs and any instances that were cancelled or moved (moved
+        instances are separate events of their own) """
+        if not self.expand_recurring:
+            for event in events:
+                yield self.extract_name(event), self.extract_start(event), \
+                    self.extract_end(event)
+            return
+        now = datetime.datetime.now()
+        horizon = now + self.recurrence_horizon
+        replaced = set((event['recurringEventId'], self.extract_original_start(event))
+                       for event in events if 'recurringEventId' in event)
+        for event in events:
+            if event.get('status') == 'cancelled':
+                continue
+            name = self.extract_name(event)
+            event_start = self.extract_start(event)
+            event_end = self.extract_end(event)
+            if 'recurrence' not in event:
+                yield name, event_start, event_end
+                continue
+            try:
+                rule, exdates = parse_recurrence(event['recurrence'])
+            except ValueError as exc:
+                self.logger.warning('Event [%s]: %s, using its first occurrence only',
+                                    event['id'], exc)
+                yield name, event_start, event_end
+                continue
+            duration = event_end - event_start
+            for when in itertools.takewhile(
+                    lambda x: x < horizon,
+                    occurrences(event_start, rule, exdates, after=now - duration)):
+                if (event['id'], when) not in replaced:
+                    yield name, when, when + duration
 
 
     def convert_data(self):
         """ converts event list raw format to a structured format useful for
         comparisons between time/dates """
-        self.schedule = []
-        # Cycle through raw event list and convert to a usable format
-        for event in self.events:
-            self.schedule.append(Sched(
-                logger=self.logger,
-                name=self.extract_name(event),
-                start=self.extract_start(event),
-                end=self.extract_end(event)))
+        self.schedule, self.index = self.build_schedule(self.events)
 
 
     def update_schedule(self):
@@ -143,9 +377,69 @@ class GoogleCalSync(object):
         If the read was not successful, it leaves the last batch of valid
         data in place to continue using until the next update """
         if self.cal_id != None:
-            if self.read_data() is True:
+            if self.read_calendar() is True:
                 self.convert_data()
                 self._last_run = datetime.datetime.now()
+                self.save_snapshot()
+                self.run_refresh_callbacks()
+
+
+    def fetch_schedule(self):
+        """ reads the calendar, builds a new schedule snapshot and saves it
+        to disk.  Runs in a worker thread, so it only returns the snapshot
+        and leaves swapping it in to the event loop """
+        if self.read_calendar() is True:
+            snapshot = self.build_schedule(self.events)
+            self._last_run = datetime.datetime.now()
+            self.save_snapshot()
+            return snapshot
+        return None
+
+
+    @asyncio.coroutine
+    def refresh(self):
+        """ task to re-read the calendar in a thread-pool executor and swap
+        in the new snapshot once the read completes.  Lookups keep using
+        the previous snapshot until then, and keep it if the read fails """
+        loop = asyncio.get_event_loop()
+        self._last_attempt = datetime.datetime.now()
+        try:
+            snapshot = yield from loop.run_in_executor(None, self.fetch_schedule)
+        except Exception:
+            self.logger.exception('Calendar refresh failed, keeping last '
+                                  'schedule')
+            snapshot = None
+        finally:
+            self.refresh_task = None
+        if snapshot is not None:
+            self.schedule, self.index = snapshot
+            self.logger.debug('Schedule snapshot refreshed')
+            self.run_refresh_callbacks()
+
+
+    def run_refresh_callbacks(self):
+        """ lets interested tasks know a new schedule snapshot is in place """
+        for callback in self.refresh_callbacks:
+            callback()
+
+
+    def request_refresh(self, when=None):
+        """ starts a background refresh if the schedule is stale and no
+        refresh is already running.  Falls back to a blocking update when
+        there is no running event loop to hand the work to """
+        if self.cal_id is None or self.refresh_task is not None:
+            return
+        if self.should_rerun(when) is not True:
+            return
+        now = datetime.datetime.now()
+        if now < self._last_attempt + self.retry_interval:
+            return
+        loop = asyncio.get_event_loop()
+        if loop.is_running():
+            self.refresh_task = asyncio.ensure_future(self.refresh())
+        else:
+            self._last_attempt = now
+            self.update_schedule()
 
 
     def extract_name(self, event):
@@ -199,6 +493,13 @@ class GoogleCalSync(object):
             self.extract_end_time(event))
 
 
+    def extract_original_start(self, event):
+        """ extract the scheduled start of a recurring event instance that
+        has been moved or cancelled """
+        return datetime.datetime.strptime(
+            str(event['originalStartTime'].get('dateTime'))[0:16], '%Y-%m-%dT%H:%M')
+
+
     def should_rerun(self, when=None):
         """ checks input data vs. last run of class to determine if a new
         round of calculations is necessary """
@@ -214,16 +515,14 @@ class GoogleCalSync(object):
 
     def sched_by_name(self, name=None):
         """ returns on/off schedule info for a specific device """
-        # Check if calandar data currently in memory is current and perform
-        # update if it is stale
-        if self.should_rerun(datetime.datetime.now()) is True:
-            self.update_schedule()
+        # Check if calandar data currently in memory is current and start
+        # a background update if it is stale
+        self.request_refresh(datetime.datetime.now())
         # Obtain schedule info for named device
         self.result_list = []
         if name is not None:
-            for sched in self.schedule:
-                if sched.name == name:
-                    self.result_list.append(copy.copy(sched))
+            for sched in self.index.by_name(name):
+                self.result_list.append(copy.copy(sched))
         # Return results to main program
         return self.result_list
 
@@ -231,16 +530,14 @@ class GoogleCalSync(object):
     def sched_by_date(self, date=None):
         """ returns on/off schedule info for all devices with assignments for
             a specific device """
-        # Check if calandar data currently in memory is current and perform
-        # update if it is stale
-        if self.should_rerun(datetime.datetime.now()) is True:
-            self.update_schedule()
+        # Check if calandar data currently in memory is current and start
+        # a background update if it is stale
+        self.request_refresh(datetime.datetime.now())
         # Obtain schedule info for devices with assignments for this date
         self.result_list = []
         if date is not None:
-            for sched in self.schedule:
-                if sched.start.date() <= date <= sched.end.date():
-                    self.result_list.append(copy.copy(sched))
+            for sched in self.index.by_date(date):
+                self.result_list.append(copy.copy(sched))
         # Return results to main program
         return self.result_list
 
@@ -248,22 +545,28 @@ class GoogleCalSync(object):
     def check_schedule(self, name=None):
         """ returns true if the device should be on, false if the device should
             be off """
-        # Rerun schedule update if data is stale
-        if self.should_rerun(datetime.datetime.now()) is True:
-            self.update_schedule()
+        # Start background schedule update if data is stale
+        now = datetime.datetime.now()
+        self.request_refresh(now)
         # Check device schedule and prior state command
         if name is not None:
-            self.newCmd = False
-            for record in self.schedule:
-                if record.name == name:
-                    if record.start <= datetime.datetime.now():
-                        if record.end >= datetime.datetime.now():
-                            self.newCmd = True
+            self.newCmd = self.index.is_active(name, now)
         # Return results to main program
         return self.newCmd
 
 
 
+    def next_transition(self, name=None):
+        """ returns the time and new state (true for on) of the next
+        scheduled state change for a device, or None if its state will
+        not change again within the current schedule """
+        now = datetime.datetime.now()
+        self.request_refresh(now)
+        if name is not None:
+            return self.index.next_transition(name, now)
+        return None
+
+
 if __name__ == '__main__':
     logging.basicConfig(stream=sys.stdout)
     log = logging.getLogger(__name__)
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+""" codec.py: Shared wire codec for service messages
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import collections
+import logging
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.tools.field_checkers import check_fields
+from bob_schedule_service.tools.field_checkers import HEADER_CHECKS
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Message Records *************************************************************
+# Every message starts with the same six header fields.  Records are plain
+# tuples, so decoding a message is a single split with no per-field
+# property calls
+HEADER_FIELDS = ('ref', 'dest_addr', 'dest_port', 'source_addr',
+                 'source_port', 'msg_type')
+MSG_TYPE_FIELD = 5
+
+# heartbeat, heartbeat_ack
+HeartbeatRecord = collections.namedtuple(
+    'HeartbeatRecord', HEADER_FIELDS)
+# get_device_scheduled_state
+DeviceStateRecord = collections.namedtuple(
+    'DeviceStateRecord', HEADER_FIELDS + ('dev_name',))
+# get_device_scheduled_state_ack
+DeviceStateAckRecord = collections.namedtuple(
+    'DeviceStateAckRecord', HEADER_FIELDS + ('dev_name', 'dev_cmd'))
+
+# Output templates, one per record length
+TEMPLATES = dict(
+    (len(record._fields), ','.join(['%s'] * len(record._fields)))
+    for record in [HeartbeatRecord, DeviceStateRecord, DeviceStateAckRecord])
+
+
+# Codec Functions *************************************************************
+def peek_msg_type(msg):
+    """ returns the message type field of a raw message without decoding
+    any other fields, or None if the message is too short """
+    if isinstance(msg, bytes):
+        msg = msg.decode()
+    fields = msg.split(',', MSG_TYPE_FIELD + 1)
+    if len(fields) <= MSG_TYPE_FIELD:
+        return None
+    return fields[MSG_TYPE_FIELD]
+
+
+def decode(msg, record_type, logger=None):
+    """ splits a raw message into the given record type.  Returns None if
+    the message has too few fields or a header field fails validation.
+    Fields past the end of the record are ignored """
+    # Configure loggers
+    logger = logger or logging.getLogger(__name__)
+
+    if isinstance(msg, bytes):
+        msg = msg.decode()
+    fields = msg.split(',')
+    size = len(record_type._fields)
+    if len(fields) < size:
+        logger.warning('Message has too few fields to decode: [%s]', msg)
+        return None
+    if check_fields(fields, HEADER_CHECKS) is not True:
+        logger.warning('Message header failed validation: [%s]', msg)
+        return None
+    return record_type._make(fields[:size])
+
+
+def encode(record):
+    """ renders a record as a raw message string """
+    return TEMPLATES[len(record)] % record
@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+""" get_service_stats.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.messages.heartbeat import HeartbeatMessage
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Message Class Definition ****************************************************
+class GetServiceStatsMessage(HeartbeatMessage):
+    """ Service statistics request message class.  Carries only the
+    standard message header """
+    __slots__ = ()
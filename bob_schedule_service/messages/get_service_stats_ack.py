@@ -0,0 +1,38 @@
+#!/usr/bin/python3
+""" get_service_stats_ack.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.messages.get_device_scheduled_states_ack import GetDeviceScheduledStatesMessageACK
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Message Class Definition ****************************************************
+class GetServiceStatsMessageACK(GetDeviceScheduledStatesMessageACK):
+    """ Service statistics response message class.  Carries a list of
+    (metric name, value) pairs, encoded as alternating fields the same way
+    as the batched device state ACK message """
+    __slots__ = ()
+
+    # statistics list field ***************************************************
+    @property
+    def stats(self):
+        return self.dev_states
+
+    @stats.setter
+    def stats(self, value):
+        self.dev_states = value
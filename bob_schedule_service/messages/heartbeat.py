@@ -10,6 +10,8 @@ if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from bob_schedule_service.tools.ipv4_help import check_ipv4
 from bob_schedule_service.tools.field_checkers import in_int_range
+from bob_schedule_service.tools.field_checkers import REF_MAX
+from bob_schedule_service.tools.field_checkers import REF_MIN
 
 
 # Authorship Info *************************************************************
@@ -26,6 +28,10 @@ __status__ = "Development"
 # Message Class Definition ****************************************************
 class HeartbeatMessage(object):
     """ Update Command message class and methods """
+    __slots__ = ('logger', '_ref', '_dest_addr', '_dest_port', '_source_addr',
+                 '_source_port', '_msg_type', '_dev_id', '_dev_processed',
+                 'temp_list')
+
     def __init__(self, logger=None, **kwargs):
         # Configure loggers
         self.logger = logger or logging.getLogger(__name__)
@@ -76,7 +82,7 @@ class HeartbeatMessage(object):
 
     @ref.setter
     def ref(self, value):
-        if in_int_range(value, 100, 999, logger=self.logger) is True:
+        if in_int_range(value, REF_MIN, REF_MAX, logger=self.logger) is True:
             self._ref = str(value)
             self.logger.debug('Ref number updated to: %s', self._ref)
         else:
@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+""" subscribe_device_scheduled_state_ack.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.messages.get_device_scheduled_state_ack import GetDeviceScheduledStateMessageACK
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Message Class Definition ****************************************************
+class SubscribeDeviceScheduledStateMessageACK(GetDeviceScheduledStateMessageACK):
+    """ Subscribe to scheduled state changes ACK message class.  Uses the
+    same fields as the get device scheduled state ACK message and carries
+    the device's current scheduled state """
+    __slots__ = ()
@@ -4,16 +4,19 @@
 
 # Im_port Required Libraries (Standard, Third Party, Local) ********************
 import asyncio
-import copy
 import logging
 import os
 import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from bob_schedule_service.messages.heartbeat import HeartbeatMessage
-from bob_schedule_service.messages.heartbeat_ack import HeartbeatMessageACK
-from bob_schedule_service.messages.get_device_scheduled_state import GetDeviceScheduledStateMessage
-from bob_schedule_service.messages.get_device_scheduled_state_ack import GetDeviceScheduledStateMessageACK
+from bob_schedule_service.messages.codec import decode
+from bob_schedule_service.messages.codec import encode
+from bob_schedule_service.messages.codec import HeartbeatRecord
+from bob_schedule_service.messages.codec import DeviceStateRecord
+from bob_schedule_service.messages.codec import DeviceStateAckRecord
+from bob_schedule_service.messages.get_device_scheduled_states_ack import GetDeviceScheduledStatesMessageACK
+from bob_schedule_service.messages.get_service_stats_ack import GetServiceStatsMessageACK
+from bob_schedule_service.messages.subscribe_device_scheduled_state_ack import SubscribeDeviceScheduledStateMessageACK
 
 
 # Authorship Info *************************************************************
@@ -37,18 +40,16 @@ def create_heartbeat_msg(logger, ref_num, destinations, source_addr, source_port
 
     # Generate a heartbeat message for each destination given
     for entry in destinations:
-        out_msg = HeartbeatMessage(
-            logger=logger,
-            ref=ref_num.new(),
-            dest_addr=entry[0],
-            dest_port=entry[1],
-            source_addr=source_addr,
-            source_port=source_port,
-            msg_type=message_types['heartbeat']
-        )
+        out_msg = encode(HeartbeatRecord(
+            ref_num.new(entry[0], entry[1]),
+            entry[0],
+            entry[1],
+            source_addr,
+            source_port,
+            message_types['heartbeat']))
         # Load message into output list
-        logger.debug('Loading completed msg: %s', out_msg.complete)
-        out_msg_list.append(copy.copy(out_msg.complete))
+        logger.debug('Loading completed msg: %s', out_msg)
+        out_msg_list.append(out_msg)
 
     # Return response message
     return out_msg_list
@@ -62,73 +63,233 @@ def process_heartbeat_msg(logger, ref_num, msg, message_types):
     # Initialize result list
     out_msg_list = []
 
-    # Map message into wemo wake-up message class
-    message = HeartbeatMessage(logger=logger)
-    message.complete = msg
+    # Decode message header
+    message = decode(msg, HeartbeatRecord, logger=logger)
+    if message is None:
+        return out_msg_list
 
     # Send response indicating query was executed
     logger.debug('Building response message header')
-    out_msg = HeartbeatMessageACK(
-        logger=logger,
-        ref=ref_num.new(),
-        dest_addr=message.source_addr,
-        dest_port=message.source_port,
-        source_addr=message.dest_addr,
-        source_port=message.dest_port,
-        msg_type=message_types['heartbeat_ack'])
+    out_msg = encode(HeartbeatRecord(
+        ref_num.new(message.source_addr, message.source_port),
+        message.source_addr,
+        message.source_port,
+        message.dest_addr,
+        message.dest_port,
+        message_types['heartbeat_ack']))
 
     # Load message into output list
-    logger.debug('Loading completed msg: [%s]', out_msg.complete)
-    out_msg_list.append(copy.copy(out_msg.complete))
+    logger.debug('Loading completed msg: [%s]', out_msg)
+    out_msg_list.append(out_msg)
 
     # Return response message
     return out_msg_list
 
 
-# Process messages type 100 ***************************************************
+# Process messages type 302 ***************************************************
 def process_get_device_scheduled_state_msg(logger, ref_num, schedule, msg, message_types):
-    """
-    """
+    """ function to look up the scheduled state of a single device """
     # Configure loggers
     logger = logger or logging.getLogger(__name__)
 
     # Initialize result list
     out_msg_list = []
 
-    # Map message into LSU message class
-    message = GetDeviceScheduledStateMessage(logger=logger)
-    message.complete = msg
+    # Decode message
+    message = decode(msg, DeviceStateRecord, logger=logger)
+    if message is None:
+        return out_msg_list
 
     # Check schedule for device
     logger.debug('Checking schedule to determine desired state of device [%s]',
                  message.dev_name)
-    desired_cmd = schedule.check_schedule(name=message.dev_name)
+    if schedule.check_schedule(name=message.dev_name) is True:
+        dev_cmd = 'on'
+    else:
+        dev_cmd = 'off'
+    logger.debug('Device [%s] should be "%s" according to schedule',
+                 message.dev_name, dev_cmd)
 
-    # Create ACK message (type 301) with desired device state per schedule
-    if desired_cmd is True:
-        logger.debug('Device [%s] should be "on" according to schedule', message.dev_name)
-        out_msg = GetDeviceScheduledStateMessageACK(
-            logger=logger,
-            ref=ref_num.new(),
-            dest_addr=message.source_addr,
-            dest_port=message.source_port,
-            source_addr=message.dest_addr,
-            source_port=message.dest_port,
-            msg_type=message_types['get_device_scheduled_state_ack'],
-            dev_name=message.dev_name,
-            dev_cmd='on')
+    # Create ACK message (type 303) with desired device state per schedule
+    out_msg = encode(DeviceStateAckRecord(
+        ref_num.new(message.source_addr, message.source_port),
+        message.source_addr,
+        message.source_port,
+        message.dest_addr,
+        message.dest_port,
+        message_types['get_device_scheduled_state_ack'],
+        message.dev_name,
+        dev_cmd))
+
+    # Load revised message into output list
+    logger.debug('Loading completed msg: %s', out_msg)
+    out_msg_list.append(out_msg)
+
+    # Return response message
+    return out_msg_list
+
+
+# Process messages type 308 ***************************************************
+def process_get_device_scheduled_states_msg(logger, ref_num, schedule, msg, message_types):
+    """ function to look up the scheduled state of a list of devices, or of
+    every device when the list is "all", and reply with a single message.
+    The reply grows with the device list and is usually longer than the
+    200 byte single read older services use, so batch queries are only
+    for peers using newline framing """
+    # Configure loggers
+    logger = logger or logging.getLogger(__name__)
+
+    # Initialize result list
+    out_msg_list = []
+
+    # Decode message header, then the device names that follow it
+    message = decode(msg, HeartbeatRecord, logger=logger)
+    if message is None:
+        return out_msg_list
+    if isinstance(msg, bytes):
+        msg = msg.decode()
+    dev_names = msg.split(',')[len(HeartbeatRecord._fields):]
+    if not dev_names or not all(dev_names):
+        logger.warning('Message has no valid device list: [%s]', msg)
+        return out_msg_list
+
+    # Check schedule for each device
+    if dev_names == ['all']:
+        dev_names = sorted(schedule.index.names())
+    dev_states = []
+    for dev_name in dev_names:
+        if schedule.check_schedule(name=dev_name) is True:
+            dev_states.append((dev_name, 'on'))
+        else:
+            dev_states.append((dev_name, 'off'))
+    logger.debug('Scheduled device states: %s', dev_states)
+
+    # Create ACK message (type 309) with desired state of every device
+    out_msg = GetDeviceScheduledStatesMessageACK(
+        logger=logger,
+        ref=ref_num.new(message.source_addr, message.source_port),
+        dest_addr=message.source_addr,
+        dest_port=message.source_port,
+        source_addr=message.dest_addr,
+        source_port=message.dest_port,
+        msg_type=message_types['get_device_scheduled_states_ack'],
+        dev_states=dev_states)
+
+    # Load revised message into output list
+    logger.debug('Loading completed msg: %s', out_msg.complete)
+    out_msg_list.append(out_msg.complete)
+
+    # Return response message
+    return out_msg_list
+
+
+# Process messages type 304 ***************************************************
+def process_subscribe_device_scheduled_state_msg(logger, ref_num, schedule, scheduler,
+                                                 msg, message_types):
+    """ function to register a subscriber for scheduled state changes and
+    reply with the current scheduled state of each subscribed device """
+    # Configure loggers
+    logger = logger or logging.getLogger(__name__)
+
+    # Initialize result list
+    out_msg_list = []
+
+    # Decode message, and only register a subscriber that can be reached
+    message = decode(msg, DeviceStateRecord, logger=logger)
+    if message is None:
+        return out_msg_list
+    if not message.dev_name:
+        logger.warning('Message has no device name: [%s]', msg)
+        return out_msg_list
+
+    # Register subscriber
+    scheduler.subscribe(message.source_addr, message.source_port, message.dev_name)
+
+    # Reply with current state of each device covered by the subscription
+    if message.dev_name == 'all':
+        dev_names = sorted(schedule.index.names())
     else:
-        logger.debug('Device [%s] should be "off" according to schedule', message.dev_name)
-        out_msg = GetDeviceScheduledStateMessageACK(
+        dev_names = [message.dev_name]
+    for dev_name in dev_names:
+        if schedule.check_schedule(name=dev_name) is True:
+            dev_cmd = 'on'
+        else:
+            dev_cmd = 'off'
+        logger.debug('Device [%s] is currently scheduled "%s"', dev_name, dev_cmd)
+        out_msg = SubscribeDeviceScheduledStateMessageACK(
             logger=logger,
-            ref=ref_num.new(),
+            ref=ref_num.new(message.source_addr, message.source_port),
             dest_addr=message.source_addr,
             dest_port=message.source_port,
             source_addr=message.dest_addr,
             source_port=message.dest_port,
-            msg_type=message_types['get_device_scheduled_state_ack'],
-            dev_name=message.dev_name,
-            dev_cmd='off')
+            msg_type=message_types['subscribe_device_scheduled_state_ack'],
+            dev_name=dev_name,
+            dev_cmd=dev_cmd)
+        logger.debug('Loading completed msg: %s', out_msg.complete)
+        out_msg_list.append(out_msg.complete)
+
+    # Return response message
+    return out_msg_list
+
+
+# Create messages type 306 ****************************************************
+def create_device_scheduled_state_change_msg(logger, ref_num, destinations, source_addr,
+                                             source_port, dev_name, dev_cmd, message_types):
+    """ function to create a scheduled state change message for each
+    subscriber given """
+    # Configure loggers
+    logger = logger or logging.getLogger(__name__)
+
+    # Initialize result list
+    out_msg_list = []
+
+    # Generate a state change message for each destination given
+    for entry in destinations:
+        out_msg = encode(DeviceStateAckRecord(
+            ref_num.new(entry[0], entry[1]),
+            entry[0],
+            entry[1],
+            source_addr,
+            source_port,
+            message_types['device_scheduled_state_change'],
+            dev_name,
+            dev_cmd))
+        # Load message into output list
+        logger.debug('Loading completed msg: %s', out_msg)
+        out_msg_list.append(out_msg)
+
+    # Return response message
+    return out_msg_list
+
+
+# Process messages type 310 ***************************************************
+def process_get_service_stats_msg(logger, ref_num, metrics, msg, message_types):
+    """ function to reply with a snapshot of the service metrics.  The
+    reply holds every metric, so it is always longer than the 200 byte
+    single read older services use and is only for peers using newline
+    framing """
+    # Configure loggers
+    logger = logger or logging.getLogger(__name__)
+
+    # Initialize result list
+    out_msg_list = []
+
+    # Decode message header
+    message = decode(msg, HeartbeatRecord, logger=logger)
+    if message is None:
+        return out_msg_list
+
+    # Create ACK message (type 311) with every metric
+    out_msg = GetServiceStatsMessageACK(
+        logger=logger,
+        ref=ref_num.new(message.source_addr, message.source_port),
+        dest_addr=message.source_addr,
+        dest_port=message.source_port,
+        source_addr=message.dest_addr,
+        source_port=message.dest_port,
+        msg_type=message_types['get_service_stats_ack'])
+    out_msg.stats = metrics.snapshot()
 
     # Load revised message into output list
     logger.debug('Loading completed msg: %s', out_msg.complete)
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+""" multi_cal.py:
+    Reads several google calendars and merges them into one schedule
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import concurrent.futures
+import datetime
+import hashlib
+import logging
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.goog_cal import GoogleCalSync
+from bob_schedule_service.schedule import SchedIndex
+from bob_schedule_service.tools.metrics import Metrics
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Helper Functions ************************************************************
+def calendar_snapshot_file(snapshot_file, cal_id):
+    """ returns the snapshot file for one calendar, named from a hash of
+    the calendar ID so reordering the ID list can't mix snapshots up """
+    if snapshot_file is None:
+        return None
+    root, ext = os.path.splitext(snapshot_file)
+    return '%s_%s%s' % (root, hashlib.md5(cal_id.encode()).hexdigest()[:8], ext)
+
+
+# Class Definitions ***********************************************************
+class MultiCalendarSync(object):
+    """ Keeps one GoogleCalSync per calendar, each with its own events,
+    sync token and refresh task, and answers lookups from a single index
+    merged from all of them.  Calendars are first read in parallel, and
+    afterwards each one refreshes on its own, so a slow or failing
+    calendar only delays its own events.  The merged index is rebuilt
+    from the already converted schedules whenever any calendar finishes
+    a refresh """
+    def __init__(self, cal_ids, credential_dir=None, client_secret=None,
+                 snapshot_file=None, logger=None, metrics=None, backends=None,
+                 max_workers=None, expand_recurring=False,
+                 recurrence_horizon=datetime.timedelta(days=7)):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+        self.metrics = metrics or Metrics(logger=self.logger)
+        self.cal_ids = list(cal_ids)
+        self.logger.debug('Configuring for calendar IDs: %s', self.cal_ids)
+        backends = backends or {}
+        self.calendars = [
+            GoogleCalSync(
+                cal_id=cal_id,
+                credential_dir=credential_dir,
+                client_secret=client_secret,
+                snapshot_file=calendar_snapshot_file(snapshot_file, cal_id),
+                logger=self.logger,
+                metrics=self.metrics,
+                backend=backends.get(cal_id),
+                initial_sync=False,
+                expand_recurring=expand_recurring,
+                recurrence_horizon=recurrence_horizon)
+            for cal_id in self.cal_ids]
+        self.metrics.gauge('calendar_events', lambda: sum(
+            len(cal.event_store) for cal in self.calendars))
+        self.schedule = []
+        self.index = SchedIndex(logger=self.logger)
+        self.result_list = []
+        self.newCmd = False
+        self.refresh_callbacks = []
+        # Read every calendar that didn't start from a snapshot
+        self.update_schedule(
+            [cal for cal in self.calendars if cal.sync_token is None],
+            max_workers=max_workers)
+        for cal in self.calendars:
+            cal.refresh_callbacks.append(self.merge)
+
+
+    def update_schedule(self, calendars=None, max_workers=None):
+        """ reads calendars in parallel worker threads, blocking until all
+        of them have finished, then rebuilds the merged index.  New
+        snapshots are swapped in from this thread, as refresh does from the
+        event loop.  A calendar that fails to read keeps its last schedule """
+        calendars = self.calendars if calendars is None else calendars
+        if calendars:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers or len(calendars)) as executor:
+                futures = dict((executor.submit(cal.fetch_schedule), cal)
+                               for cal in calendars)
+                for future in concurrent.futures.as_completed(futures):
+                    cal = futures[future]
+                    if future.exception() is not None:
+                        self.logger.error('Failed to read calendar [%s]: %r',
+                                          cal.cal_id, future.exception())
+                    elif future.result() is not None:
+                        cal.schedule, cal.index = future.result()
+        self.merge()
+
+
+    def merge(self):
+        """ rebuilds the merged schedule and index from every calendar's
+        current snapshot """
+        schedule = []
+        for cal in self.calendars:
+            schedule.extend(cal.schedule)
+        self.schedule, self.index = schedule, SchedIndex(schedule, logger=self.logger)
+        self.logger.debug('Merged [%s] schedule entries from [%s] calendars',
+                          len(schedule), len(self.calendars))
+        for callback in self.refresh_callbacks:
+            callback()
+
+
+    def request_refresh(self, when=None):
+        """ lets each calendar start its own background refresh if its
+        data is stale """
+        for cal in self.calendars:
+            cal.request_refresh(when)
+
+
+    # The lookups only use index and request_refresh, so they are shared
+    # with the single calendar class
+    sched_by_name = GoogleCalSync.sched_by_name
+    sched_by_date = GoogleCalSync.sched_by_date
+    check_schedule = GoogleCalSync.check_schedule
+    next_transition = GoogleCalSync.next_transition
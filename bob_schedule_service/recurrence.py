@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+""" recurrence.py:
+    Expands the RRULE and EXDATE lines of google calendar recurring events
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import calendar
+import datetime
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+PERIOD_DAYS = {'DAILY': 1, 'WEEKLY': 7}
+RULE_PARTS = {
+    'DAILY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST'},
+    'WEEKLY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST', 'BYDAY'},
+    'MONTHLY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST', 'BYMONTHDAY'},
+    'YEARLY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST'}}
+# Give up on rules that produce nothing for this many periods in a row
+# (eg. BYMONTHDAY=31 every 12 months starting in a short month)
+MAX_EMPTY_PERIODS = 400
+
+
+# Helper Functions ************************************************************
+def parse_ical_datetime(value):
+    """ converts an iCalendar DATE or DATE-TIME value to a naive local
+    datetime.  UTC values (ending in Z) are converted to local time, the
+    rest are taken as already being in the event's time zone """
+    value = value.strip()
+    if len(value) == 8:
+        return datetime.datetime.strptime(value, '%Y%m%d')
+    when = datetime.datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        when = when.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    return when
+
+
+def parse_recurrence(lines):
+    """ parses an event's recurrence lines into the RRULE parts and the
+    set of excluded start times.  Raises ValueError for anything that
+    can't be expanded here: RDATE, EXRULE, several RRULEs or rule parts
+    other than the common ones used by the calendar UI """
+    rule = None
+    exdates = set()
+    for line in lines:
+        name, _, value = line.partition(':')
+        name = name.split(';')[0].upper()
+        if name == 'RRULE' and rule is None:
+            rule = dict(part.split('=', 1) for part in value.upper().split(';') if part)
+        elif name == 'EXDATE':
+            exdates.update(parse_ical_datetime(x) for x in value.split(','))
+        else:
+            raise ValueError('Unsupported recurrence line: %s' % line)
+    if rule is None or rule.get('FREQ') not in RULE_PARTS:
+        raise ValueError('Unsupported recurrence: %s' % lines)
+    unsupported = set(rule) - RULE_PARTS[rule['FREQ']]
+    if unsupported:
+        raise ValueError('Unsupported recurrence rule parts: %s' % sorted(unsupported))
+    if 'BYDAY' in rule and not all(day in WEEKDAYS for day in rule['BYDAY'].split(',')):
+        raise ValueError('Unsupported recurrence BYDAY: %s' % rule['BYDAY'])
+    return rule, exdates
+
+
+def period_starts(start, rule, period):
+    """ returns the candidate start times falling in one period (day, week,
+    month or year) of a rule, where period 0 contains the first start """
+    interval = int(rule.get('INTERVAL', 1))
+    freq = rule['FREQ']
+    if freq == 'DAILY':
+        return [start + datetime.timedelta(days=period * interval)]
+    if freq == 'WEEKLY':
+        week_start = WEEKDAYS[rule.get('WKST', 'MO')]
+        first = start - datetime.timedelta(days=(start.weekday() - week_start) % 7)
+        first += datetime.timedelta(weeks=period * interval)
+        days = sorted((WEEKDAYS[day] - week_start) % 7
+                      for day in rule.get('BYDAY', '').split(',') if day) \
+            or [(start.weekday() - week_start) % 7]
+        return [first + datetime.timedelta(days=day) for day in days]
+    if freq == 'MONTHLY':
+        year, month = divmod(start.month - 1 + period * interval, 12)
+        year, month = start.year + year, month + 1
+        month_days = calendar.monthrange(year, month)[1]
+        days = sorted(
+            day if day > 0 else month_days + day + 1
+            for day in (int(x) for x in rule.get('BYMONTHDAY', str(start.day)).split(',')))
+        return [start.replace(year=year, month=month, day=day)
+                for day in days if 1 <= day <= month_days]
+    try:
+        return [start.replace(year=start.year + period * interval)]
+    except ValueError:
+        # February 29th in a year without one
+        return []
+
+
+def occurrences(start, rule, exdates=(), after=None):
+    """ generator yielding a recurring event's start times in order,
+    skipping excluded ones and any before after.  Rules without COUNT or
+    UNTIL never end, so the caller stops reading once it reaches its
+    horizon.  Daily and weekly rules without a COUNT jump straight to the
+    period holding after instead of stepping through the series history """
+    count = int(rule['COUNT']) if 'COUNT' in rule else None
+    until = parse_ical_datetime(rule['UNTIL']) if 'UNTIL' in rule else None
+    period = 0
+    if after is not None and after > start and count is None and rule['FREQ'] in PERIOD_DAYS:
+        period_days = PERIOD_DAYS[rule['FREQ']] * int(rule.get('INTERVAL', 1))
+        period = max(0, (after - start).days // period_days - 1)
+    produced = 0
+    empty_periods = 0
+    while empty_periods < MAX_EMPTY_PERIODS:
+        candidates = [x for x in period_starts(start, rule, period) if x >= start]
+        empty_periods = 0 if candidates else empty_periods + 1
+        for when in candidates:
+            if until is not None and when > until:
+                return
+            produced += 1
+            if count is not None and produced > count:
+                return
+            if when in exdates or (after is not None and when < after):
+                continue
+            yield when
+        period += 1
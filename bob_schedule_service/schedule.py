@@ -3,6 +3,7 @@
 """
 
 # Im_port Required Libraries (Standard, Third Party, Local) ********************
+import bisect
 import datetime
 import logging
 
@@ -101,4 +102,135 @@ class Sched(object):
                 datetime.datetime.now().date(),
                 value
             )
-            
\ No newline at end of file
+
+
+# Schedule Index Class Definition *********************************************
+class SchedIndex(object):
+    """ Per-device index of schedule items.  Items are grouped by device
+    name and kept sorted by start time so lookups for a single device can
+    use a bisect search instead of scanning the entire calendar """
+    def __init__(self, schedule=None, logger=None):
+        # Configure logger
+        self.logger = logger or logging.getLogger(__name__)
+
+        # Create class instance objects
+        self._records = {}
+        self._starts = {}
+        self._max_ends = {}
+        self._times = {}
+        self._states = {}
+        self._cache = {}
+
+        # Build index from input schedule if present
+        if schedule is not None:
+            self.build(schedule)
+
+    def build(self, schedule):
+        """ (re)builds the index from a list of Sched objects """
+        self._records = {}
+        self._starts = {}
+        self._max_ends = {}
+        self._times = {}
+        self._states = {}
+        self._cache = {}
+        for record in schedule:
+            self._records.setdefault(record.name, []).append(record)
+        for name, records in self._records.items():
+            records.sort(key=lambda x: x.start)
+            self._starts[name] = [record.start for record in records]
+            # Running maximum of end times.  This is non-decreasing, so it
+            # can be bisected to skip every record that ends before a
+            # given point in time, even when records overlap
+            self._max_ends[name] = []
+            max_end = None
+            for record in records:
+                if max_end is None or record.end > max_end:
+                    max_end = record.end
+                self._max_ends[name].append(max_end)
+            self.build_timeline(name, records)
+        self.logger.debug('Schedule index built for [%s] devices',
+                          len(self._records))
+
+    def build_timeline(self, name, records):
+        """ builds the list of state transitions for a device.  Overlapping
+        and touching items are merged, then each merged period adds an
+        "on" transition at its start and an "off" transition just after
+        its end (end times are inclusive) """
+        times = []
+        states = []
+        for record in records:
+            off = record.end + datetime.timedelta(microseconds=1)
+            if times and record.start <= times[-1]:
+                # Extends the current "on" period
+                if off > times[-1]:
+                    times[-1] = off
+            else:
+                times.extend([record.start, off])
+                states.extend([True, False])
+        self._times[name] = times
+        self._states[name] = states
+
+    def names(self):
+        """ returns the names of all devices present in the index """
+        return list(self._records.keys())
+
+    def by_name(self, name):
+        """ returns all schedule items for a specific device, sorted by
+        start time """
+        return list(self._records.get(name, []))
+
+    def by_window(self, name, window_start, window_end):
+        """ returns schedule items for a device that overlap the period
+        starting at window_start (inclusive) and ending before
+        window_end """
+        records = self._records.get(name)
+        if not records:
+            return []
+        first = bisect.bisect_left(self._max_ends[name], window_start)
+        last = bisect.bisect_left(self._starts[name], window_end)
+        return [record for record in records[first:last]
+                if record.end >= window_start]
+
+    def by_date(self, date):
+        """ returns schedule items for all devices with assignments on a
+        specific date, sorted by start time """
+        window_start = datetime.datetime.combine(date, datetime.time.min)
+        window_end = window_start + datetime.timedelta(days=1)
+        result = []
+        for name in self._records:
+            result.extend(self.by_window(name, window_start, window_end))
+        result.sort(key=lambda x: x.start)
+        return result
+
+    def state_at(self, name, when):
+        """ returns the scheduled state of a device at a point in time along
+        with the time that state ends (None if it never changes again).
+        The answer is cached per device, so repeat lookups inside the same
+        period are a single comparison """
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] <= when and \
+                (cached[1] is None or when < cached[1]):
+            return cached[2], cached[1]
+        times = self._times.get(name)
+        if not times:
+            return False, None
+        i = bisect.bisect_right(times, when)
+        valid_from = times[i - 1] if i > 0 else datetime.datetime.min
+        valid_until = times[i] if i < len(times) else None
+        state = self._states[name][i - 1] if i > 0 else False
+        self._cache[name] = (valid_from, valid_until, state)
+        return state, valid_until
+
+    def next_transition(self, name, when):
+        """ returns the time and new state of the next scheduled state
+        change for a device after a point in time, or None if there are no
+        further changes """
+        state, valid_until = self.state_at(name, when)
+        if valid_until is None:
+            return None
+        return valid_until, not state
+
+    def is_active(self, name, when):
+        """ returns true if any schedule item for a device covers the
+        given point in time """
+        return self.state_at(name, when)[0]
@@ -5,15 +5,21 @@
 # Import Required Libraries (Standard, Third Party, Local) ********************
 import asyncio
 import copy
-import datetime
 import logging
 import os
 import sys
+import time
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.messages.codec import peek_msg_type
 from bob_schedule_service.msg_processing import create_heartbeat_msg
 from bob_schedule_service.msg_processing import process_heartbeat_msg
 from bob_schedule_service.msg_processing import process_get_device_scheduled_state_msg
+from bob_schedule_service.msg_processing import process_get_device_scheduled_states_msg
+from bob_schedule_service.msg_processing import process_subscribe_device_scheduled_state_msg
+from bob_schedule_service.msg_processing import process_get_service_stats_msg
+from bob_schedule_service.tools.log_sampling import SampledLogger
+from bob_schedule_service.tools.metrics import Metrics
 
 
 # Authorship Info *************************************************************
@@ -38,16 +44,14 @@ class MainTask(object):
         self.msg_in_queue = None
         self.msg_out_queue = None
         self.schedule = []
+        self.scheduler = None
+        self.metrics = None
         self.service_addresses = []
         self.message_types = []
-        self.last_check_hb = datetime.datetime.now()
-        self.sleep_time = 0.2
+        self.hb_interval = 60
         self.out_msg = str()
         self.out_msg_list = []
         self.next_msg = str()
-        self.next_msg_split = []
-        self.msg_source_addr = str()
-        self.msg_source_port = str()
         self.msg_type = str()
         self.destinations = []
 
@@ -62,6 +66,14 @@ class MainTask(object):
                     self.schedule = value
                     self.logger.debug('Schedule set during __init__ '
                                       'to: %s', self.schedule)
+                if key == "scheduler":
+                    self.scheduler = value
+                    self.logger.debug('Transition scheduler set during __init__ '
+                                      'to: %s', self.scheduler)
+                if key == "metrics":
+                    self.metrics = value
+                    self.logger.debug('Metrics registry set during __init__ '
+                                      'to: %s', self.metrics)
                 if key == "msg_in_queue":
                     self.msg_in_queue = value
                     self.logger.debug('Message in queue set during __init__ '
@@ -79,6 +91,119 @@ class MainTask(object):
                     self.logger.debug('Message type list set during __init__ '
                                       'to: %s', self.message_types)
 
+        # Register metrics
+        self.metrics = self.metrics or Metrics(logger=self.logger)
+        self.metrics.describe('messages_processed_total', 'counter',
+                              'Messages handled by the main task, by type')
+        self.metrics.describe('message_handling_seconds', 'histogram',
+                              'Time to handle a message, by type')
+        self.metrics.describe('message_errors_total', 'counter',
+                              'Messages whose handler raised an error')
+
+
+    def process_msg(self, msg):
+        """ routes a single incoming message to its handler and queues any
+        resulting response messages """
+        # Initialize result list
+        start = time.perf_counter()
+        self.out_msg_list = []
+        self.next_msg = msg
+        self.logger.debug('Message pulled from queue: [%s]', self.next_msg)
+
+        # Determine message type without decoding the rest of the message
+        self.msg_type = peek_msg_type(self.next_msg)
+        # Unknown types share one label so bad messages can't grow the
+        # metrics or the logging totals without bound
+        label = self.msg_type
+        if label not in self.message_types.values():
+            label = 'other'
+        if isinstance(self.logger, SampledLogger):
+            self.logger.msg_type = label
+        self.logger.debug('Message Type: %s', self.msg_type)
+
+        # Service Check (heartbeat)
+        if self.msg_type == self.message_types['heartbeat']:
+            self.logger.debug('Message is a heartbeat')
+            self.out_msg_list = process_heartbeat_msg(
+                self.logger,
+                self.ref_num,
+                self.next_msg,
+                self.message_types)
+
+        # Device scheduled command checks
+        if self.msg_type == self.message_types['get_device_scheduled_state']:
+            self.logger.debug('Message is a get device scheduled state message')
+            self.out_msg_list = process_get_device_scheduled_state_msg(
+                self.logger,
+                self.ref_num,
+                self.schedule,
+                self.next_msg,
+                self.message_types)
+
+        # Batched device scheduled command checks
+        if self.msg_type == self.message_types['get_device_scheduled_states']:
+            self.logger.debug('Message is a get device scheduled states message')
+            self.out_msg_list = process_get_device_scheduled_states_msg(
+                self.logger,
+                self.ref_num,
+                self.schedule,
+                self.next_msg,
+                self.message_types)
+
+        # Scheduled state change subscriptions
+        if self.msg_type == self.message_types['subscribe_device_scheduled_state']:
+            self.logger.debug('Message is a subscribe device scheduled state message')
+            self.out_msg_list = process_subscribe_device_scheduled_state_msg(
+                self.logger,
+                self.ref_num,
+                self.schedule,
+                self.scheduler,
+                self.next_msg,
+                self.message_types)
+
+        # Service statistics
+        if self.msg_type == self.message_types['get_service_stats']:
+            self.logger.debug('Message is a get service stats message')
+            self.out_msg_list = process_get_service_stats_msg(
+                self.logger,
+                self.ref_num,
+                self.metrics,
+                self.next_msg,
+                self.message_types)
+
+        # Que up response messages in outgoing msg que
+        self.queue_out_msgs()
+        if isinstance(self.logger, SampledLogger):
+            self.logger.msg_type = None
+
+        # Record handling time
+        self.metrics.observe('message_handling_seconds',
+                             time.perf_counter() - start, msg_type=label)
+        self.metrics.inc('messages_processed_total', msg_type=label)
+
+
+    def handle_msg(self, msg):
+        """ processes a single incoming message, logging any error raised
+        by its handler so one bad message can't stop the main task """
+        try:
+            self.process_msg(msg)
+        except Exception:
+            self.logger.exception('Failed to process message [%s]', msg)
+            self.metrics.inc('message_errors_total')
+            if isinstance(self.logger, SampledLogger):
+                self.logger.msg_type = None
+
+
+    def queue_out_msgs(self):
+        """ copies the current list of response messages into the outgoing
+        message queue """
+        if len(self.out_msg_list) > 0:
+            self.logger.debug('Queueing response message(s)')
+            for self.out_msg in self.out_msg_list:
+                self.msg_out_queue.put_nowait(copy.copy(self.out_msg))
+                self.logger.debug('Response message [%s] successfully queued',
+                                  self.out_msg)
+
 
     @asyncio.coroutine
     def run(self):
@@ -86,81 +211,51 @@ class MainTask(object):
         self.logger.info('Starting schedule service main task')
 
         while True:
-            # Initialize result list
-            self.out_msg_list = []
-            self.sleep_time = 0.2
-
             # INCOMING MESSAGE HANDLING
-            if self.msg_in_queue.qsize() > 0:
-                self.sleep_time = 0.01
+            # Sleep until a message arrives, then drain everything else that
+            # was queued up while waiting before going back to sleep
+            self.logger.debug('Waiting for incoming message')
+            self.next_msg = yield from self.msg_in_queue.get()
+            self.handle_msg(self.next_msg)
+            while not self.msg_in_queue.empty():
                 self.logger.debug('Getting Incoming message from queue')
-                self.next_msg = self.msg_in_queue.get_nowait()
-                self.logger.debug('Message pulled from queue: [%s]', self.next_msg)
-
-                # Determine message type
-                self.next_msg_split = self.next_msg.split(',')
-                if len(self.next_msg_split) >= 6:
-                    self.logger.debug('Extracting source address and message type')
-                    self.msg_source_addr = self.next_msg_split[3]
-                    self.msg_source_port = self.next_msg_split[4]
-                    self.msg_type = self.next_msg_split[5]
-                    self.logger.debug('Source Address: %s', self.msg_source_addr)
-                    self.logger.debug('Source Port: %s', self.msg_source_addr)
-                    self.logger.debug('Message Type: %s', self.msg_type)
-
-                # Service Check (heartbeat)
-                if self.msg_type == self.message_types['heartbeat']:
-                    self.logger.debug('Message is a heartbeat')
-                    self.out_msg_list = process_heartbeat_msg(
-                        self.logger,
-                        self.ref_num,
-                        self.next_msg,
-                        self.message_types)
-
-                # Device scheduled command checks
-                if self.msg_type == self.message_types['get_device_scheduled_state']:
-                    self.logger.debug('Message is a get device scheduled state message')
-                    self.out_msg_list = process_get_device_scheduled_state_msg(
-                        self.logger,
-                        self.ref_num,
-                        self.schedule,
-                        self.next_msg,
-                        self.message_types)
-
-                # Que up response messages in outgoing msg que
-                if len(self.out_msg_list) > 0:
-                    self.logger.debug('Queueing response message(s)')
-                    for self.out_msg in self.out_msg_list:
-                        self.msg_out_queue.put_nowait(copy.copy(self.out_msg))
-                        self.logger.debug('Response message [%s] successfully queued',
-                                          self.out_msg)                        
+                self.handle_msg(self.msg_in_queue.get_nowait())
 
 
+    @asyncio.coroutine
+    def heartbeat(self):
+        """ task to periodically send heartbeats to other services """
+        self.logger.info('Starting schedule service heartbeat task')
+
+        while True:
             # PERIODIC TASKS
-            # Periodically send heartbeats to other services
-            if datetime.datetime.now() >= (self.last_check_hb + datetime.timedelta(seconds=60)):
-                self.destinations = [
-                    (self.service_addresses['automation_addr'],
-                     self.service_addresses['automation_port'])
-                ]
-                self.out_msg_list = create_heartbeat_msg(
-                    self.logger,
-                    self.ref_num,
-                    self.destinations,
-                    self.service_addresses['schedule_addr'],
-                    self.service_addresses['schedule_port'],
-                    self.message_types)
-
-                # Que up response messages in outgoing msg que
-                if len(self.out_msg_list) > 0:
-                    self.logger.debug('Queueing response message(s)')
-                    for self.out_msg in self.out_msg_list:
-                        self.msg_out_queue.put_nowait(copy.copy(self.out_msg))
-                        self.logger.debug('Response message [%s] successfully queued',
-                                          self.out_msg)
-
-                # Update last-check
-                self.last_check_hb = datetime.datetime.now()
-
-            # Yield to other tasks for a while
-            yield from asyncio.sleep(self.sleep_time)
+            yield from asyncio.sleep(self.hb_interval)
+            self.destinations = [
+                (self.service_addresses['automation_addr'],
+                 self.service_addresses['automation_port'])
+            ]
+            self.out_msg_list = create_heartbeat_msg(
+                self.logger,
+                self.ref_num,
+                self.destinations,
+                self.service_addresses['schedule_addr'],
+                self.service_addresses['schedule_port'],
+                self.message_types)
+
+            # Que up response messages in outgoing msg que
+            self.queue_out_msgs()
+
+            # Report time spent logging since the last heartbeat
+            if isinstance(self.logger, SampledLogger):
+                self.logger.report()
+
+
+    @asyncio.coroutine
+    def report_logging(self):
+        """ task to periodically report time spent logging in processes
+        that don't run the heartbeat task (workers), so their totals are
+        reported and reset too """
+        while True:
+            yield from asyncio.sleep(self.hb_interval)
+            if isinstance(self.logger, SampledLogger):
+                self.logger.report()
@@ -6,13 +6,20 @@
 import asyncio
 from contextlib import suppress
 import os
+import signal
 import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from bob_schedule_service.configure import ConfigureService
 from bob_schedule_service.service_main import MainTask
+from bob_schedule_service.transitions import TransitionScheduler
 from bob_schedule_service.tools.ref_num import RefNum
 from bob_schedule_service.tools.message_handlers import MessageHandler
+from bob_schedule_service.tools.metrics import Metrics
+from bob_schedule_service.workers import report_metrics
+from bob_schedule_service.workers import SharedSchedule
+from bob_schedule_service.workers import SubscriptionForwarder
+from bob_schedule_service.workers import WorkerPool
 
 
 
@@ -30,85 +37,270 @@ __status__ = "Development"
 # Application wide objects ****************************************************
 parent_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 config_file = os.path.join(parent_path, 'config.ini')
-print("\n\nUsing Config file:\n" + config_file + "\n\n")
-SERVICE_CONFIG = ConfigureService(config_file)
-LOGGER = SERVICE_CONFIG.get_logger()
-SERVICE_ADDRESSES = SERVICE_CONFIG.get_servers()
-MESSAGE_TYPES = SERVICE_CONFIG.get_message_types()
-CREDENTIALS = SERVICE_CONFIG.get_credentials()
-SCHEDULE = SERVICE_CONFIG.get_schedule()
-
-REF_NUM = RefNum(logger=LOGGER)
-LOOP = asyncio.get_event_loop()
-COMM_HANDLER = MessageHandler(LOOP, logger=LOGGER)
-MAINTASK = MainTask(
-    logger=LOGGER,
-    ref=REF_NUM,
-    schedule=SCHEDULE,
-    msg_in_queue=COMM_HANDLER.msg_in_queue,
-    msg_out_queue=COMM_HANDLER.msg_out_queue,
-    service_addresses=SERVICE_ADDRESSES,
-    message_types=MESSAGE_TYPES
-)
+
+
+# Service Setup ***************************************************************
+def create_service(loop, logger, schedule, service_addresses, message_types,
+                   hot_logger=None, metrics=None, ref_settings=None,
+                   delivery_settings=None):
+    """ creates the message handler, transition scheduler and main task that
+    make up the service.  ref_settings are passed on to RefNum and
+    delivery_settings to the MessageHandler """
+    hot_logger = hot_logger or logger
+    metrics = metrics or Metrics(logger=logger)
+    ref_num = RefNum(logger=hot_logger, **(ref_settings or {}))
+    comm_handler = MessageHandler(loop, logger=logger, metrics=metrics,
+                                  outstanding=ref_num.outstanding,
+                                  **(delivery_settings or {}))
+    scheduler = TransitionScheduler(
+        logger=logger,
+        ref=ref_num,
+        schedule=schedule,
+        msg_out_queue=comm_handler.msg_out_queue,
+        service_addresses=service_addresses,
+        message_types=message_types
+    )
+    maintask = MainTask(
+        logger=hot_logger,
+        ref=ref_num,
+        schedule=schedule,
+        scheduler=scheduler,
+        metrics=metrics,
+        msg_in_queue=comm_handler.msg_in_queue,
+        msg_out_queue=comm_handler.msg_out_queue,
+        service_addresses=service_addresses,
+        message_types=message_types
+    )
+    return comm_handler, scheduler, maintask
+
+
+def start_tasks(loop, logger, comm_handler, scheduler, maintask, service_addresses,
+                serve=True, coordinate=True, reuse_port=False):
+    """ starts the incoming message server and schedules every service task.
+    In multi-process mode worker processes only serve requests (with
+    reuse_port set, so they can share the port) and the coordinator only
+    runs the heartbeat and transition tasks.  Returns the server, or None
+    if not serving """
+    msg_in_server = None
+    if serve:
+        # Create incoming message server
+        logger.debug('Creating incoming message listening server at [%s:%s]',
+                     service_addresses['schedule_addr'],
+                     service_addresses['schedule_port'])
+        msg_in_server = loop.run_until_complete(asyncio.start_server(
+            comm_handler.handle_msg_in,
+            host=service_addresses['schedule_addr'],
+            port=int(service_addresses['schedule_port']),
+            reuse_port=reuse_port,
+            loop=loop))
+
+        # Create main task for this service
+        logger.debug('Scheduling main task for execution')
+        asyncio.ensure_future(maintask.run(), loop=loop)
+
+    if coordinate:
+        # Create periodic heartbeat task
+        logger.debug('Scheduling heartbeat task for execution')
+        asyncio.ensure_future(maintask.heartbeat(), loop=loop)
+
+        # Create scheduled state change notification task
+        logger.debug('Scheduling transition task for execution')
+        asyncio.ensure_future(scheduler.run(), loop=loop)
+    else:
+        # Heartbeats are left to the coordinator, so report logging time
+        # on a timer of our own
+        logger.debug('Scheduling logging report task for execution')
+        asyncio.ensure_future(maintask.report_logging(), loop=loop)
+
+    # Create outgoing message task
+    logger.debug('Scheduling outgoing message task for execution')
+    asyncio.ensure_future(comm_handler.handle_msg_out(), loop=loop)
+
+    # Create idle outgoing connection eviction task
+    logger.debug('Scheduling connection pool eviction task for execution')
+    asyncio.ensure_future(comm_handler.pool.run(), loop=loop)
+
+    # Create unacknowledged message expiry task
+    logger.debug('Scheduling ACK expiry task for execution')
+    asyncio.ensure_future(comm_handler.handle_ack_expiry(), loop=loop)
+    return msg_in_server
+
+
+def start_metrics_server(loop, logger, metrics, service_addresses):
+    """ starts the local Prometheus text endpoint if a metrics port is
+    configured.  Returns the server, or None """
+    if 'schedule_metrics_port' not in service_addresses:
+        return None
+    logger.debug('Creating metrics endpoint at [127.0.0.1:%s]',
+                 service_addresses['schedule_metrics_port'])
+    return loop.run_until_complete(asyncio.start_server(
+        metrics.handle_http,
+        host='127.0.0.1',
+        port=int(service_addresses['schedule_metrics_port']),
+        loop=loop))
+
+
+def stop_tasks(loop, logger, msg_in_server, comm_handler):
+    """ closes the incoming message server and pooled connections, then
+    cancels every running task """
+    if msg_in_server is not None:
+        logger.info('Shutting down incoming message server')
+        msg_in_server.close()
+    comm_handler.pool.close()
+    logger.info('Finding all running tasks to shut down')
+    pending = asyncio.Task.all_tasks(loop=loop)
+    logger.info('[%s] Task still running.  Closing them now', str(len(pending)))
+    for i, task in enumerate(pending):
+        with suppress(asyncio.CancelledError):
+            logger.info('Waiting for task [%s] to shut down', i)
+            task.cancel()
+            loop.run_until_complete(task)
+    logger.info('Shutdown complete.  Terminating execution LOOP')
+
+
+def run_worker(worker_num, sock, entries, logger, service_addresses, message_types,
+               hot_logger=None, ref_settings=None, delivery_settings=None):
+    """ runs one worker process of the multi-process mode: serves requests
+    on the shared port from the schedule the coordinator sends over sock,
+    until the coordinator stops it """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    logger.info('Worker [%s] starting in process [%s]', worker_num, os.getpid())
+    schedule = SharedSchedule(entries, logger=logger)
+    reader, writer = loop.run_until_complete(asyncio.open_connection(sock=sock, loop=loop))
+    metrics = Metrics(logger=logger)
+    comm_handler, scheduler, maintask = create_service(
+        loop, logger, schedule, service_addresses, message_types,
+        hot_logger=hot_logger, metrics=metrics, ref_settings=ref_settings,
+        delivery_settings=delivery_settings)
+    # Subscriptions are held by the coordinator, which sends the state
+    # change notifications
+    maintask.scheduler = SubscriptionForwarder(writer, logger=logger)
+    msg_in_server = start_tasks(
+        loop, logger, comm_handler, scheduler, maintask, service_addresses,
+        coordinate=False, reuse_port=True)
+    asyncio.ensure_future(schedule.follow(reader), loop=loop)
+    # The coordinator serves the metrics endpoint with every worker's
+    # metrics merged in
+    asyncio.ensure_future(report_metrics(writer, metrics), loop=loop)
+    loop.add_signal_handler(signal.SIGTERM, schedule.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_tasks(loop, logger, msg_in_server, comm_handler)
+        loop.close()
+
+
+def worker_ref_settings(ref_settings, offset, count):
+    """ returns the ref settings for one process of the multi-process
+    mode.  The coordinator (offset 0) and each of the count workers number
+    messages from the same address, so each takes every (count + 1)th ref
+    and their refs can't collide at a peer """
+    return dict(ref_settings or {}, offset=offset, step=count + 1)
+
+
+def start_workers(logger, schedule, service_addresses, message_types, count,
+                  hot_logger=None, service_config=None, ref_settings=None,
+                  delivery_settings=None, metrics=None):
+    """ forks count worker processes sharing the schedule port.  Has to
+    run before the coordinator creates its event loop.  Returns the
+    worker pool, which is connected to the coordinator's loop later """
+    def worker_main(worker_num, sock, entries):
+        if service_config is not None:
+            service_config.restart_log_listener()
+        run_worker(worker_num, sock, entries, logger, service_addresses,
+                   message_types, hot_logger=hot_logger,
+                   ref_settings=worker_ref_settings(ref_settings, worker_num + 1, count),
+                   delivery_settings=delivery_settings)
+    pool = WorkerPool(schedule, count=count, metrics=metrics, logger=logger)
+    pool.start(worker_main,
+               worker_exit=service_config.close_logger if service_config else None)
+    return pool
 
 
 # Main ************************************************************************
 def main():
     """ Main application routine """
+    print("\n\nUsing Config file:\n" + config_file + "\n\n")
+    service_config = ConfigureService(config_file)
+    logger = service_config.get_logger()
+    hot_logger = service_config.get_hot_path_logger()
+    service_addresses = service_config.get_servers()
+    message_types = service_config.get_message_types()
+    service_config.get_credentials()
+    service_config.set_event_loop_policy()
+    ref_settings = service_config.get_ref_settings()
+    delivery_settings = service_config.get_delivery_settings()
+    metrics = Metrics(logger=logger)
+    schedule = service_config.get_schedule(metrics=metrics)
 
-    LOGGER.debug('Starting main()')
+    # Fork worker processes before this process's event loop exists.  This
+    # process then coordinates: it refreshes the calendar and sends the
+    # heartbeats and state change notifications, while workers serve
+    # requests
+    worker_count = service_config.get_worker_count()
+    workers = None
+    if worker_count > 0:
+        logger.info('Starting [%s] worker processes', worker_count)
+        workers = start_workers(
+            logger, schedule, service_addresses, message_types, worker_count,
+            hot_logger=hot_logger, service_config=service_config,
+            ref_settings=ref_settings, delivery_settings=delivery_settings,
+            metrics=metrics)
+        ref_settings = worker_ref_settings(ref_settings, 0, worker_count)
+    loop = asyncio.get_event_loop()
 
-    # Create incoming message server
+    logger.debug('Starting main()')
+    comm_handler, scheduler, maintask = create_service(
+        loop, logger, schedule, service_addresses, message_types,
+        hot_logger=hot_logger, metrics=metrics, ref_settings=ref_settings,
+        delivery_settings=delivery_settings)
+    if workers is not None:
+        workers.scheduler = scheduler
+        workers.connect(loop)
+
+    # Create incoming message server and service tasks
     try:
-        LOGGER.debug('Creating incoming message listening server at [%s:%s]',
-                     SERVICE_ADDRESSES['schedule_addr'],
-                     SERVICE_ADDRESSES['schedule_port'])
-        msg_in_server = asyncio.start_server(
-            COMM_HANDLER.handle_msg_in,
-            host=SERVICE_ADDRESSES['schedule_addr'],
-            port=int(SERVICE_ADDRESSES['schedule_port']))
-        LOGGER.debug('Wrapping servier in future task and scheduling for '
-                     'execution')
-        msg_in_task = LOOP.run_until_complete(msg_in_server)
+        msg_in_server = start_tasks(
+            loop, logger, comm_handler, scheduler, maintask, service_addresses,
+            serve=workers is None)
     except Exception:
-        LOGGER.debug('Failed to create socket listening connection at %s:%s',
-                     SERVICE_ADDRESSES['schedule_addr'],
-                     SERVICE_ADDRESSES['schedule_port'])
+        logger.debug('Failed to create socket listening connection at %s:%s',
+                     service_addresses['schedule_addr'],
+                     service_addresses['schedule_port'])
         sys.exit()
 
-    # Create main task for this service
-    LOGGER.debug('Scheduling main task for execution')
-    asyncio.ensure_future(MAINTASK.run())
-
-    # Create outgoing message task
-    LOGGER.debug('Scheduling outgoing message task for execution')
-    asyncio.ensure_future(COMM_HANDLER.handle_msg_out())
+    # Create local metrics endpoint
+    try:
+        metrics_server = start_metrics_server(loop, logger, metrics, service_addresses)
+    except OSError:
+        logger.warning('Failed to create metrics endpoint at 127.0.0.1:%s',
+                       service_addresses['schedule_metrics_port'])
+        metrics_server = None
 
     # Serve requests until Ctrl+C is pressed
-    LOGGER.info('Schedule Service')
-    LOGGER.info('Serving on {}'.format(msg_in_task.sockets[0].getsockname()))
-    LOGGER.info('Press CTRL+C to exit')
+    logger.info('Schedule Service')
+    if msg_in_server is not None:
+        logger.info('Serving on {}'.format(msg_in_server.sockets[0].getsockname()))
+    logger.info('Press CTRL+C to exit')
     try:
-        LOOP.run_forever()
+        loop.run_forever()
     except asyncio.CancelledError:
-        LOGGER.info('All tasks have been cancelled')
+        logger.info('All tasks have been cancelled')
     except KeyboardInterrupt:
         pass
     finally:
-        LOGGER.info('Shutting down incoming message server')
-        msg_in_server.close()
-        LOGGER.info('Finding all running tasks to shut down')
-        pending = asyncio.Task.all_tasks()
-        LOGGER.info('[%s] Task still running.  Closing them now', str(len(pending)))
-        for i, task in enumerate(pending):
-            with suppress(asyncio.CancelledError):
-                LOGGER.info('Waiting for task [%s] to shut down', i)
-                task.cancel()
-                LOOP.run_until_complete(task)
-        LOGGER.info('Shutdown complete.  Terminating execution LOOP')
+        if metrics_server is not None:
+            metrics_server.close()
+        if workers is not None:
+            workers.stop()
+        stop_tasks(loop, logger, msg_in_server, comm_handler)
+        service_config.close_logger()
 
     # Terminate the execution LOOP
-    LOOP.close()
+    loop.close()
 
 
 # Call Main *******************************************************************
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+""" conn_pool.py: Outgoing connection pool
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import logging
+import time
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Pooled Connection Class Def *************************************************
+class PooledConnection(object):
+    """ reader/writer pair for a single outgoing socket connection """
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+        self.last_used = time.monotonic()
+
+    def is_healthy(self):
+        """ returns false once the peer has closed its end of the
+        connection or the local transport is shutting down """
+        if self.reader.at_eof():
+            return False
+        if self.reader.exception() is not None:
+            return False
+        if self.writer.transport.is_closing():
+            return False
+        return True
+
+    def close(self):
+        self.writer.close()
+
+
+# Connection Pool Class Def ***************************************************
+class ConnectionPool(object):
+    """ Keeps idle outgoing connections open, keyed by (addr, port), so
+    messages to the same destination can skip the TCP handshake.  Peers
+    that close the socket after each message simply never get their
+    connection returned to the pool """
+    def __init__(self, loop, logger=None, idle_timeout=30.0, max_idle=2):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.loop = loop
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._idle = {}
+
+    @asyncio.coroutine
+    def acquire(self, addr, port):
+        """ returns a healthy idle connection to the destination if one is
+        available, otherwise opens a new one """
+        key = (addr, int(port))
+        idle = self._idle.get(key, [])
+        while idle:
+            conn = idle.pop()
+            if conn.is_healthy() and \
+                    time.monotonic() - conn.last_used < self.idle_timeout:
+                self.logger.debug('Reusing pooled connection to %s:%s', addr, port)
+                conn.reused = True
+                return conn
+            self.logger.debug('Dropping stale pooled connection to %s:%s',
+                              addr, port)
+            conn.close()
+        self.logger.debug('Opening outgoing connection to %s:%s', addr, port)
+        reader, writer = yield from asyncio.open_connection(
+            key[0], key[1], loop=self.loop)
+        return PooledConnection(key, reader, writer)
+
+    def release(self, conn):
+        """ returns a connection to the pool once a message exchange has
+        completed, or closes it if it can't be reused """
+        conn.last_used = time.monotonic()
+        idle = self._idle.setdefault(conn.key, [])
+        if conn.is_healthy() and len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def discard(self, conn):
+        """ closes a connection that failed and must not be reused """
+        self.logger.debug('Discarding connection to %s:%s', *conn.key)
+        conn.close()
+
+    def evict_idle(self):
+        """ closes every pooled connection that has been idle too long or
+        was closed by its peer """
+        now = time.monotonic()
+        for key, idle in self._idle.items():
+            keep = []
+            for conn in idle:
+                if conn.is_healthy() and now - conn.last_used < self.idle_timeout:
+                    keep.append(conn)
+                else:
+                    self.logger.debug('Evicting idle connection to %s:%s', *key)
+                    conn.close()
+            self._idle[key] = keep
+
+    def close(self):
+        """ closes every pooled connection """
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle = {}
+
+    @asyncio.coroutine
+    def run(self):
+        """ task to periodically evict idle connections """
+        while True:
+            yield from asyncio.sleep(self.idle_timeout / 2)
+            self.evict_idle()
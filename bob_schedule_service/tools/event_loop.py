@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+""" event_loop.py: Optional event loop policies (eg. uvloop)
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import importlib
+import logging
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+DEFAULT_LOOP = 'asyncio'
+# Short names for known loop policies.  Anything else is taken as
+# "module:PolicyClass" or "module.PolicyClass"
+LOOP_POLICIES = {
+    'uvloop': 'uvloop:EventLoopPolicy'}
+
+
+# Helper Functions ************************************************************
+def load_loop_policy(name, logger=None):
+    """ returns a new instance of the named event loop policy, or None for
+    the standard asyncio loop.  A policy that can't be imported (eg. uvloop
+    isn't installed) is logged and None is returned, so the service still
+    starts on the standard loop """
+    logger = logger or logging.getLogger(__name__)
+    if not name or name == DEFAULT_LOOP:
+        return None
+    path = LOOP_POLICIES.get(name, name)
+    module_name, _, class_name = path.partition(':')
+    if not class_name:
+        module_name, _, class_name = path.rpartition('.')
+    try:
+        policy_class = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError, ValueError) as exc:
+        logger.warning('Event loop [%s] is not available (%s), using the %s loop',
+                       name, exc, DEFAULT_LOOP)
+        return None
+    return policy_class()
+
+
+def install_loop_policy(name, logger=None):
+    """ makes the named loop the one returned by asyncio.get_event_loop()
+    and new_event_loop().  Must be called before any loop is created.
+    Returns the name of the loop actually in use """
+    logger = logger or logging.getLogger(__name__)
+    policy = load_loop_policy(name, logger=logger)
+    asyncio.set_event_loop_policy(policy)
+    loop_name = DEFAULT_LOOP if policy is None else name
+    logger.info('Using [%s] event loop', loop_name)
+    return loop_name
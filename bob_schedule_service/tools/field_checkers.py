@@ -11,6 +11,7 @@ import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from bob_schedule_service.tools.ipv4_help import check_ipv4
+from bob_schedule_service.tools.ipv4_help import is_ipv4
 
 
 # Authorship Info *************************************************************
@@ -30,6 +31,25 @@ DATETIME_REGEX = r'\b([0-9][0-9][0-9][0-9])-((0[0-9])|(1[0-2]))-(([0-2][0-9])|(3
                  r' (([0-1][0-9])|(2[0-3])):([0-5][0-9]):([0-5][0-9])(\.\d{1,6})?'
 
 
+# Combined pattern used to classify a string in a single match
+DATETIME_FORMATS = re.compile(
+    r'(?P<date>' + DATE_REGEX + r')|'
+    r'(?P<time>' + TIME_REGEX + r')|'
+    r'(?P<datetime>' + DATETIME_REGEX + r')')
+
+# Integer limits for the standard message header fields.  Refs are three
+# digits unless wide refs are configured; up to nine digits are accepted so
+# messages from services using wide refs still validate
+REF_MIN = 100
+REF_MAX = 999999999
+REF_RANGE = range(REF_MIN, REF_MAX + 1)
+PORT_RANGE = range(10000, 60001)
+MSG_TYPE_RANGE = range(100, 1000)
+IPV4_FIELD = 'ipv4'
+HEADER_CHECKS = (REF_RANGE, IPV4_FIELD, PORT_RANGE, IPV4_FIELD, PORT_RANGE,
+                 MSG_TYPE_RANGE)
+
+
 # In Integer range checker ****************************************************
 def in_int_range(value, low_limit, high_limit, logger=None):
     # Configure loggers
@@ -38,18 +58,53 @@ def in_int_range(value, low_limit, high_limit, logger=None):
     if isinstance(value, str):
         logger.debug('Checking string input value: %s', value)
         try:
-            if int(low_limit) <= int(value) <= int(high_limit):
-                return True
-            else:
-                return False
+            value = int(value)
         except Exception:
             return False
-    if isinstance(value, int):
+    elif isinstance(value, int):
         logger.debug('Checking integer input value: %d', value)
-        if int(low_limit) <= value <= int(high_limit):
-            return True
+    else:
+        return None
+    # Limits are almost always given as integers already
+    if type(low_limit) is not int or type(high_limit) is not int:
+        try:
+            low_limit, high_limit = int(low_limit), int(high_limit)
+        except Exception:
+            return False
+    if low_limit <= value <= high_limit:
+        return True
+    else:
+        return False
+
+
+# Batch field checker *********************************************************
+def check_fields(fields, checks=HEADER_CHECKS, logger=None):
+    """ validates the leading fields of a parsed record in one pass.  Each
+    entry in checks is either a range of allowed integers or IPV4_FIELD.
+    Returns True only when every checked field is present and valid """
+    # Configure loggers
+    logger = logger or logging.getLogger(__name__)
+
+    if len(fields) < len(checks):
+        logger.debug('Record has %s fields, expected at least %s',
+                     len(fields), len(checks))
+        return False
+    for index, check in enumerate(checks):
+        value = fields[index]
+        if check is IPV4_FIELD:
+            if isinstance(value, str):
+                valid = is_ipv4(value)
+            else:
+                valid = check_ipv4(value, logger=logger)
         else:
+            try:
+                valid = int(value) in check
+            except (TypeError, ValueError):
+                valid = False
+        if valid is not True:
+            logger.debug('Record field %s failed validation: %s', index, value)
             return False
+    return True
 
 
 # Valid datetime checker ******************************************************
@@ -59,71 +114,45 @@ def is_valid_datetime(value, initial_value, logger=None):
     # Configure loggers
     logger = logger or logging.getLogger(__name__)
 
+    result = None
     if isinstance(value, datetime.datetime):
         logger.debug('Input value matches datetime format: %s', value)
-        result = (str(value))[:19]
+        result = str(value)[:19]
 
     # If only the date portion is provided, merge it with the current time
     elif isinstance(value, datetime.date):
         logger.debug('Input value matches date format: %s', value)
-        result = (str(
-            datetime.datetime.combine(
-                value,
-                datetime.datetime.now().time()
-            )
-        ))[:19]
+        result = '%s %s' % (value, datetime.datetime.now().strftime('%H:%M:%S'))
 
     # If only the time portion is provided, merge it with the current date
     elif isinstance(value, datetime.time):
         logger.debug('Input value matches time format: %s', value)
-        result = (str(
-            datetime.datetime.combine(
-                datetime.datetime.now().date(),
-                value
-            )
-        ))[:19]
+        result = '%s %s' % (datetime.date.today(), value.strftime('%H:%M:%S'))
 
     # If the input value is provided in string format,
     # determine what data it contains
     elif isinstance(value, str):
-        if re.fullmatch(DATE_REGEX, value) is not None:
-            logger.debug('Date regex match on string input value: %s', value)
+        match = DATETIME_FORMATS.fullmatch(value)
+        if match is None:
+            # Invalid format for input value.  Return original value
+            logger.debug('No date or time format match for input value: %s', value)
+        elif match.group('date') is not None:
             # input value provided was a date in string format
-            result = (str(
-                datetime.datetime.combine(
-                    datetime.date(
-                        int(value[0:4]),
-                        int(value[5:7]),
-                        int(value[8:])
-                    ),
-                    datetime.datetime.now().time()
-                )
-            ))[:19]
-        elif re.fullmatch(TIME_REGEX, value) is not None:
+            logger.debug('Date regex match on string input value: %s', value)
+            result = '%s %s' % (
+                datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10])),
+                datetime.datetime.now().strftime('%H:%M:%S'))
+        elif match.group('time') is not None:
             # input value provided was a time in string format
             logger.debug('Time regex match on string input value: %s', value)
-            result = (str(
-                datetime.datetime.combine(
-                    datetime.datetime.now().date(),
-                    datetime.time(
-                        int(value[0:2]),
-                        int(value[3:5]),
-                        int(value[6:])
-                    )
-                )
-            ))[:19]
-        elif re.fullmatch(DATETIME_REGEX, value) is not None:
+            result = '%s %s' % (datetime.date.today(), value[:8])
+        else:
             # input value provided was a datetime in string format
             logger.debug('Datetime regex match on string input value: %s', value)
             result = value[:19]
-        else:
-            # Invalid format for input value.  Return original value
-            logger.debug('No date or time format match for input value: %s', value)
-            result = None
     else:
         # Invalid format for input value.  Return original value
         logger.debug('Invalid type for input value: %s', value)
-        result = None
     # Decide what value to reuturn
     if result is not None:
         return result
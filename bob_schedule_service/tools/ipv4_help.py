@@ -3,8 +3,8 @@
 """
 
 # Import Required Libraries (Standard, Third Party, Local) ********************
+import functools
 import logging
-import re
 
 
 # Authorship Info *************************************************************
@@ -18,17 +18,28 @@ __email__ = "csmaue@gmail.com"
 __status__ = "Development"
 
 
+# Every string accepted as a single octet of an ipv4 address, including the
+# zero padded forms ("7", "07" and "007")
+IPV4_OCTETS = frozenset(
+    str(i).zfill(width) for i in range(256) for width in (1, 2, 3)
+    if len(str(i)) <= width)
+
+
 # IPv4 Format helper function *************************************************
+@functools.lru_cache(maxsize=256)
+def is_ipv4(address):
+    """ table based check of an address string against the ipv4 format.
+    Results for recently seen addresses are cached """
+    octets = address.split('.')
+    return len(octets) == 4 and all(octet in IPV4_OCTETS for octet in octets)
+
+
 def check_ipv4(address, logger=None):
     """ simple function used to determine if the contents of a string are
     compatable with an ipv4 address """
     # Configure loggers
     logger = logger or logging.getLogger(__name__)
 
-    ipv4_regex = r'\b(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.' \
-                 r'(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.' \
-                 r'(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.' \
-                 r'(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\b'
     # check if address is a string
     if isinstance(address, str) is not True:
         try:
@@ -36,10 +47,8 @@ def check_ipv4(address, logger=None):
             logger.debug('Input value was successfully converted to string')
         except Exception:
             return False
-    else:
-        logger.debug('Input value was not a string: %s', str(address))
     # check if address is formatted correctly for an ipv4 address
-    if re.fullmatch(ipv4_regex, address) is not None:
+    if is_ipv4(address) is True:
         logger.debug('Provided address is a valid IP address: %s', address)
         return True
     else:
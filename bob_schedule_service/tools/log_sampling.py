@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+""" log_sampling.py: Hot path logger wrapper
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import logging
+import sys
+import time
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Sampled Logger Class Def ****************************************************
+class SampledLogger(object):
+    """ Wraps a logger for use on the per-message hot path.  The debug mode
+    is picked once when the wrapper is created: "on" passes every debug
+    call through, "sample" passes one in every sample_rate calls and "off"
+    replaces debug with a no-op so nothing is formatted or filtered.
+    Time spent in the wrapped logger is totalled against msg_type, which
+    the caller sets while it processes each message """
+    def __init__(self, logger, mode='on', sample_rate=100):
+        self.logger = logger
+        self.mode = mode
+        self.sample_rate = max(int(sample_rate), 1)
+        self.sample_count = 0
+        self.msg_type = None
+        self.log_time = {}
+        self.log_calls = {}
+
+        # Choose the debug implementation once
+        if self.mode == 'off' or not self.logger.isEnabledFor(logging.DEBUG):
+            self.debug = self.skip
+        elif self.mode == 'sample':
+            self.debug = self.sample
+        else:
+            self.debug = self.emit_debug
+
+    def __getattr__(self, name):
+        # Anything not wrapped (handlers, level, isEnabledFor) comes from
+        # the underlying logger
+        return getattr(self.logger, name)
+
+    def log_record(self, level, msg, args, exc_info=None, extra=None):
+        """ builds and handles a record for the code that called the
+        wrapper, so file and function names still point at the caller """
+        if not self.logger.isEnabledFor(level):
+            return
+        start = time.perf_counter()
+        if exc_info:
+            if isinstance(exc_info, BaseException):
+                exc_info = (type(exc_info), exc_info, exc_info.__traceback__)
+            elif not isinstance(exc_info, tuple):
+                exc_info = sys.exc_info()
+        frame = sys._getframe(2)
+        self.logger.handle(self.logger.makeRecord(
+            self.logger.name, level, frame.f_code.co_filename, frame.f_lineno,
+            msg, args, exc_info, frame.f_code.co_name, extra))
+        self.log_time[self.msg_type] = \
+            self.log_time.get(self.msg_type, 0.0) + time.perf_counter() - start
+        self.log_calls[self.msg_type] = self.log_calls.get(self.msg_type, 0) + 1
+
+    def skip(self, msg, *args, **kwargs):
+        pass
+
+    def sample(self, msg, *args, **kwargs):
+        self.sample_count += 1
+        if self.sample_count >= self.sample_rate:
+            self.sample_count = 0
+            self.log_record(logging.DEBUG, msg, args, **kwargs)
+
+    def emit_debug(self, msg, *args, **kwargs):
+        self.log_record(logging.DEBUG, msg, args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log_record(logging.INFO, msg, args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log_record(logging.WARNING, msg, args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log_record(logging.ERROR, msg, args, **kwargs)
+
+    def exception(self, msg, *args, exc_info=True, **kwargs):
+        self.log_record(logging.ERROR, msg, args, exc_info=exc_info, **kwargs)
+
+    def critical(self, msg, *args, **kwargs):
+        self.log_record(logging.CRITICAL, msg, args, **kwargs)
+
+    def report(self):
+        """ logs and returns the time spent logging for each message type
+        since the last report, then resets the totals """
+        totals = dict(
+            (msg_type, (self.log_time[msg_type], self.log_calls[msg_type]))
+            for msg_type in self.log_time)
+        self.log_time = {}
+        self.log_calls = {}
+        if totals:
+            self.logger.info(
+                'Time spent logging by message type: %s',
+                ', '.join('%s=%.6fs/%s calls' % (msg_type, seconds, calls)
+                          for msg_type, (seconds, calls) in
+                          sorted(totals.items(), key=lambda x: str(x[0]))))
+        return totals
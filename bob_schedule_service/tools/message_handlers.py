@@ -4,7 +4,17 @@
 
 # Import Required Libraries (Standard, Third Party, Local) ********************
 import asyncio
+import collections
 import logging
+import os
+import random
+import sys
+import time
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.tools.conn_pool import ConnectionPool
+from bob_schedule_service.tools.metrics import Metrics
+from bob_schedule_service.tools.ref_num import OutstandingRefs
 
 
 # Authorship Info *************************************************************
@@ -20,92 +30,380 @@ __status__ = "Development"
 
 # Message Handler Class Def ***************************************************
 class MessageHandler(object):
-    def __init__(self, loop, logger=None):
+    def __init__(self, loop, logger=None, send_timeout=5.0, max_sends=10,
+                 metrics=None, outstanding=None, max_retries=5, retry_delay=0.5,
+                 max_retry_delay=30.0, framing='legacy', duplicate_window=0):
         # Configure loggers
         self.logger = logger or logging.getLogger(__name__)
+        self.metrics = metrics or Metrics(logger=self.logger)
 
         self.loop = loop
         self.msg_in_queue = asyncio.Queue()
         self.msg_out_queue = asyncio.Queue()
-        self.data_in = None
-        self.message = None
-        self.addr = None
-        self.msg_seg = []
-        self.ack_to_send = str()
-        self.reader = None
-        self.writer = None
+        self.read_size = 4096
+        self.max_msg_len = 65536
+        self.framing = framing
         self.msg_to_send = None
         self.msg_seg_out = []
-        self.reader_out = None
-        self.writer_out = None
-        self.ack = str()
-        self.data_ack = str()
-        self.sleep_time = 0.2
+        self.pool = ConnectionPool(loop, logger=self.logger)
+        self.send_timeout = send_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.send_limit = asyncio.Semaphore(max_sends, loop=loop)
+        self.dest_queues = {}
+        self.dest_tasks = {}
+        self.send_failures = {}
+        # Sent messages waiting for their ACK.  Shared with the RefNum that
+        # numbers them so refs still in use aren't handed out again
+        if outstanding is None:
+            outstanding = OutstandingRefs(logger=self.logger)
+        self.outstanding = outstanding
+        # Messages accepted recently, by source and ref.  A sender that
+        # never got an ACK resends the message, so delivery is at least
+        # once.  With a duplicate window, a repeat within the window is
+        # ACKed again without being processed twice
+        self.recent_msgs = collections.OrderedDict()
+        self.duplicate_window = duplicate_window
+        self.max_recent_msgs = 4096
+
+        # Register metrics
+        self.metrics.describe('messages_received_total', 'counter',
+                              'Messages received from other services')
+        self.metrics.describe('messages_duplicate_total', 'counter',
+                              'Resent messages ACKed again but not processed')
+        self.metrics.describe('messages_sent_total', 'counter',
+                              'Messages delivered and ACKed, by destination')
+        self.metrics.describe('send_failures_total', 'counter',
+                              'Messages that could not be delivered, by destination')
+        self.metrics.describe('send_retries_total', 'counter',
+                              'Messages held for another delivery attempt')
+        self.metrics.describe('messages_dropped_total', 'counter',
+                              'Messages given up on after every retry failed')
+        self.metrics.describe('acks_unmatched_total', 'counter',
+                              'ACKs that did not match the ref of the message sent')
+        self.metrics.describe('acks_expired_total', 'counter',
+                              'Messages never ACKed within the ACK timeout')
+        self.metrics.describe('send_seconds', 'histogram',
+                              'Time to deliver a message and receive its ACK')
+        self.metrics.describe('queue_depth', 'gauge',
+                              'Messages waiting in each service queue')
+        self.metrics.gauge('queue_depth', self.msg_in_queue.qsize, queue='msg_in')
+        self.metrics.gauge('queue_depth', self.msg_out_queue.qsize, queue='msg_out')
+        self.metrics.gauge('queue_depth', self.dest_queue_depth, queue='dest')
+        self.metrics.gauge('queue_depth', self.outstanding.__len__, queue='ack_wait')
+
+    def dest_queue_depth(self):
+        """ returns the number of messages waiting in every destination
+        queue """
+        return sum(queue.qsize() for queue in self.dest_queues.values())
 
     # Incoming message handler ************************************************
-    @asyncio.coroutine
-    def handle_msg_in(self, reader, writer):
-        """ Callback used to send ACK messages back to acknowledge messages
-        received """
-        self.reader = reader
-        self.writer = writer
-        # Set up socket pair
-        self.logger.debug('Yielding to reader.read()')
-        self.data_in = yield from self.reader.read(200)
-        self.logger.debug('Decoding read data')
-        self.message = self.data_in.decode()
-        self.logger.debug('Extracting address from socket connection')
-        self.addr = self.writer.get_extra_info('peername')
-        self.logger.debug('Received %r from %r', self.message, self.addr)
-
-        # Coping incoming message to message buffer
-        self.logger.debug('Received message: %s', self.message)
-        self.msg_in_queue.put_nowait(self.message)
+    def accept_msg(self, message, addr):
+        """ copies a received message into the incoming message buffer and
+        returns the ACK (its ref number) to send back """
+        self.logger.debug('Received %r from %r', message, addr)
+        ack = message.split(',')[0].encode()
+        if self.is_duplicate(message):
+            self.metrics.inc('messages_duplicate_total')
+            self.logger.debug('Message %r was already accepted, ACKing it again',
+                              message)
+            return ack
+        self.metrics.inc('messages_received_total')
+        self.msg_in_queue.put_nowait(message)
         self.logger.debug('Resulting buffer length: %s',
                           str(self.msg_in_queue.qsize()))
+        self.logger.debug('Sending ACK: %s', ack)
+        return ack
+
 
-        # Acknowledge receipt of message
-        self.logger.debug("ACK'ing message: %r", self.message)
-        self.logger.debug('Splitting message into constituent parts')
-        self.msg_seg = self.message.split(',')
-        self.logger.debug('Extracted msg sequence number: [%s]', self.msg_seg[0])
-        self.ack_to_send = self.msg_seg[0].encode()
-        self.logger.debug('Sending ACK: %s', self.ack_to_send)
-        self.writer.write(self.ack_to_send)
-        yield from writer.drain()
-        self.logger.debug('Closing the socket after sending ACK')
-        self.writer.close()
+    def is_duplicate(self, message):
+        """ returns True if the same message was accepted from the same
+        source with the same ref within duplicate_window seconds, and
+        remembers it otherwise.  The message text is compared as well as
+        the ref, but a source that wraps round to the same ref and repeats
+        a request within the window is still taken to be resending it, so
+        the window has to be shorter than sources take to reuse refs """
+        if not self.duplicate_window:
+            return False
+        fields = message.split(',', 5)
+        key = (fields[0],) + tuple(fields[3:5])
+        now = self.loop.time()
+        while self.recent_msgs:
+            _, accepted = next(iter(self.recent_msgs.values()))
+            if (len(self.recent_msgs) < self.max_recent_msgs and
+                    now - accepted < self.duplicate_window):
+                break
+            self.recent_msgs.popitem(last=False)
+        if self.recent_msgs.get(key, (None, None))[0] == message:
+            return True
+        self.recent_msgs.pop(key, None)
+        self.recent_msgs[key] = (message, now)
+        return False
+
+
+    def decode_msg(self, data, addr):
+        """ returns received bytes as a message string, or None if they
+        aren't valid UTF-8 """
+        try:
+            return data.decode()
+        except UnicodeDecodeError:
+            self.logger.warning('Ignoring message from %r that is not valid '
+                                'UTF-8: %r', addr, data[:100])
+            return None
+
+
+    @asyncio.coroutine
+    def handle_msg_in(self, reader, writer):
+        """ Callback used to receive messages and send ACK messages back to
+        acknowledge them.  With "legacy" framing (the default, which older
+        services use) each connection carries one message taken from a
+        single read, and the ACK is sent without a terminator before the
+        socket is closed.  With "newline" framing every message ends in a
+        newline, messages can be pipelined over one connection and each is
+        ACKed in order with a newline terminated ACK (an empty line for a
+        message that can't be decoded) """
+        addr = writer.get_extra_info('peername')
+        legacy = self.framing == 'legacy'
+        buffer = b''
+        try:
+            while True:
+                self.logger.debug('Yielding to reader.read()')
+                data = yield from reader.read(self.read_size)
+                if not data:
+                    break
+                if legacy:
+                    message = self.decode_msg(data.rstrip(b'\r\n'), addr)
+                    if message:
+                        writer.write(self.accept_msg(message, addr))
+                        yield from writer.drain()
+                    break
+                buffer += data
+                lines = buffer.split(b'\n')
+                buffer = lines.pop()
+                for line in lines:
+                    line = line.rstrip(b'\r')
+                    if line:
+                        message = self.decode_msg(line, addr)
+                        ack = b'' if message is None else self.accept_msg(message, addr)
+                        writer.write(ack + b'\n')
+                if len(buffer) > self.max_msg_len:
+                    self.logger.warning('Dropping connection from %r, message '
+                                        'exceeds %s bytes', addr, self.max_msg_len)
+                    buffer = b''
+                    break
+                yield from writer.drain()
+        except (ConnectionError, OSError) as exc:
+            self.logger.warning('Connection from %r failed: %r', addr, exc)
+            buffer = b''
+        # A final message may be left unterminated when the peer closes
+        if buffer.strip():
+            message = self.decode_msg(buffer.rstrip(b'\r'), addr)
+            if message is not None:
+                writer.write(self.accept_msg(message, addr) + b'\n')
+        self.logger.debug('Closing the socket from %r', addr)
+        writer.close()
 
 
     # Outgoing message handler ************************************************
+    @asyncio.coroutine
+    def send_msg(self, addr, port, msg):
+        """ sends a message and returns the ACK received in response.
+        With newline framing the message is newline terminated, sent over
+        a pooled connection and the ACK is read up to its newline, or up to
+        the close for peers that ACK without one.  A pooled connection the
+        peer has since closed is replaced with a fresh one and the message
+        re-sent.  With legacy framing the message is sent unterminated on
+        its own connection and the ACK is taken from a single read """
+        legacy = self.framing == 'legacy'
+        data = msg.rstrip('\n').encode()
+        if not legacy:
+            data += b'\n'
+        while True:
+            conn = yield from self.pool.acquire(addr, port)
+            try:
+                self.logger.debug('Sending message: %s', msg)
+                conn.writer.write(data)
+                yield from conn.writer.drain()
+                self.logger.debug('Waiting for ack')
+                if legacy:
+                    data_ack = yield from conn.reader.read(self.read_size)
+                else:
+                    data_ack = yield from conn.reader.readline()
+            except asyncio.CancelledError:
+                self.pool.discard(conn)
+                raise
+            except (ConnectionError, OSError):
+                self.pool.discard(conn)
+                if conn.reused:
+                    self.logger.debug('Pooled connection failed, reconnecting')
+                    continue
+                raise
+            if not data_ack:
+                self.pool.discard(conn)
+                if conn.reused:
+                    self.logger.debug('Pooled connection closed by peer, '
+                                      'reconnecting')
+                    continue
+                return str()
+            if legacy:
+                # Older peers close the socket after each ACK
+                self.pool.discard(conn)
+            else:
+                self.pool.release(conn)
+            return data_ack.decode(errors='replace').rstrip('\r\n')
+
+
+    def record_send_failure(self, dest, msg, reason):
+        """ counts a failed send against its destination and logs the
+        message that could not be delivered """
+        self.send_failures[dest] = self.send_failures.get(dest, 0) + 1
+        self.metrics.inc('send_failures_total', dest='%s:%s' % dest)
+        self.logger.warning('Failed to send message [%s] to %s:%s (%s, %s '
+                            'failure(s) to this destination)',
+                            msg, dest[0], dest[1], reason,
+                            self.send_failures[dest])
+
+
+    @asyncio.coroutine
+    def deliver(self, dest, msg):
+        """ sends one message and waits for its ACK.  Returns True once
+        the ACK matching the message's ref has been received.  Any error
+        is counted as a failed send, so it can't stop the destination's
+        sender task """
+        ref = msg.split(',', 1)[0]
+        self.outstanding.add(dest, ref, msg)
+        with (yield from self.send_limit):
+            try:
+                start = time.perf_counter()
+                ack = yield from asyncio.wait_for(
+                    self.send_msg(dest[0], dest[1], msg),
+                    self.send_timeout,
+                    loop=self.loop)
+                self.logger.debug('Received ACK: %r', ack)
+                if not ack.strip():
+                    self.record_send_failure(
+                        dest, msg, 'connection closed without an ACK')
+                    return False
+                if self.outstanding.ack(dest, ack) is None:
+                    self.metrics.inc('acks_unmatched_total', dest='%s:%s' % dest)
+                    self.logger.warning('ACK [%s] from %s:%s does not match '
+                                        'message [%s]', ack.strip(), dest[0],
+                                        dest[1], msg)
+                    return False
+                self.metrics.observe('send_seconds', time.perf_counter() - start,
+                                     dest='%s:%s' % dest)
+                self.metrics.inc('messages_sent_total', dest='%s:%s' % dest)
+                return True
+            except asyncio.TimeoutError:
+                self.record_send_failure(
+                    dest, msg, 'no ACK within %ss' % self.send_timeout)
+            except (ConnectionError, OSError) as exc:
+                self.record_send_failure(dest, msg, repr(exc))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.logger.exception('Unexpected error sending to %s:%s', dest[0], dest[1])
+                self.record_send_failure(dest, msg, repr(exc))
+        return False
+
+
+    def retry_backoff(self, rounds):
+        """ seconds to wait before the given retry round: doubling from
+        retry_delay up to max_retry_delay, with the upper half jittered so
+        senders that failed together don't retry together """
+        delay = min(self.retry_delay * 2 ** (rounds - 1), self.max_retry_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+    @asyncio.coroutine
+    def handle_dest_out(self, dest):
+        """ task to send queued messages to a single destination, one at a
+        time and in order.  Each destination has its own task so a slow
+        or dead peer only delays messages addressed to it.  Messages stay
+        pending until their ACK arrives, so a message whose ACK is lost is
+        sent again and may be delivered more than once.  When one isn't
+        ACKed, it and every message queued behind it wait out a backoff
+        before it is tried again.  Attempts are counted per message, so a message is
+        only dropped once it has itself been sent max_retries more times
+        than the first send """
+        queue = self.dest_queues[dest]
+        pending = collections.deque()
+        rounds = 0
+        while True:
+            if not pending:
+                pending.append([(yield from queue.get()), 0])
+            while not queue.empty():
+                pending.append([queue.get_nowait(), 0])
+            while pending:
+                entry = pending[0]
+                if entry[1]:
+                    self.metrics.inc('send_retries_total', dest='%s:%s' % dest)
+                entry[1] += 1
+                delivered = yield from self.deliver(dest, entry[0])
+                if not delivered:
+                    break
+                pending.popleft()
+                rounds = 0
+            if not pending:
+                continue
+
+            # Destination failed: give up on the message that was tried if
+            # it is out of retries, and hold the rest for one backoff
+            rounds += 1
+            if pending[0][1] > self.max_retries:
+                self.drop_msg(dest, pending.popleft()[0])
+            if pending:
+                delay = self.retry_backoff(rounds)
+                self.logger.debug('Retrying [%s] message(s) to %s:%s in %.2fs',
+                                  len(pending), dest[0], dest[1], delay)
+                yield from asyncio.sleep(delay, loop=self.loop)
+
+
+    def drop_msg(self, dest, msg):
+        """ gives up on a message that was never ACKed """
+        self.outstanding.discard(dest, msg.split(',', 1)[0])
+        self.metrics.inc('messages_dropped_total', dest='%s:%s' % dest)
+        self.logger.warning('Dropping message [%s] to %s:%s after %s retries',
+                            msg, dest[0], dest[1], self.max_retries)
+
+
+    @asyncio.coroutine
+    def handle_ack_expiry(self):
+        """ task to drop messages that were never ACKed once they have
+        waited longer than the ACK timeout """
+        while True:
+            yield from asyncio.sleep(self.outstanding.timeout / 2, loop=self.loop)
+            for dest, ref, msg in self.outstanding.expire():
+                self.metrics.inc('acks_expired_total', dest='%s:%s' % dest)
+                self.logger.debug('Message [%s] to %s:%s was never ACKed',
+                                  msg, dest[0], dest[1])
+
+
     @asyncio.coroutine
     def handle_msg_out(self):
-        """ task to handle outgoing messages """
+        """ task to route outgoing messages to their destination's sender
+        task """
         while True:
-            self.sleep_time = 0.2
-            if self.msg_out_queue.qsize() > 0:
-                self.sleep_time = 0.05
-                self.logger.debug('Pulling next outgoing message from queue')
-                self.msg_to_send = self.msg_out_queue.get_nowait()
-                self.logger.debug('Preparing to send message: %s', self.msg_to_send)
-                self.logger.debug('Extracting msg destination address and port')
-                self.msg_seg_out = self.msg_to_send.split(',')
-                self.logger.debug('Opening outgoing connection to %s:%s',
-                                  self.msg_seg_out[1], self.msg_seg_out[2])
-                try:
-                    self.reader_out, self.writer_out = yield from asyncio.open_connection(
-                        self.msg_seg_out[1], int(self.msg_seg_out[2]), loop=self.loop)
-                    self.logger.debug('Sending message: %s', self.msg_to_send)
-                    self.writer_out.write(self.msg_to_send.encode())
-
-                    self.logger.debug('Waiting for ack')
-                    self.data_ack = yield from self.reader_out.read(200)
-                    self.ack = self.data_ack.decode()
-                    self.logger.debug('Received ACK: %r', self.ack)
-                    self.logger.debug('Closing socket')
-                    self.writer_out.close()
-                except Exception:
-                    self.logger.warning('Could not open socket connection to '
-                                        'target')
-            # Yield to other tasks for a while
-            yield from asyncio.sleep(self.sleep_time)
+            self.msg_to_send = yield from self.msg_out_queue.get()
+            self.logger.debug('Preparing to send message: %s', self.msg_to_send)
+            self.logger.debug('Extracting msg destination address and port')
+            self.msg_seg_out = self.msg_to_send.split(',')
+            try:
+                dest = (self.msg_seg_out[1], int(self.msg_seg_out[2]))
+            except (IndexError, ValueError):
+                self.logger.warning('Dropping message with invalid destination: '
+                                    '[%s]', self.msg_to_send)
+                continue
+            if dest not in self.dest_queues:
+                self.logger.debug('Starting sender task for %s:%s', *dest)
+                self.dest_queues[dest] = asyncio.Queue()
+            task = self.dest_tasks.get(dest)
+            if task is None or task.done():
+                if task is not None:
+                    self.logger.error('Sender task for %s:%s stopped (%r), restarting it',
+                                      dest[0], dest[1],
+                                      None if task.cancelled() else task.exception())
+                self.dest_tasks[dest] = asyncio.ensure_future(
+                    self.handle_dest_out(dest), loop=self.loop)
+            self.dest_queues[dest].put_nowait(self.msg_to_send)
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+""" metrics.py: Service counters, gauges and latency histograms
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import bisect
+import logging
+import threading
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Default histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Metrics Registry Class Def **************************************************
+class Metrics(object):
+    """ Registry of counters, gauges and histograms.  Updates are a dict
+    lookup and an add (plus a bisect for histograms) so instrumentation can
+    stay on in production.  Gauges can also be given as callables that are
+    only evaluated when the metrics are read, which is how queue depths are
+    reported.  Metrics are read either as Prometheus text exposition format
+    or as a flat list of name/value pairs for the stats message.  Metrics
+    exported by worker processes can be merged in, and are read back with
+    a worker label """
+    def __init__(self, logger=None, prefix='bob_schedule_'):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.prefix = prefix
+        self.types = {}
+        self.help = {}
+        self.buckets = {}
+        self.values = {}
+        self.callbacks = {}
+        self.workers = {}
+        # Calendar syncs update metrics from an executor thread
+        self.lock = threading.Lock()
+
+    def describe(self, name, metric_type, help_text, buckets=LATENCY_BUCKETS):
+        """ declares a metric's type (counter, gauge or histogram) """
+        self.types[name] = metric_type
+        self.help[name] = help_text
+        if metric_type == 'histogram':
+            self.buckets[name] = tuple(buckets)
+
+    def inc(self, name, value=1, **labels):
+        """ adds to a counter """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """ sets a gauge to a value """
+        self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def gauge(self, name, callback, **labels):
+        """ registers a callable that returns a gauge's value when read """
+        self.callbacks[(name, tuple(sorted(labels.items())))] = callback
+
+    def observe(self, name, seconds, **labels):
+        """ records a value in a histogram """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                hist = self.values[key] = [[0] * (len(self.buckets[name]) + 1), 0.0, 0]
+            hist[0][bisect.bisect_left(self.buckets[name], seconds)] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def collect(self):
+        """ returns (name, labels, value) for every metric, sorted by name,
+        with gauge callbacks evaluated """
+        with self.lock:
+            items = [(key, list(value[0]) + value[1:] if isinstance(value, list) else value)
+                     for key, value in self.values.items()]
+            for worker, values in self.workers.items():
+                items.extend(((name, tuple(sorted(labels + (('worker', str(worker)),)))), value)
+                             for name, labels, value in values)
+        for key, callback in self.callbacks.items():
+            try:
+                items.append((key, callback()))
+            except Exception:
+                self.logger.warning('Failed to read gauge [%s]', key[0])
+        return sorted((key[0], key[1], value) for key, value in items)
+
+    def render(self):
+        """ returns every metric in Prometheus text exposition format """
+        lines = []
+        described = set()
+        for name, labels, value in self.collect():
+            full_name = self.prefix + name
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP %s %s' % (full_name, self.help.get(name, name)))
+                lines.append('# TYPE %s %s' % (full_name, self.types.get(name, 'untyped')))
+            if self.types.get(name) == 'histogram':
+                counts, total, count = value[:-2], value[-2], value[-1]
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets[name] + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append('%s_bucket%s %s' % (
+                        full_name, format_labels(labels + (('le', str(bound)),)),
+                        cumulative))
+                lines.append('%s_sum%s %r' % (full_name, format_labels(labels), total))
+                lines.append('%s_count%s %s' % (full_name, format_labels(labels), count))
+            else:
+                lines.append('%s%s %r' % (full_name, format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """ returns every metric as a list of (name, value) string pairs.
+        Histograms are reduced to their count and sum.  Names use
+        name[label=value;...] so they hold no commas, and values keep full
+        precision (eg. Unix timestamps) """
+        pairs = []
+        for name, labels, value in self.collect():
+            key = name
+            if labels:
+                key += '[%s]' % ';'.join('%s=%s' % label for label in labels)
+            if self.types.get(name) == 'histogram':
+                pairs.append((key + '_count', format_value(value[-1])))
+                pairs.append((key + '_sum', format_value(value[-2])))
+            else:
+                pairs.append((key, format_value(value)))
+        return pairs
+
+    def export(self):
+        """ returns the metric descriptions and values in a form that can
+        be pickled and passed to merge() in another process """
+        return (dict(self.types), dict(self.help), dict(self.buckets), self.collect())
+
+    def merge(self, worker, exported):
+        """ replaces the metrics last exported by a worker process """
+        types, help_text, buckets, values = exported
+        with self.lock:
+            for name, metric_type in types.items():
+                self.types.setdefault(name, metric_type)
+                self.help.setdefault(name, help_text.get(name, name))
+                if name in buckets:
+                    self.buckets.setdefault(name, buckets[name])
+            self.workers[worker] = values
+
+    @asyncio.coroutine
+    def handle_http(self, reader, writer):
+        """ Callback for a minimal local HTTP endpoint that answers every
+        request with the Prometheus text rendering of the metrics """
+        try:
+            while True:
+                line = yield from reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            body = self.render().encode()
+            writer.write(b'HTTP/1.0 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                         b'\r\n' + body)
+            yield from writer.drain()
+        except (ConnectionError, OSError) as exc:
+            self.logger.warning('Metrics request failed: %r', exc)
+        writer.close()
+
+
+# Helper Functions ************************************************************
+def format_value(value):
+    """ renders a metric value without losing precision: integers in
+    full and floats as their shortest exact repr """
+    if isinstance(value, int):
+        return '%d' % value
+    return repr(value)
+
+
+def format_labels(labels):
+    """ renders label pairs in Prometheus {name="value"} form """
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels)
@@ -3,7 +3,9 @@
 """
 
 # Import Required Libraries (Standard, Third Party, Local) ********************
+import collections
 import logging
+import time
 
 
 # Authorship Info *************************************************************
@@ -17,15 +19,92 @@ __email__ = "csmaue@gmail.com"
 __status__ = "Development"
 
 
+# Outstanding ACK table ******************************************************
+class OutstandingRefs(object):
+    """ Messages sent and not yet ACKed, keyed by destination and ref
+    number so each incoming ACK is matched to the message it confirms with
+    a single dict lookup.  Entries are kept in the order they were sent,
+    so expiring the ones older than timeout only looks at the oldest """
+    def __init__(self, timeout=30.0, logger=None):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.timeout = timeout
+        self.pending = collections.OrderedDict()
+        self.acked = 0
+        self.unmatched = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, key):
+        return key in self.pending
+
+    def add(self, dest, ref, msg, now=None):
+        """ records a message sent to dest (addr, port) with ref number
+        ref.  A message sent again moves to the back with its new send time """
+        key = (dest, str(ref))
+        if key in self.pending and self.pending[key][0] != msg:
+            self.logger.warning('Ref [%s] to %s:%s is already waiting for an '
+                                'ACK, replacing it', ref, dest[0], dest[1])
+        self.pending.pop(key, None)
+        self.pending[key] = (msg, time.monotonic() if now is None else now)
+
+    def ack(self, dest, ref):
+        """ matches an ACK received from dest.  Returns the message it
+        confirms, or None if no message with that ref is outstanding """
+        entry = self.pending.pop((dest, str(ref).strip()), None)
+        if entry is None:
+            self.unmatched += 1
+            return None
+        self.acked += 1
+        return entry[0]
+
+    def discard(self, dest, ref):
+        """ stops waiting for an ACK to a message given up on """
+        self.pending.pop((dest, str(ref)), None)
+
+    def expire(self, now=None):
+        """ drops messages that have waited longer than timeout for an ACK
+        and returns them as (dest, ref, msg) tuples """
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self.pending:
+            key, (msg, sent) = next(iter(self.pending.items()))
+            if now - sent < self.timeout:
+                break
+            del self.pending[key]
+            expired.append((key[0], key[1], msg))
+        self.expired += len(expired)
+        return expired
+
+
 # Class definition ************************************************************
 class RefNum(object):
-    def __init__(self, logger=None):
+    """ Message reference number generator.  Refs are three digits
+    (100-999) by default, as older services expect; more digits widen the
+    sequence so refs take longer to wrap.  With per_dest set, each
+    destination gets its own sequence.  New refs skip any still waiting
+    for an ACK from the same destination.  Processes sending from the same
+    address (eg. forked workers) are each given their own share of the
+    refs: every step-th ref, starting offset refs into the range """
+    def __init__(self, logger=None, digits=3, per_dest=False, ack_timeout=30.0,
+                 offset=0, step=1):
         # Configure loggers
         self.logger = logger or logging.getLogger(__name__)
 
         # Init tags
-        self.logger.debug('Setting source register to initial value of 100')
-        self._source = 100
+        self.low = 10 ** (digits - 1)
+        self.high = 10 ** digits - 1
+        self.offset = offset
+        self.step = step
+        self.per_dest = per_dest
+        self.outstanding = OutstandingRefs(timeout=ack_timeout, logger=self.logger)
+        self.dest_sources = {}
+        self.logger.debug('Setting source register to initial value of %s',
+                          self.low + self.offset)
+        self._source = self.low + self.offset
 
     # source control **********************************************************
     @property
@@ -45,11 +124,31 @@ class RefNum(object):
             self.logger.debug('Invalid source value: %s', value)
 
     # new value control *******************************************************
-    def new(self):
+    def new(self, addr=None, port=None):
+        """ returns the next ref number for a message to addr:port.  A
+        port that isn't a number falls back to the shared sequence """
+        dest = None
+        if addr is not None:
+            try:
+                dest = (addr, int(port))
+            except (TypeError, ValueError):
+                self.logger.warning('Invalid destination port [%s], using shared '
+                                    'ref sequence', port)
+        if self.per_dest and dest is not None:
+            value = self.dest_sources.get(dest, self.low + self.offset)
+        else:
+            value = self._source
         self.logger.debug('Incrementing source register')
-        self._source += 1
-        if self._source > 999:
-            self.logger.debug('Rolling over source register')
-            self._source = 100
-        self.logger.debug('Returning source value to main: %d', self._source)
-        return str(self._source)
+        for _ in range((self.high - self.low - self.offset) // self.step + 1):
+            value += self.step
+            if value > self.high:
+                self.logger.debug('Rolling over source register')
+                value = self.low + self.offset
+            if dest is None or (dest, str(value)) not in self.outstanding:
+                break
+        if self.per_dest and dest is not None:
+            self.dest_sources[dest] = value
+        else:
+            self._source = value
+        self.logger.debug('Returning source value to main: %d', value)
+        return str(value)
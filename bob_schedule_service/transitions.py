@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+""" transitions.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import copy
+import datetime
+import heapq
+import logging
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.msg_processing import create_device_scheduled_state_change_msg
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+# Transition Scheduler Class Def **********************************************
+class TransitionScheduler(object):
+    """ Pushes scheduled state change messages to subscribed services at the
+    moment a device's calendar interval starts or ends.  The next
+    transition of every subscribed device is kept on a heap, so the task
+    only wakes up when a state actually changes or the schedule is
+    refreshed """
+    def __init__(self, logger=None, **kwargs):
+        # Configure logger
+        self.logger = logger or logging.getLogger(__name__)
+
+        # Define instance variables
+        self.ref_num = None
+        self.schedule = None
+        self.msg_out_queue = None
+        self.service_addresses = []
+        self.message_types = []
+        self.subscribers = {}
+        self.states = {}
+        self.timers = []
+        self.next_change = {}
+        self.index = None
+        self.max_sleep = 60
+        self.wakeup_event = asyncio.Event()
+
+        # Map input variables
+        if kwargs is not None:
+            for key, value in kwargs.items():
+                if key == "ref":
+                    self.ref_num = value
+                if key == "schedule":
+                    self.schedule = value
+                if key == "msg_out_queue":
+                    self.msg_out_queue = value
+                if key == "service_addresses":
+                    self.service_addresses = value
+                if key == "message_types":
+                    self.message_types = value
+
+        # Re-check every subscribed device whenever the schedule is refreshed
+        if self.schedule is not None:
+            self.schedule.refresh_callbacks.append(self.wakeup)
+
+
+    def wakeup(self):
+        """ wakes the scheduler task so it re-reads the schedule """
+        self.wakeup_event.set()
+
+
+    def subscribe(self, addr, port, dev_name):
+        """ registers a service to receive state changes for a device, or
+        for every device when the name is "all" """
+        self.logger.debug('Adding subscriber %s:%s for device [%s]',
+                          addr, port, dev_name)
+        self.subscribers.setdefault(dev_name, set()).add((addr, port))
+        if dev_name == 'all' and self.index is not None:
+            for name in self.index.names():
+                self.track(name, datetime.datetime.now(), notify=False)
+        elif self.index is not None:
+            self.track(dev_name, datetime.datetime.now(), notify=False)
+        self.wakeup()
+
+
+    def tracked_devices(self):
+        """ returns the names of every device with at least one subscriber """
+        names = set(self.subscribers.keys())
+        names.discard('all')
+        if 'all' in self.subscribers and self.index is not None:
+            names.update(self.index.names())
+        return names
+
+
+    def track(self, name, now, notify=True):
+        """ checks a device's current state, notifies subscribers if it has
+        changed since the last check, and schedules its next transition """
+        state, valid_until = self.index.state_at(name, now)
+        if notify and name in self.states and self.states[name] != state:
+            self.notify(name, state)
+        self.states[name] = state
+        if valid_until is not None and self.next_change.get(name) != valid_until:
+            heapq.heappush(self.timers, (valid_until, name))
+        self.next_change[name] = valid_until
+
+
+    def rebuild(self, now):
+        """ re-checks every subscribed device against a new schedule """
+        self.logger.debug('Rebuilding transition timers')
+        self.index = self.schedule.index
+        self.timers = []
+        self.next_change = {}
+        for name in self.tracked_devices():
+            self.track(name, now)
+
+
+    def fire_due(self, now):
+        """ handles every transition that is due """
+        while self.timers and self.timers[0][0] <= now:
+            when, name = heapq.heappop(self.timers)
+            # Skip timers superseded by a later track() of the same device
+            if self.next_change.get(name) == when:
+                del self.next_change[name]
+                self.track(name, now)
+
+
+    def notify(self, name, state):
+        """ queues a state change message to every subscriber of a device """
+        destinations = self.subscribers.get(name, set()) | \
+            self.subscribers.get('all', set())
+        self.logger.debug('Device [%s] scheduled state changed to [%s], '
+                          'notifying %s subscriber(s)', name, state,
+                          len(destinations))
+        out_msg_list = create_device_scheduled_state_change_msg(
+            self.logger,
+            self.ref_num,
+            sorted(destinations),
+            self.service_addresses['schedule_addr'],
+            self.service_addresses['schedule_port'],
+            name,
+            'on' if state else 'off',
+            self.message_types)
+        for out_msg in out_msg_list:
+            self.msg_out_queue.put_nowait(copy.copy(out_msg))
+
+
+    @asyncio.coroutine
+    def run(self):
+        """ task to push scheduled state changes to subscribers """
+        self.logger.info('Starting schedule service transition task')
+
+        while True:
+            # Sleep until the next transition is due, the schedule is
+            # refreshed or a new subscription arrives.  Sleep is capped so
+            # system clock changes are picked up
+            sleep_time = self.max_sleep
+            if self.timers:
+                sleep_time = (self.timers[0][0] - datetime.datetime.now()).total_seconds()
+                sleep_time = min(max(sleep_time, 0), self.max_sleep)
+            try:
+                yield from asyncio.wait_for(self.wakeup_event.wait(), sleep_time)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup_event.clear()
+            if self.schedule is None:
+                continue
+            now = datetime.datetime.now()
+            if self.index is not self.schedule.index:
+                self.rebuild(now)
+            else:
+                self.fire_due(now)
@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+""" workers.py:
+    Multi-process mode: worker processes answering requests on a shared
+    port, fed with the schedule by the coordinating process
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import datetime
+import logging
+import os
+import pickle
+import signal
+import socket
+import struct
+import sys
+import time
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.goog_cal import GoogleCalSync
+from bob_schedule_service.schedule import Sched
+from bob_schedule_service.schedule import SchedIndex
+
+
+# Authorship Info *************************************************************
+__author__ = "Christopher Maue"
+__copyright__ = "Copyright 2017, The RPi-Home Project"
+__credits__ = ["Christopher Maue"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Christopher Maue"
+__email__ = "csmaue@gmail.com"
+__status__ = "Development"
+
+
+FRAME_HEADER = struct.Struct('!I')
+
+
+# Helper Functions ************************************************************
+def encode_frame(obj):
+    """ packs an object for the coordinator/worker link as a length
+    prefixed pickle.  The link only ever joins processes forked from the
+    same service, so pickle is safe here """
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+@asyncio.coroutine
+def read_frame(reader):
+    """ reads one object written by encode_frame """
+    header = yield from reader.readexactly(FRAME_HEADER.size)
+    data = yield from reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    return pickle.loads(data)
+
+
+def schedule_entries(schedule):
+    """ returns a schedule as plain (name, start, end) tuples, which is
+    all the workers need to rebuild the index """
+    return [(sched.name, sched.start, sched.end) for sched in schedule.schedule]
+
+
+# Worker Side *****************************************************************
+class SharedSchedule(object):
+    """ Read-only schedule used by worker processes.  It never reads the
+    calendar itself; the coordinator sends a new set of entries after
+    every refresh and the index is rebuilt from them """
+    def __init__(self, entries=None, logger=None):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.schedule = []
+        self.index = SchedIndex(logger=self.logger)
+        self.result_list = []
+        self.newCmd = False
+        self.refresh_callbacks = []
+        self.stopping = False
+        if entries is not None:
+            self.load(entries)
+
+
+    def load(self, entries):
+        """ swaps in a new schedule built from (name, start, end) tuples """
+        schedule = [Sched(logger=self.logger, name=name, start=start, end=end)
+                    for name, start, end in entries]
+        self.schedule, self.index = schedule, SchedIndex(schedule, logger=self.logger)
+        self.logger.debug('Loaded [%s] schedule entries from coordinator', len(schedule))
+        for callback in self.refresh_callbacks:
+            callback()
+
+
+    def request_refresh(self, when=None):
+        """ refreshes are done by the coordinator """
+        pass
+
+
+    def stop(self):
+        """ stops the worker's loop, once.  The coordinator's SIGTERM and
+        the link closing both call this, and a second loop.stop() would
+        cut short the run_until_complete calls of the shutdown """
+        if not self.stopping:
+            self.stopping = True
+            asyncio.get_event_loop().stop()
+
+
+    @asyncio.coroutine
+    def follow(self, reader):
+        """ task loading each schedule the coordinator sends.  Stops the
+        worker if the coordinator goes away """
+        while True:
+            try:
+                kind, entries = yield from read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                if not self.stopping:
+                    self.logger.error('Lost connection to coordinator, stopping worker')
+                    self.stop()
+                return
+            if kind == 'schedule':
+                self.load(entries)
+
+
+    # The lookups only use index and request_refresh, so they are shared
+    # with the calendar class
+    sched_by_name = GoogleCalSync.sched_by_name
+    sched_by_date = GoogleCalSync.sched_by_date
+    check_schedule = GoogleCalSync.check_schedule
+    next_transition = GoogleCalSync.next_transition
+
+
+class SubscriptionForwarder(object):
+    """ Stands in for the transition scheduler in worker processes,
+    passing subscriptions on to the coordinator, which sends every state
+    change notification """
+    def __init__(self, writer, logger=None):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+        self.writer = writer
+
+    def subscribe(self, addr, port, dev_name):
+        self.logger.debug('Forwarding subscription for [%s] from [%s:%s]',
+                          dev_name, addr, port)
+        self.writer.write(encode_frame(('subscribe', (addr, port, dev_name))))
+
+
+@asyncio.coroutine
+def report_metrics(writer, metrics, interval=5):
+    """ task sending the worker's metrics to the coordinator, which
+    serves the metrics endpoint for the whole service """
+    while True:
+        writer.write(encode_frame(('metrics', metrics.export())))
+        yield from asyncio.sleep(interval)
+
+
+# Coordinator Side ************************************************************
+class WorkerPool(object):
+    """ Forks the worker processes and links each one to the coordinator
+    with a socket pair.  The coordinator keeps the calendar, pushes the
+    schedule to every worker whenever it is refreshed and registers the
+    subscriptions the workers forward with its transition scheduler.  The
+    metrics each worker reports are merged into the coordinator's """
+    def __init__(self, schedule, scheduler=None, count=2, refresh_interval=60,
+                 metrics=None, logger=None):
+        # Configure loggers
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.schedule = schedule
+        self.scheduler = scheduler
+        self.count = count
+        self.refresh_interval = refresh_interval
+        self.metrics = metrics
+        self.pids = []
+        self.sockets = []
+        self.writers = []
+        self.tasks = []
+        self.stopping = False
+
+    def start(self, worker_main, worker_exit=None):
+        """ forks the workers.  Each child calls worker_main(worker_num,
+        sock, entries) and exits when it returns; only the coordinator
+        returns from here.  worker_exit, if given, is called just before
+        the child exits to flush the child's own log handler.  Must be
+        called before the coordinator's event loop is created, so no loop
+        state is shared with the children """
+        entries = schedule_entries(self.schedule)
+        for worker_num in range(self.count):
+            parent_sock, child_sock = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 0
+                try:
+                    parent_sock.close()
+                    for sock in self.sockets:
+                        sock.close()
+                    worker_main(worker_num, child_sock, entries)
+                except BaseException:
+                    self.logger.exception('Worker [%s] failed', worker_num)
+                    exit_code = 1
+                finally:
+                    # Handlers inherited from the coordinator may hold locks
+                    # taken at the fork, so only the child's own is flushed
+                    try:
+                        if worker_exit is not None:
+                            worker_exit()
+                    finally:
+                        os._exit(exit_code)
+            child_sock.close()
+            self.pids.append(pid)
+            self.sockets.append(parent_sock)
+            self.logger.info('Started worker [%s] as process [%s]', worker_num, pid)
+
+    def connect(self, loop):
+        """ starts the coordinator's side of each worker link """
+        for worker_num, sock in enumerate(self.sockets):
+            reader, writer = loop.run_until_complete(
+                asyncio.open_connection(sock=sock, loop=loop))
+            self.writers.append(writer)
+            self.tasks.append(asyncio.ensure_future(
+                self.listen(reader, worker_num), loop=loop))
+        self.schedule.refresh_callbacks.append(self.publish)
+        self.tasks.append(asyncio.ensure_future(self.refresh(), loop=loop))
+
+    def publish(self):
+        """ sends the current schedule to every worker """
+        frame = encode_frame(('schedule', schedule_entries(self.schedule)))
+        for writer in self.writers:
+            writer.write(frame)
+        self.logger.debug('Published schedule to [%s] workers', len(self.writers))
+
+    @asyncio.coroutine
+    def listen(self, reader, worker_num=0):
+        """ task registering the subscriptions a worker forwards and
+        storing the metrics it reports """
+        while True:
+            try:
+                kind, args = yield from read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                if not self.stopping:
+                    self.logger.error('Lost connection to a worker process')
+                return
+            if kind == 'subscribe' and self.scheduler is not None:
+                self.scheduler.subscribe(*args)
+            elif kind == 'metrics' and self.metrics is not None:
+                self.metrics.merge(worker_num, args)
+
+    @asyncio.coroutine
+    def refresh(self):
+        """ task keeping the calendar fresh.  Requests no longer arrive
+        here to trigger refreshes, so they are requested on a timer """
+        while True:
+            yield from asyncio.sleep(self.refresh_interval)
+            self.schedule.request_refresh(datetime.datetime.now())
+
+    def stop(self, timeout=5.0):
+        """ stops every worker: each is sent SIGTERM while its link is still
+        open, and any that hasn't exited within timeout seconds is killed.
+        The links are closed once the workers are gone """
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        running = list(self.pids)
+        deadline = time.monotonic() + timeout
+        while running:
+            for pid in list(running):
+                try:
+                    exited, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    exited = pid
+                if exited:
+                    running.remove(pid)
+            if running and time.monotonic() > deadline:
+                for pid in running:
+                    self.logger.warning('Worker process [%s] did not exit, '
+                                        'killing it', pid)
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                        os.waitpid(pid, 0)
+                    except (ProcessLookupError, ChildProcessError):
+                        pass
+                running = []
+            elif running:
+                time.sleep(0.05)
+        for writer in self.writers:
+            writer.close()
+        self.logger.info('Stopped [%s] worker processes', len(self.pids))
+        self.pids = []
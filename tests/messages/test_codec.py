@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+""" test_codec.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.messages.codec import decode
+from bob_schedule_service.messages.codec import encode
+from bob_schedule_service.messages.codec import peek_msg_type
+from bob_schedule_service.messages.codec import HeartbeatRecord
+from bob_schedule_service.messages.codec import DeviceStateRecord
+from bob_schedule_service.messages.codec import DeviceStateAckRecord
+from bob_schedule_service.messages.get_device_scheduled_state import GetDeviceScheduledStateMessage
+from bob_schedule_service.messages.get_device_scheduled_state_ack import GetDeviceScheduledStateMessageACK
+
+
+# Define test class ***********************************************************
+class TestCodec(unittest.TestCase):
+    """ unittests for shared message codec """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.temp_str = str()
+        super(TestCodec, self).__init__(*args, **kwargs)
+
+
+    def test_peek_msg_type(self):
+        """ test message type is read without decoding the message """
+        self.assertEqual(peek_msg_type('142,127.0.0.1,12000,192.168.5.45,13000,302,fylt1'), '302')
+        self.assertEqual(peek_msg_type(b'142,127.0.0.1,12000,192.168.5.45,13000,100'), '100')
+        self.assertEqual(peek_msg_type('142,127.0.0.1,12000'), None)
+
+
+    def test_decode(self):
+        """ test decoding a message into a record """
+        self.temp_str = '142,127.0.0.1,12000,192.168.5.45,13000,302,fylt1'
+        record = decode(self.temp_str, DeviceStateRecord, logger=self.log)
+        self.assertEqual(record.ref, '142')
+        self.assertEqual(record.source_addr, '192.168.5.45')
+        self.assertEqual(record.source_port, '13000')
+        self.assertEqual(record.dev_name, 'fylt1')
+        self.assertEqual(encode(record), self.temp_str)
+
+
+    def test_decode_invalid(self):
+        """ test messages that are short or have a bad header are rejected """
+        self.assertEqual(decode('142,127.0.0.1,12000,192.168.5.45,13000,302',
+                                DeviceStateRecord, logger=self.log), None)
+        self.assertEqual(decode('142,127.0.0.1,12000,192.168.5.300,13000,302,fylt1',
+                                DeviceStateRecord, logger=self.log), None)
+        self.assertEqual(decode('142,127.0.0.1,2000,192.168.5.45,13000,302,fylt1',
+                                DeviceStateRecord, logger=self.log), None)
+
+
+    def test_encode(self):
+        """ test records are rendered the same way as the message classes """
+        record = HeartbeatRecord('142', '127.0.0.1', '12000', '192.168.5.45', '13000', '100')
+        self.assertEqual(encode(record), '142,127.0.0.1,12000,192.168.5.45,13000,100')
+        record = DeviceStateAckRecord('142', '127.0.0.1', 12000, '192.168.5.45', 13000,
+                                      '303', 'fylt1', 'on')
+        message = GetDeviceScheduledStateMessageACK(logger=self.log)
+        message.complete = encode(record)
+        self.assertEqual(message.dev_name, 'fylt1')
+        self.assertEqual(message.dev_cmd, 'on')
+        self.assertEqual(message.complete, encode(record))
+
+
+    def test_slots(self):
+        """ test message classes do not carry a per-instance dict """
+        message = GetDeviceScheduledStateMessage(logger=self.log)
+        self.assertFalse(hasattr(message, '__dict__'))
+
+
+if __name__ == "__main__":
+    unittest.main()
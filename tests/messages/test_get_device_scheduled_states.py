@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+""" test_get_device_scheduled_states.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import copy
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.messages.get_device_scheduled_states import GetDeviceScheduledStatesMessage
+from bob_schedule_service.messages.get_device_scheduled_states_ack import GetDeviceScheduledStatesMessageACK
+
+
+# Define test class ***********************************************************
+class TestGetDeviceScheduledStatesMessage(unittest.TestCase):
+    """ unittests for batched Get Device Scheduled States Message Class """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.temp_str = str()
+        super(TestGetDeviceScheduledStatesMessage, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.message = GetDeviceScheduledStatesMessage(logger=self.log)
+        super(TestGetDeviceScheduledStatesMessage, self).setUp()
+
+
+    def test_device_names(self):
+        """ test setting and getting device name list field """
+        self.message.dev_names = 'all'
+        self.assertEqual(self.message.dev_names, ['all'])
+        self.message.dev_names = ['fylt1', 101]
+        self.assertEqual(self.message.dev_names, ['fylt1', '101'])
+
+
+    def test_complete(self):
+        self.temp_str = '142,127.0.0.1,12000,192.168.5.45,13000,308,fylt1,bylt1,lrlt1'
+        self.message.complete = copy.copy(self.temp_str)
+        self.assertEqual(self.message.ref, '142')
+        self.assertEqual(self.message.source_addr, '192.168.5.45')
+        self.assertEqual(self.message.msg_type, '308')
+        self.assertEqual(self.message.dev_names, ['fylt1', 'bylt1', 'lrlt1'])
+        self.assertEqual(self.message.complete, self.temp_str)
+
+
+class TestGetDeviceScheduledStatesMessageACK(unittest.TestCase):
+    """ unittests for batched Get Device Scheduled States ACK Message Class """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.temp_str = str()
+        super(TestGetDeviceScheduledStatesMessageACK, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.message = GetDeviceScheduledStatesMessageACK(logger=self.log)
+        super(TestGetDeviceScheduledStatesMessageACK, self).setUp()
+
+
+    def test_init(self):
+        """ test class __init__ and input variables """
+        self.message = GetDeviceScheduledStatesMessageACK(
+            logger=self.log,
+            ref='101',
+            dest_addr='192.168.86.1',
+            dest_port='17061',
+            source_addr='192.168.5.4',
+            source_port='12000',
+            msg_type='309',
+            dev_states=[('fylt1', 'on'), ('bylt1', 'off')]
+        )
+        self.assertEqual(
+            self.message.complete,
+            '101,192.168.86.1,17061,192.168.5.4,12000,309,fylt1,on,bylt1,off')
+
+
+    def test_complete(self):
+        self.temp_str = '142,127.0.0.1,12000,192.168.5.45,13000,309,fylt1,on,bylt1,off'
+        self.message.complete = copy.copy(self.temp_str)
+        self.assertEqual(self.message.dev_states, [('fylt1', 'on'), ('bylt1', 'off')])
+        self.assertEqual(self.message.complete, self.temp_str)
+        # Unpaired device name is rejected
+        self.message.complete = '143,127.0.0.1,12000,192.168.5.45,13000,309,fylt1,on,bylt1'
+        self.assertEqual(self.message.ref, '142')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+""" test_get_service_stats.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import copy
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.messages.get_service_stats_ack import GetServiceStatsMessageACK
+
+
+# Define test class ***********************************************************
+class TestGetServiceStatsMessageACK(unittest.TestCase):
+    """ unittests for Get Service Stats ACK Message Class """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.temp_str = str()
+        super(TestGetServiceStatsMessageACK, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.message = GetServiceStatsMessageACK(logger=self.log)
+        super(TestGetServiceStatsMessageACK, self).setUp()
+
+
+    def test_complete(self):
+        self.temp_str = '142,127.0.0.1,12000,192.168.5.45,13000,311,' \
+                        'messages_received_total,12,queue_depth[queue=msg_in],0'
+        self.message.complete = copy.copy(self.temp_str)
+        self.assertEqual(self.message.msg_type, '311')
+        self.assertEqual(self.message.stats, [('messages_received_total', '12'),
+                                              ('queue_depth[queue=msg_in]', '0')])
+        self.assertEqual(self.message.complete, self.temp_str)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+""" test_configure.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import logging
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import unittest
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.configure import BoundedQueueHandler
+from bob_schedule_service.configure import ConfigureService
+from bob_schedule_service.configure import LogRouter
+from bob_schedule_service.multi_cal import MultiCalendarSync
+
+
+# Define test class ***********************************************************
+class TestBoundedQueueHandler(unittest.TestCase):
+    """ unittests for non-blocking queue log handler """
+
+    def setUp(self):
+        self.log_queue = queue.Queue(3)
+        self.logger = logging.getLogger('test_bounded_queue')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        super(TestBoundedQueueHandler, self).setUp()
+
+
+    def tearDown(self):
+        self.logger.handlers = []
+        super(TestBoundedQueueHandler, self).tearDown()
+
+
+    def drain(self):
+        records = []
+        while not self.log_queue.empty():
+            records.append(self.log_queue.get_nowait())
+        return records
+
+
+    def test_record_not_formatted(self):
+        """ test records are queued with their arguments still attached """
+        self.logger.addHandler(BoundedQueueHandler(self.log_queue))
+        self.logger.debug('value: %s', 5)
+        record = self.drain()[0]
+        self.assertEqual(record.msg, 'value: %s')
+        self.assertEqual(record.args, (5,))
+
+
+    def test_drop_oldest(self):
+        """ test the oldest record is discarded when the queue is full """
+        handler = BoundedQueueHandler(self.log_queue, drop_policy='oldest')
+        self.logger.addHandler(handler)
+        for i in range(5):
+            self.logger.debug('msg %s', i)
+        self.assertEqual([x.args[0] for x in self.drain()], [2, 3, 4])
+        self.assertEqual(handler.dropped, 2)
+
+
+    def test_drop_newest(self):
+        """ test new records are discarded when the queue is full and the
+        drop is reported once there is room """
+        handler = BoundedQueueHandler(self.log_queue, drop_policy='newest')
+        self.logger.addHandler(handler)
+        for i in range(5):
+            self.logger.debug('msg %s', i)
+        self.assertEqual([x.args[0] for x in self.drain()], [0, 1, 2])
+        self.assertEqual(handler.dropped, 2)
+        self.logger.debug('msg %s', 5)
+        records = self.drain()
+        self.assertEqual(records[0].levelno, logging.WARNING)
+        self.assertEqual(records[0].args, (2,))
+        self.assertEqual(records[1].args, (5,))
+
+
+class TestLogRouter(unittest.TestCase):
+    """ unittests for routed per file / function log handler """
+
+    def setUp(self):
+        self.router = LogRouter()
+        self.file_handler = logging.NullHandler()
+        self.func_handler = logging.NullHandler()
+        self.both_handler = logging.NullHandler()
+        self.all_handler = logging.NullHandler()
+        self.router.add_route(self.file_handler, file_name='goog_cal.py')
+        self.router.add_route(self.func_handler, func_name='run')
+        self.router.add_route(self.both_handler, file_name='goog_cal.py', func_name='run')
+        super(TestLogRouter, self).setUp()
+
+
+    def test_lookup(self):
+        """ test records are routed only to matching handlers """
+        self.assertEqual(self.router.lookup('goog_cal.py', 'run'),
+                         (self.both_handler, self.file_handler, self.func_handler))
+        self.assertEqual(self.router.lookup('goog_cal.py', 'refresh'), (self.file_handler,))
+        self.assertEqual(self.router.lookup('schedule.py', 'run'), (self.func_handler,))
+        self.assertEqual(self.router.lookup('schedule.py', 'build'), ())
+
+
+    def test_lookup_catch_all(self):
+        """ test a route with no file or function name matches everything
+        and invalidates cached lookups """
+        self.assertEqual(self.router.lookup('schedule.py', 'build'), ())
+        self.router.add_route(self.all_handler)
+        self.assertEqual(self.router.lookup('schedule.py', 'build'), (self.all_handler,))
+
+
+    def test_emit_level(self):
+        """ test handler levels are respected """
+        records = []
+        self.file_handler.handle = records.append
+        self.file_handler.setLevel(logging.INFO)
+        for level in [logging.DEBUG, logging.INFO]:
+            self.router.handle(logging.makeLogRecord({
+                'filename': 'goog_cal.py', 'funcName': 'refresh', 'levelno': level}))
+        self.assertEqual([x.levelno for x in records], [logging.INFO])
+
+
+class TestConfigureLogger(unittest.TestCase):
+    """ unittests for queued logging configuration """
+
+    def setUp(self):
+        self.log_path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.log_path, 'config.ini')
+        with open(self.filename, 'w') as config:
+            config.write('[LOG FILES]\n'
+                         'log_file_path = %s\n'
+                         'queue_logging = yes\n'
+                         'queue_size = 100\n\n'
+                         '[EXTRA LOG HANDLERS]\n'
+                         'h01 = test_configure.py\n' % self.log_path)
+        self.config = ConfigureService(self.filename)
+        super(TestConfigureLogger, self).setUp()
+
+
+    def tearDown(self):
+        self.config.close_logger()
+        for handler in self.config.handlers:
+            handler.close()
+        self.config.logger.handlers = []
+        shutil.rmtree(self.log_path)
+        super(TestConfigureLogger, self).tearDown()
+
+
+    def test_queue_logging(self):
+        """ test records reach the file handlers through the listener """
+        logger = self.config.get_logger()
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIsInstance(logger.handlers[0], BoundedQueueHandler)
+        logger.debug('queued %s', 'record')
+        self.config.close_logger()
+        with open(os.path.join(self.log_path, 'test_configure.py.log')) as log_file:
+            self.assertIn('queued record', log_file.read())
+
+
+    def test_restart_log_listener(self):
+        """ test a restarted listener gets its own queue and handler and
+        doesn't write records left on the old queue """
+        logger = self.config.get_logger()
+        old_handler = logger.handlers[0]
+        self.config.log_listener.stop()
+        logger.debug('stale %s', 'record')
+        self.config.restart_log_listener()
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIsNot(logger.handlers[0], old_handler)
+        self.assertIsNot(logger.handlers[0].queue, old_handler.queue)
+        self.assertEqual(self.config.log_queue.maxsize, 100)
+        logger.debug('fresh %s', 'record')
+        self.config.close_logger()
+        with open(os.path.join(self.log_path, 'test_configure.py.log')) as log_file:
+            text = log_file.read()
+        self.assertIn('fresh record', text)
+        self.assertNotIn('stale record', text)
+
+
+class TestConfigureSchedule(unittest.TestCase):
+    """ unittests for calendar configuration """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'config.ini')
+        self.cred_filename = os.path.join(self.temp_dir, 'credentials.ini')
+        with open(self.filename, 'w') as config:
+            config.write('[LOG FILES]\n'
+                         'log_file_path = %s\n\n'
+                         '[EXTRA LOG HANDLERS]\n\n'
+                         '[CREDENTIALS]\n'
+                         'file = %s\n\n'
+                         '[CALENDAR]\n'
+                         'credential_dir = %s\n'
+                         'client_secret_file = client_secret.json\n'
+                         'backend = fake\n'
+                         'fake_event_count = 10\n'
+                         % (self.temp_dir, self.cred_filename, self.temp_dir))
+        self.config = ConfigureService(self.filename)
+        self.config.get_logger()
+        super(TestConfigureSchedule, self).setUp()
+
+
+    def tearDown(self):
+        for handler in self.config.handlers:
+            handler.close()
+        self.config.logger.handlers = []
+        shutil.rmtree(self.temp_dir)
+        super(TestConfigureSchedule, self).tearDown()
+
+
+    def write_cal_id(self, cal_id):
+        with open(self.cred_filename, 'w') as cred_file:
+            cred_file.write('[GOOGLE]\ncal_id = %s\n' % cal_id)
+        self.config.get_credentials()
+
+
+    def test_single_calendar(self):
+        """ test one calendar ID builds a single calendar sync """
+        self.write_cal_id('home')
+        schedule = self.config.get_schedule()
+        self.assertNotIsInstance(schedule, MultiCalendarSync)
+        self.assertEqual(schedule.cal_id, 'home')
+        self.assertEqual(len(schedule.schedule), 10)
+
+
+    def test_calendar_list(self):
+        """ test a comma separated list of IDs builds a merged schedule """
+        self.write_cal_id('upstairs, downstairs')
+        schedule = self.config.get_schedule()
+        self.assertIsInstance(schedule, MultiCalendarSync)
+        self.assertEqual(schedule.cal_ids, ['upstairs', 'downstairs'])
+        self.assertEqual(len(schedule.schedule), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
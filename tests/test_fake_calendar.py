@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+""" test_fake_calendar.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from apiclient import errors
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.fake_calendar import event_end
+from bob_schedule_service.fake_calendar import FakeCalendarService
+from bob_schedule_service.fake_calendar import generate_events
+from bob_schedule_service.goog_cal import GoogleCalSync
+
+
+# Define test class ***********************************************************
+class TestFakeCalendarService(unittest.TestCase):
+    """ unittests for fake calendar API backend """
+
+    def setUp(self):
+        self.service = FakeCalendarService(event_count=30, devices=['a', 'b'])
+        super(TestFakeCalendarService, self).setUp()
+
+
+    def read_all(self, **kwargs):
+        """ follows nextPageToken like GoogleCalSync.read_pages """
+        items = []
+        while True:
+            result = self.service.events().list(
+                calendarId='fake', maxResults=8, **kwargs).execute()
+            items.extend(result['items'])
+            if 'nextPageToken' not in result:
+                return items, result['nextSyncToken']
+            kwargs['pageToken'] = result['nextPageToken']
+
+
+    def test_generate_events(self):
+        """ test events alternate between devices and carry UTC offsets """
+        events = generate_events(4, devices=['a', 'b'])
+        self.assertEqual([x['summary'] for x in events], ['a', 'b', 'a', 'b'])
+        self.assertEqual(len(set(x['id'] for x in events)), 4)
+        self.assertIsNotNone(event_end(events[0]).tzinfo)
+
+
+    def test_event_end(self):
+        """ test end times with and without offsets """
+        utc = datetime.timezone.utc
+        self.assertEqual(
+            event_end({'end': {'dateTime': '2017-06-01T18:00:00-05:00'}}),
+            datetime.datetime(2017, 6, 1, 23, 0, tzinfo=utc))
+        self.assertEqual(
+            event_end({'end': {'dateTime': '2017-06-01T18:00:00.000Z'}}),
+            datetime.datetime(2017, 6, 1, 18, 0, tzinfo=utc))
+
+
+    def test_paging(self):
+        """ test results are paged and every event is returned once """
+        items, sync_token = self.read_all()
+        self.assertEqual(len(items), 30)
+        self.assertEqual(len(set(x['id'] for x in items)), 30)
+        self.assertEqual(self.service.calls, 4)
+        self.assertEqual(sync_token, 'sync-30')
+
+
+    def test_max_page_size(self):
+        """ test maxResults is capped by the backend page size """
+        self.service.max_page_size = 5
+        self.read_all()
+        self.assertEqual(self.service.calls, 6)
+
+
+    def test_time_min(self):
+        """ test full reads leave out events that have already ended """
+        time_min = (datetime.datetime.utcnow() + datetime.timedelta(hours=12))
+        items, _ = self.read_all(timeMin=time_min.isoformat() + 'Z')
+        self.assertTrue(0 < len(items) < 30)
+        self.assertTrue(all(event_end(x) > time_min.replace(
+            tzinfo=datetime.timezone.utc) for x in items))
+
+
+    def test_sync_token(self):
+        """ test incremental reads return only changed and cancelled events """
+        _, sync_token = self.read_all()
+        items, sync_token = self.read_all(syncToken=sync_token)
+        self.assertEqual(items, [])
+        changed = dict(self.service.event_map['evt000003'], summary='c')
+        self.service.put(changed)
+        self.service.cancel('evt000004')
+        items, new_token = self.read_all(syncToken=sync_token)
+        self.assertEqual([(x['id'], x.get('summary'), x['status']) for x in items],
+                         [('evt000003', 'c', 'confirmed'),
+                          ('evt000004', None, 'cancelled')])
+        self.assertNotEqual(new_token, sync_token)
+        items, _ = self.read_all()
+        self.assertEqual(len(items), 29)
+
+
+    def test_expired_sync_token(self):
+        """ test expired sync tokens fail with HTTP 410 """
+        _, sync_token = self.read_all()
+        self.service.expire_sync_tokens()
+        with self.assertRaises(errors.HttpError) as context:
+            self.read_all(syncToken=sync_token)
+        self.assertEqual(context.exception.resp.status, 410)
+
+
+    def test_fail_next(self):
+        """ test queued errors are raised once each """
+        self.service.fail_next(500, count=2)
+        for _ in range(2):
+            with self.assertRaises(errors.HttpError) as context:
+                self.read_all()
+            self.assertEqual(context.exception.resp.status, 500)
+        items, _ = self.read_all()
+        self.assertEqual(len(items), 30)
+
+
+    def test_error_rate(self):
+        """ test random errors at the configured rate """
+        service = FakeCalendarService(event_count=1, error_rate=1.0)
+        with self.assertRaises(errors.HttpError):
+            service.events().list(calendarId='fake').execute()
+
+
+class TestGoogleCalSyncBackend(unittest.TestCase):
+    """ unittests for calendar sync against the fake backend """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.service = FakeCalendarService(event_count=20, devices=['a', 'b'])
+        self.cal = GoogleCalSync(cal_id='fake', credential_dir=self.temp_dir.name,
+                                 backend=self.service)
+        super(TestGoogleCalSyncBackend, self).setUp()
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super(TestGoogleCalSyncBackend, self).tearDown()
+
+
+    def test_full_sync(self):
+        """ test the schedule is built from the backend at startup """
+        self.assertIs(self.cal.get_service(), self.service)
+        self.assertEqual(len(self.cal.event_store), 20)
+        self.assertTrue(self.cal.check_schedule('a'))
+
+
+    def test_incremental_and_expired_sync(self):
+        """ test later reads use sync tokens and recover from expiry """
+        self.service.cancel('evt000000')
+        self.cal.update_schedule()
+        self.assertEqual(len(self.cal.event_store), 19)
+        self.assertFalse(self.cal.check_schedule('a'))
+        self.service.expire_sync_tokens()
+        self.cal.update_schedule()
+        self.assertEqual(len(self.cal.event_store), 19)
+
+
+    def test_last_event_deleted(self):
+        """ test a read leaving no events still rebuilds the schedule """
+        service = FakeCalendarService(event_count=1, devices=['a', 'b'])
+        cal = GoogleCalSync(cal_id='fake', credential_dir=self.temp_dir.name,
+                            backend=service)
+        self.assertTrue(cal.check_schedule('a'))
+        last_run = cal._last_run
+        service.cancel('evt000000')
+        cal.update_schedule()
+        self.assertEqual(cal.event_store, {})
+        self.assertEqual(cal.schedule, [])
+        self.assertFalse(cal.check_schedule('a'))
+        self.assertGreater(cal._last_run, last_run)
+
+
+class TestGoogleCalSyncRefresh(unittest.TestCase):
+    """ unittests for background refreshes against a slow backend """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.service = FakeCalendarService(event_count=20, devices=['a', 'b'])
+        self.cal = GoogleCalSync(cal_id='fake', credential_dir=self.temp_dir.name,
+                                 backend=self.service)
+        self.service.latency = 0.2
+        self.default_loop = asyncio.get_event_loop()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        super(TestGoogleCalSyncRefresh, self).setUp()
+
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(self.default_loop)
+        self.temp_dir.cleanup()
+        super(TestGoogleCalSyncRefresh, self).tearDown()
+
+
+    def make_stale(self):
+        """ backdates the last read so the next lookup starts a refresh """
+        self.cal._last_run -= datetime.timedelta(hours=2)
+        self.cal._last_attempt -= datetime.timedelta(hours=2)
+
+
+    def test_lookup_during_refresh(self):
+        """ test lookups answer from the old snapshot while a slow read
+        runs, and from the new one once it completes """
+        self.service.cancel('evt000000')
+        self.make_stale()
+
+        @asyncio.coroutine
+        def lookup():
+            self.assertTrue(self.cal.check_schedule('a'))
+            task = self.cal.refresh_task
+            self.assertIsNotNone(task)
+            yield from asyncio.sleep(0.05)
+            self.assertFalse(task.done())
+            self.assertTrue(self.cal.check_schedule('a'))
+            yield from task
+
+        self.loop.run_until_complete(lookup())
+        self.assertIsNone(self.cal.refresh_task)
+        self.assertFalse(self.cal.check_schedule('a'))
+
+
+    def test_single_refresh(self):
+        """ test only one refresh runs at a time """
+        self.make_stale()
+        calls = self.service.calls
+
+        @asyncio.coroutine
+        def refresh():
+            self.cal.request_refresh()
+            task = self.cal.refresh_task
+            self.cal._last_attempt -= self.cal.retry_interval
+            for _ in range(3):
+                self.cal.request_refresh()
+                self.assertIs(self.cal.refresh_task, task)
+            yield from task
+
+        self.loop.run_until_complete(refresh())
+        self.assertEqual(self.service.calls, calls + 1)
+
+
+    def test_failed_refresh(self):
+        """ test a failed read keeps the last schedule """
+        self.service.cancel('evt000000')
+        self.make_stale()
+        schedule, last_run = self.cal.schedule, self.cal._last_run
+        self.service.fail_next(503)
+
+        @asyncio.coroutine
+        def refresh():
+            self.cal.request_refresh()
+            yield from self.cal.refresh_task
+
+        with self.assertLogs(self.cal.logger, logging.ERROR):
+            self.loop.run_until_complete(refresh())
+        self.assertIsNone(self.cal.refresh_task)
+        self.assertIs(self.cal.schedule, schedule)
+        self.assertEqual(self.cal._last_run, last_run)
+        self.assertTrue(self.cal.index.is_active('a', datetime.datetime.now()))
+
+
+    def test_retry_interval(self):
+        """ test a failed refresh is only retried after retry_interval """
+        self.make_stale()
+        self.service.fail_next(503)
+
+        @asyncio.coroutine
+        def refresh():
+            self.cal.request_refresh()
+            if self.cal.refresh_task is not None:
+                yield from self.cal.refresh_task
+
+        with self.assertLogs(self.cal.logger, logging.ERROR):
+            self.loop.run_until_complete(refresh())
+        calls = self.service.calls
+        self.loop.run_until_complete(refresh())
+        self.assertEqual(self.service.calls, calls)
+        self.cal._last_attempt -= self.cal.retry_interval
+        self.loop.run_until_complete(refresh())
+        self.assertEqual(self.service.calls, calls + 1)
+        self.assertFalse(self.cal.should_rerun())
+
+
+class TestGoogleCalSyncRecurring(unittest.TestCase):
+    """ unittests for local expansion of recurring events """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.service = FakeCalendarService(recurring_count=2, devices=['a', 'b'])
+        self.master = self.service.event_map['rec000000']
+        self.start = datetime.datetime.strptime(
+            self.master['start']['dateTime'][:16], '%Y-%m-%dT%H:%M')
+        super(TestGoogleCalSyncRecurring, self).setUp()
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super(TestGoogleCalSyncRecurring, self).tearDown()
+
+
+    def make(self, **kwargs):
+        return GoogleCalSync(
+            cal_id='fake', credential_dir=self.temp_dir.name, backend=self.service,
+            expand_recurring=True, recurrence_horizon=datetime.timedelta(days=3),
+            **kwargs)
+
+
+    def instance(self, day, **fields):
+        """ returns an exception instance of the first master for the
+        occurrence day days after its first """
+        when = (self.start + datetime.timedelta(days=day)).astimezone()
+        event = {'id': 'rec000000_%s' % day, 'status': 'confirmed',
+                 'recurringEventId': 'rec000000',
+                 'originalStartTime': {'dateTime': when.isoformat()}}
+        event.update(fields)
+        return event
+
+
+    def test_expand(self):
+        """ test masters are stored and expanded up to the horizon """
+        cal = self.make()
+        self.assertEqual(sorted(cal.event_store), ['rec000000', 'rec000001'])
+        self.assertEqual(self.service.calls, 1)
+        starts = [x.start for x in cal.sched_by_name('a')]
+        self.assertEqual(starts, [self.start + datetime.timedelta(days=x)
+                                  for x in range(4)])
+        self.assertTrue(cal.check_schedule('a'))
+
+
+    def test_instances_match(self):
+        """ test expansion gives the same schedule as reading instances """
+        expanded = [(x.start, x.end) for x in self.make().sched_by_name('b')]
+        instances = [(x.start, x.end) for x in GoogleCalSync(
+            cal_id='fake', credential_dir=self.temp_dir.name,
+            backend=self.service).sched_by_name('b')]
+        self.assertEqual(expanded, instances[:len(expanded)])
+
+
+    def test_cancelled_and_moved_instances(self):
+        """ test cancelled instances are skipped and moved ones replaced """
+        cal = self.make()
+        self.service.put(self.instance(1, status='cancelled'))
+        moved = self.start + datetime.timedelta(days=2, hours=3)
+        self.service.put(self.instance(
+            2, summary='a',
+            start={'dateTime': moved.astimezone().isoformat()},
+            end={'dateTime': (moved + datetime.timedelta(hours=2)).astimezone().isoformat()}))
+        cal.update_schedule()
+        self.assertEqual(len(cal.event_store), 4)
+        starts = [x.start for x in cal.sched_by_name('a')]
+        self.assertEqual(starts, [self.start, moved,
+                                  self.start + datetime.timedelta(days=3)])
+
+
+    def test_unsupported_rule(self):
+        """ test unsupported rules fall back to the first occurrence """
+        self.service.put(dict(self.master, recurrence=['RRULE:FREQ=HOURLY']))
+        cal = self.make()
+        self.assertEqual([x.start for x in cal.sched_by_name('a')], [self.start])
+
+
+    def test_snapshot(self):
+        """ test recurrence survives the snapshot file """
+        snapshot_file = os.path.join(self.temp_dir.name, 'snapshot.json')
+        self.service.put(self.instance(1, status='cancelled'))
+        cal = self.make(snapshot_file=snapshot_file)
+        calls = self.service.calls
+        loaded = self.make(snapshot_file=snapshot_file)
+        self.assertEqual(self.service.calls, calls)
+        self.assertEqual(loaded.event_store, cal.event_store)
+        self.assertEqual([x.start for x in loaded.sched_by_name('a')],
+                         [x.start for x in cal.sched_by_name('a')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+""" test_msg_processing.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.msg_processing import process_get_device_scheduled_states_msg
+from bob_schedule_service.msg_processing import process_subscribe_device_scheduled_state_msg
+from bob_schedule_service.tools.ref_num import RefNum
+
+
+# Define test class ***********************************************************
+class DeviceList(object):
+    """ schedule stand-in with a fixed set of devices, every other one
+    scheduled on """
+    def __init__(self, count):
+        self.dev_names = ['device%02d' % i for i in range(count)]
+        self.index = self
+
+    def names(self):
+        return self.dev_names
+
+    def check_schedule(self, name):
+        return name in self.dev_names and self.dev_names.index(name) % 2 == 0
+
+
+class SubscriptionRecorder(object):
+    """ transition scheduler stand-in that keeps every subscription """
+    def __init__(self):
+        self.calls = []
+
+    def subscribe(self, addr, port, dev_name):
+        self.calls.append((addr, port, dev_name))
+
+
+class TestMsgProcessing(unittest.TestCase):
+    """ unittests for request validation in the message processors """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.message_types = {'get_device_scheduled_states_ack': '309',
+                              'subscribe_device_scheduled_state_ack': '305'}
+        super(TestMsgProcessing, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.schedule = DeviceList(3)
+        self.scheduler = SubscriptionRecorder()
+        super(TestMsgProcessing, self).setUp()
+
+
+    def test_device_states(self):
+        """ test a valid batched query gets one reply for every device """
+        replies = process_get_device_scheduled_states_msg(
+            self.log, RefNum(), self.schedule,
+            '101,127.0.0.1,27051,127.0.0.1,27001,308,device00,device01',
+            self.message_types)
+        self.assertEqual(replies, ['101,127.0.0.1,27001,127.0.0.1,27051,309,'
+                                   'device00,on,device01,off'])
+
+
+    def test_device_states_invalid(self):
+        """ test malformed batched queries are ignored """
+        for msg in ['1,2,3,4,5,308',
+                    '101,127.0.0.1,27051,127.0.0.1,port,308,all',
+                    '101,127.0.0.1,27051,127.0.0.1,27001,308',
+                    '101,127.0.0.1,27051,127.0.0.1,27001,308,device00,']:
+            self.assertEqual(process_get_device_scheduled_states_msg(
+                self.log, RefNum(), self.schedule, msg, self.message_types), [])
+
+
+    def test_subscribe(self):
+        """ test a valid subscription is registered and answered """
+        replies = process_subscribe_device_scheduled_state_msg(
+            self.log, RefNum(), self.schedule, self.scheduler,
+            '101,127.0.0.1,27051,127.0.0.1,27001,304,device00', self.message_types)
+        self.assertEqual(self.scheduler.calls, [('127.0.0.1', '27001', 'device00')])
+        self.assertEqual(replies, ['101,127.0.0.1,27001,127.0.0.1,27051,305,'
+                                   'device00,on'])
+
+
+    def test_subscribe_invalid(self):
+        """ test malformed subscriptions are neither registered nor
+        answered """
+        for msg in ['101,127.0.0.1,27051,127.0.0.1,27001,304',
+                    '101,127.0.0.1,27051,127.0.0.1,,304,device00',
+                    '101,127.0.0.1,27051,127.0.0.1,27001,304,',
+                    '1,2,3,4,5,304,device00']:
+            self.assertEqual(process_subscribe_device_scheduled_state_msg(
+                self.log, RefNum(), self.schedule, self.scheduler, msg,
+                self.message_types), [])
+        self.assertEqual(self.scheduler.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
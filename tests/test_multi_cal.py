@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+""" test_multi_cal.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import os
+import sys
+import tempfile
+import time
+import unittest
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.fake_calendar import FakeCalendarService
+from bob_schedule_service.multi_cal import calendar_snapshot_file
+from bob_schedule_service.multi_cal import MultiCalendarSync
+
+
+# Define test class ***********************************************************
+class TestMultiCalendarSync(unittest.TestCase):
+    """ unittests for merged multi-calendar schedule """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.backends = {
+            'upstairs': FakeCalendarService(event_count=6, devices=['br1lt1', 'br2lt1']),
+            'downstairs': FakeCalendarService(event_count=6, devices=['lrlt1', 'fylt1'])}
+        super(TestMultiCalendarSync, self).setUp()
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super(TestMultiCalendarSync, self).tearDown()
+
+
+    def make(self, **kwargs):
+        return MultiCalendarSync(['upstairs', 'downstairs'],
+                                 credential_dir=self.temp_dir.name,
+                                 backends=self.backends, **kwargs)
+
+
+    def test_merged_index(self):
+        """ test devices from every calendar are in one index """
+        cal = self.make()
+        self.assertEqual(sorted(cal.index.names()),
+                         ['br1lt1', 'br2lt1', 'fylt1', 'lrlt1'])
+        self.assertEqual(len(cal.schedule), 12)
+        self.assertTrue(cal.check_schedule('br1lt1'))
+        self.assertTrue(cal.check_schedule('lrlt1'))
+        self.assertEqual(len(cal.sched_by_name('fylt1')), 3)
+
+
+    def test_parallel_read(self):
+        """ test calendars are read at the same time """
+        for backend in self.backends.values():
+            backend.latency = 0.2
+        start = time.perf_counter()
+        self.make()
+        self.assertLess(time.perf_counter() - start, 0.35)
+
+
+    def test_failing_calendar(self):
+        """ test a failing calendar doesn't stop the others being used """
+        self.backends['downstairs'].fail_next(500)
+        cal = self.make()
+        self.assertEqual(sorted(cal.index.names()), ['br1lt1', 'br2lt1'])
+        cal.update_schedule()
+        self.assertEqual(len(cal.index.names()), 4)
+
+
+    def test_refresh_merges(self):
+        """ test one calendar refreshing rebuilds the merged index """
+        cal = self.make()
+        calls = []
+        cal.refresh_callbacks.append(lambda: calls.append(cal.index))
+        index = cal.index
+        self.backends['upstairs'].cancel('evt000000')
+        cal.calendars[0].update_schedule()
+        self.assertEqual(len(calls), 1)
+        self.assertIsNot(cal.index, index)
+        self.assertFalse(cal.check_schedule('br1lt1'))
+        self.assertTrue(cal.check_schedule('lrlt1'))
+
+
+    def test_snapshot_files(self):
+        """ test each calendar gets its own snapshot file """
+        snapshot_file = os.path.join(self.temp_dir.name, 'snapshot.json')
+        names = [calendar_snapshot_file(snapshot_file, cal_id)
+                 for cal_id in ['upstairs', 'downstairs']]
+        self.assertNotEqual(names[0], names[1])
+        self.assertTrue(all(x.endswith('.json') for x in names))
+        self.make(snapshot_file=snapshot_file)
+        self.assertTrue(all(os.path.exists(x) for x in names))
+        # Restarting loads the snapshots instead of reading the calendars
+        calls = [x.calls for x in self.backends.values()]
+        cal = self.make(snapshot_file=snapshot_file)
+        self.assertEqual([x.calls for x in self.backends.values()], calls)
+        self.assertEqual(len(cal.schedule), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+""" test_recurrence.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import datetime
+import itertools
+import os
+import sys
+import unittest
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.recurrence import occurrences
+from bob_schedule_service.recurrence import parse_ical_datetime
+from bob_schedule_service.recurrence import parse_recurrence
+
+
+# Define test class ***********************************************************
+class TestRecurrence(unittest.TestCase):
+    """ unittests for recurring event expansion """
+
+    def setUp(self):
+        # Thursday
+        self.start = datetime.datetime(2017, 6, 1, 18, 0)
+        super(TestRecurrence, self).setUp()
+
+
+    def expand(self, lines, count=None, after=None):
+        rule, exdates = parse_recurrence(lines)
+        return list(itertools.islice(
+            occurrences(self.start, rule, exdates, after=after), count))
+
+
+    def test_parse_ical_datetime(self):
+        """ test date, local date-time and UTC date-time values """
+        self.assertEqual(parse_ical_datetime('20170601'),
+                         datetime.datetime(2017, 6, 1))
+        self.assertEqual(parse_ical_datetime('20170601T180000'),
+                         datetime.datetime(2017, 6, 1, 18, 0))
+        self.assertEqual(
+            parse_ical_datetime('20170601T180000Z'),
+            datetime.datetime(2017, 6, 1, 18, 0, tzinfo=datetime.timezone.utc)
+            .astimezone().replace(tzinfo=None))
+
+
+    def test_parse_recurrence(self):
+        """ test RRULE and EXDATE lines are split up """
+        rule, exdates = parse_recurrence([
+            'RRULE:FREQ=WEEKLY;BYDAY=MO,WE',
+            'EXDATE;TZID=America/Chicago:20170605T180000,20170607T180000'])
+        self.assertEqual(rule, {'FREQ': 'WEEKLY', 'BYDAY': 'MO,WE'})
+        self.assertEqual(exdates, {datetime.datetime(2017, 6, 5, 18, 0),
+                                   datetime.datetime(2017, 6, 7, 18, 0)})
+
+
+    def test_parse_unsupported(self):
+        """ test rules that can't be expanded are rejected """
+        for lines in [['RRULE:FREQ=HOURLY'],
+                      ['RRULE:FREQ=MONTHLY;BYDAY=1MO'],
+                      ['RRULE:FREQ=DAILY;BYHOUR=5'],
+                      ['RRULE:FREQ=DAILY', 'RDATE:20170610T180000'],
+                      ['EXDATE:20170610T180000']]:
+            with self.assertRaises(ValueError):
+                parse_recurrence(lines)
+
+
+    def test_daily(self):
+        """ test daily rule with interval and count """
+        self.assertEqual(
+            self.expand(['RRULE:FREQ=DAILY;INTERVAL=2;COUNT=3']),
+            [datetime.datetime(2017, 6, 1, 18, 0),
+             datetime.datetime(2017, 6, 3, 18, 0),
+             datetime.datetime(2017, 6, 5, 18, 0)])
+
+
+    def test_until_and_exdate(self):
+        """ test UNTIL ends the series and EXDATEs are skipped """
+        self.assertEqual(
+            self.expand(['RRULE:FREQ=DAILY;UNTIL=20170604T235959',
+                         'EXDATE:20170602T180000']),
+            [datetime.datetime(2017, 6, 1, 18, 0),
+             datetime.datetime(2017, 6, 3, 18, 0),
+             datetime.datetime(2017, 6, 4, 18, 0)])
+
+
+    def test_exdate_counts(self):
+        """ test excluded instances still count towards COUNT """
+        self.assertEqual(
+            len(self.expand(['RRULE:FREQ=DAILY;COUNT=3', 'EXDATE:20170602T180000'])), 2)
+
+
+    def test_weekly(self):
+        """ test weekly rule on several days, starting mid-week """
+        self.assertEqual(
+            self.expand(['RRULE:FREQ=WEEKLY;BYDAY=MO,TH,FR'], count=4),
+            [datetime.datetime(2017, 6, 1, 18, 0),
+             datetime.datetime(2017, 6, 2, 18, 0),
+             datetime.datetime(2017, 6, 5, 18, 0),
+             datetime.datetime(2017, 6, 8, 18, 0)])
+
+
+    def test_monthly(self):
+        """ test monthly rule skips months without the day """
+        self.start = datetime.datetime(2017, 1, 31, 18, 0)
+        self.assertEqual(
+            [x.date() for x in self.expand(['RRULE:FREQ=MONTHLY'], count=3)],
+            [datetime.date(2017, 1, 31), datetime.date(2017, 3, 31),
+             datetime.date(2017, 5, 31)])
+        self.assertEqual(
+            [x.date() for x in self.expand(['RRULE:FREQ=MONTHLY;BYMONTHDAY=-1'], count=2)],
+            [datetime.date(2017, 1, 31), datetime.date(2017, 2, 28)])
+
+
+    def test_yearly(self):
+        """ test yearly rule """
+        self.assertEqual(
+            [x.year for x in self.expand(['RRULE:FREQ=YEARLY;COUNT=2'])], [2017, 2018])
+
+
+    def test_after(self):
+        """ test expansion starts at after, without stepping through the
+        earlier part of the series """
+        after = datetime.datetime(2027, 6, 10, 12, 0)
+        self.assertEqual(
+            self.expand(['RRULE:FREQ=WEEKLY;BYDAY=TU,TH'], count=2, after=after),
+            [datetime.datetime(2027, 6, 10, 18, 0),
+             datetime.datetime(2027, 6, 15, 18, 0)])
+        self.assertEqual(
+            self.expand(['RRULE:FREQ=DAILY;COUNT=5'], after=datetime.datetime(2017, 6, 4)),
+            [datetime.datetime(2017, 6, 4, 18, 0), datetime.datetime(2017, 6, 5, 18, 0)])
+
+
+    def test_never_matches(self):
+        """ test a rule that can never produce an instance ends """
+        self.start = datetime.datetime(2017, 2, 1, 18, 0)
+        self.assertEqual(
+            self.expand(['RRULE:FREQ=MONTHLY;INTERVAL=12;BYMONTHDAY=30']), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+""" test_schedule.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import datetime
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.schedule import Sched
+from bob_schedule_service.schedule import SchedIndex
+
+
+# Define test class ***********************************************************
+class TestSchedIndex(unittest.TestCase):
+    """ unittests for Schedule Index Class """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.day = datetime.date(2017, 6, 1)
+        super(TestSchedIndex, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.schedule = [
+            Sched(logger=self.log, name='fylt1',
+                  start=self.at(18, 0), end=self.at(23, 0)),
+            Sched(logger=self.log, name='fylt1',
+                  start=self.at(5, 0), end=self.at(7, 0)),
+            Sched(logger=self.log, name='br1lt1',
+                  start=self.at(6, 0), end=self.at(22, 0)),
+            Sched(logger=self.log, name='br1lt1',
+                  start=self.at(7, 0), end=self.at(8, 0)),
+            Sched(logger=self.log, name='lrlt1',
+                  start=self.at(23, 0), end=self.at(1, 0, days=1))
+        ]
+        self.index = SchedIndex(self.schedule, logger=self.log)
+        super(TestSchedIndex, self).setUp()
+
+
+    def at(self, hour, minute, days=0):
+        return datetime.datetime.combine(
+            self.day + datetime.timedelta(days=days),
+            datetime.time(hour, minute))
+
+
+    def test_names(self):
+        """ test index is keyed by device name """
+        self.assertEqual(sorted(self.index.names()), ['br1lt1', 'fylt1', 'lrlt1'])
+
+
+    def test_by_name(self):
+        """ test records for a device are returned sorted by start """
+        result = self.index.by_name('fylt1')
+        self.assertEqual([x.start for x in result], [self.at(5, 0), self.at(18, 0)])
+        self.assertEqual(self.index.by_name('unknown'), [])
+
+
+    def test_by_date(self):
+        """ test records are returned for every device active on a date """
+        result = self.index.by_date(self.day)
+        self.assertEqual(len(result), 5)
+        self.assertEqual(result[0].start, self.at(5, 0))
+        result = self.index.by_date(self.day + datetime.timedelta(days=1))
+        self.assertEqual([x.name for x in result], ['lrlt1'])
+        self.assertEqual(self.index.by_date(self.day + datetime.timedelta(days=2)), [])
+
+
+    def test_is_active(self):
+        """ test point-in-time lookups against intervals """
+        self.assertEqual(self.index.is_active('fylt1', self.at(4, 59)), False)
+        self.assertEqual(self.index.is_active('fylt1', self.at(5, 0)), True)
+        self.assertEqual(self.index.is_active('fylt1', self.at(7, 0)), True)
+        self.assertEqual(self.index.is_active('fylt1', self.at(7, 1)), False)
+        self.assertEqual(self.index.is_active('fylt1', self.at(20, 0)), True)
+        self.assertEqual(self.index.is_active('unknown', self.at(20, 0)), False)
+
+
+    def test_is_active_overlap(self):
+        """ test a short interval nested inside a longer one does not hide
+        the longer one """
+        self.assertEqual(self.index.is_active('br1lt1', self.at(9, 0)), True)
+        self.assertEqual(self.index.is_active('br1lt1', self.at(22, 1)), False)
+
+
+    def test_state_at(self):
+        """ test state lookups report how long the state is valid for """
+        self.assertEqual(self.index.state_at('fylt1', self.at(6, 0)),
+                         (True, self.at(7, 0) + datetime.timedelta(microseconds=1)))
+        self.assertEqual(self.index.state_at('fylt1', self.at(12, 0)),
+                         (False, self.at(18, 0)))
+        self.assertEqual(self.index.state_at('fylt1', self.at(23, 30)), (False, None))
+        self.assertEqual(self.index.state_at('unknown', self.at(12, 0)), (False, None))
+
+
+    def test_state_at_cache(self):
+        """ test cached state is only reused inside its validity period """
+        self.assertEqual(self.index.state_at('fylt1', self.at(12, 0))[0], False)
+        self.assertEqual(self.index.state_at('fylt1', self.at(13, 0))[0], False)
+        self.assertEqual(self.index.state_at('fylt1', self.at(18, 0))[0], True)
+        self.assertEqual(self.index.state_at('fylt1', self.at(6, 0))[0], True)
+
+
+    def test_next_transition(self):
+        """ test next state change lookups with merged overlapping items """
+        self.assertEqual(self.index.next_transition('br1lt1', self.at(0, 0)),
+                         (self.at(6, 0), True))
+        self.assertEqual(self.index.next_transition('br1lt1', self.at(7, 30)),
+                         (self.at(22, 0) + datetime.timedelta(microseconds=1), False))
+        self.assertEqual(self.index.next_transition('br1lt1', self.at(23, 0)), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+""" test_service_main.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.service_main import MainTask
+from bob_schedule_service.tools.log_sampling import SampledLogger
+from bob_schedule_service.tools.ref_num import RefNum
+
+
+# Define test class ***********************************************************
+class BrokenSchedule(object):
+    """ schedule stand-in whose lookups fail for one device """
+    def check_schedule(self, name=None):
+        if name == 'broken':
+            raise KeyError(name)
+        return True
+
+
+class TestMainTask(unittest.TestCase):
+    """ unittests for the service main task """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.message_types = {
+            'heartbeat': '100', 'heartbeat_ack': '101',
+            'get_device_scheduled_state': '302',
+            'get_device_scheduled_state_ack': '303',
+            'subscribe_device_scheduled_state': '304',
+            'get_device_scheduled_states': '308',
+            'get_service_stats': '310'}
+        super(TestMainTask, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.maintask = MainTask(
+            logger=self.log,
+            ref=RefNum(),
+            schedule=BrokenSchedule(),
+            msg_in_queue=asyncio.Queue(),
+            msg_out_queue=asyncio.Queue(),
+            message_types=self.message_types)
+        super(TestMainTask, self).setUp()
+
+
+    def tearDown(self):
+        self.loop.close()
+        super(TestMainTask, self).tearDown()
+
+
+    def test_handler_error(self):
+        """ test a handler error is logged and later messages are still
+        processed """
+        task = asyncio.ensure_future(self.maintask.run(), loop=self.loop)
+        for dev_name in ['broken', 'fan']:
+            self.maintask.msg_in_queue.put_nowait(
+                '101,127.0.0.1,27051,127.0.0.1,27001,302,%s' % dev_name)
+        with self.assertLogs(self.log, logging.ERROR):
+            self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertFalse(task.done())
+        self.assertEqual(self.maintask.msg_out_queue.get_nowait(),
+                         '101,127.0.0.1,27001,127.0.0.1,27051,303,fan,on')
+        self.assertEqual(self.maintask.metrics.values[('message_errors_total', ())], 1)
+        task.cancel()
+        self.loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+
+
+
+    def test_logging_totals_unknown_types(self):
+        """ test logging time for unknown message types is totalled under
+        one label """
+        self.maintask.logger = SampledLogger(self.log)
+        for msg in ['101,127.0.0.1,27051,127.0.0.1,27001,999',
+                    '101,127.0.0.1,27051,127.0.0.1,27001,abc',
+                    '101,127.0.0.1,27051,127.0.0.1,27001,302,fan']:
+            self.maintask.process_msg(msg)
+        self.assertEqual(set(self.maintask.logger.report()), {None, '302', 'other'})
+        self.assertEqual(
+            self.maintask.metrics.values[('messages_processed_total',
+                                          (('msg_type', 'other'),))], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+""" test_transitions.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import datetime
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.schedule import Sched
+from bob_schedule_service.schedule import SchedIndex
+from bob_schedule_service.tools.ref_num import RefNum
+from bob_schedule_service.transitions import TransitionScheduler
+
+
+# Define test class ***********************************************************
+class FakeSchedule(object):
+    """ minimal stand-in for GoogleCalSync exposing an index """
+    def __init__(self, index):
+        self.index = index
+        self.refresh_callbacks = []
+
+
+class TestTransitionScheduler(unittest.TestCase):
+    """ unittests for Transition Scheduler Class """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.second = datetime.timedelta(seconds=1)
+        super(TestTransitionScheduler, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.now = datetime.datetime.now()
+        self.schedule = FakeSchedule(SchedIndex([
+            Sched(name='fylt1', start=self.now + self.second / 5,
+                  end=self.now + self.second * 2 / 5),
+            Sched(name='bylt1', start=self.now - self.second,
+                  end=self.now + self.second * 3 / 5)
+        ], logger=self.log))
+        self.msg_out_queue = asyncio.Queue()
+        self.scheduler = TransitionScheduler(
+            logger=self.log,
+            ref=RefNum(logger=self.log),
+            schedule=self.schedule,
+            msg_out_queue=self.msg_out_queue,
+            service_addresses={'schedule_addr': '127.0.0.1', 'schedule_port': '27051'},
+            message_types={'device_scheduled_state_change': '306'})
+        self.task = asyncio.ensure_future(self.scheduler.run())
+        super(TestTransitionScheduler, self).setUp()
+
+
+    def tearDown(self):
+        self.task.cancel()
+        self.loop.run_until_complete(
+            asyncio.gather(self.task, return_exceptions=True))
+        self.loop.close()
+        super(TestTransitionScheduler, self).tearDown()
+
+
+    def run_for(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+        result = []
+        while not self.msg_out_queue.empty():
+            result.append(self.msg_out_queue.get_nowait().split(',', 1)[1])
+        return result
+
+
+    def test_transitions_pushed(self):
+        """ test subscribers are notified as intervals start and end """
+        self.scheduler.subscribe('127.0.0.1', '27001', 'all')
+        self.scheduler.subscribe('127.0.0.1', '27002', 'fylt1')
+        self.assertEqual(self.run_for(0.3), [
+            '127.0.0.1,27001,127.0.0.1,27051,306,fylt1,on',
+            '127.0.0.1,27002,127.0.0.1,27051,306,fylt1,on'])
+        self.assertEqual(self.run_for(0.4), [
+            '127.0.0.1,27001,127.0.0.1,27051,306,fylt1,off',
+            '127.0.0.1,27002,127.0.0.1,27051,306,fylt1,off',
+            '127.0.0.1,27001,127.0.0.1,27051,306,bylt1,off'])
+
+
+    def test_unsubscribed_device(self):
+        """ test devices without subscribers produce no messages """
+        self.scheduler.subscribe('127.0.0.1', '27002', 'fylt1')
+        self.assertEqual(len(self.run_for(0.7)), 2)
+
+
+    def test_schedule_refresh(self):
+        """ test a refreshed schedule is re-checked immediately """
+        self.scheduler.subscribe('127.0.0.1', '27001', 'lrlt1')
+        self.assertEqual(self.run_for(0.05), [])
+        self.schedule.index = SchedIndex([
+            Sched(name='lrlt1', start=self.now, end=self.now + self.second * 10)
+        ], logger=self.log)
+        self.scheduler.wakeup()
+        self.assertEqual(self.run_for(0.05), [
+            '127.0.0.1,27001,127.0.0.1,27051,306,lrlt1,on'])
+
+
+if __name__ == "__main__":
+    unittest.main()
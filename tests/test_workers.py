@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+""" test_workers.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import datetime
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import unittest
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bob_schedule_service.start_service import worker_ref_settings
+from bob_schedule_service.tools.metrics import Metrics
+from bob_schedule_service.tools.ref_num import RefNum
+from bob_schedule_service.workers import encode_frame
+from bob_schedule_service.workers import read_frame
+from bob_schedule_service.workers import report_metrics
+from bob_schedule_service.workers import SharedSchedule
+from bob_schedule_service.workers import SubscriptionForwarder
+from bob_schedule_service.workers import WorkerPool
+
+
+# Define test class ***********************************************************
+def make_entries(count, now=None):
+    """ returns count schedule entries three hours apart, the first one
+    running at now """
+    now = now or datetime.datetime.now()
+    return [('dev%s' % i, now + datetime.timedelta(hours=3 * i - 1),
+             now + datetime.timedelta(hours=3 * i + 1)) for i in range(count)]
+
+
+class SubscriptionRecorder(object):
+    """ transition scheduler stand-in that keeps every subscription """
+    def __init__(self, loop, wanted):
+        self.loop = loop
+        self.wanted = wanted
+        self.calls = []
+
+    def subscribe(self, addr, port, dev_name):
+        self.calls.append((addr, port, dev_name))
+        if len(self.calls) >= self.wanted:
+            self.loop.stop()
+
+
+def worker_main(worker_num, sock, entries):
+    """ worker that reports the size of every schedule it is given back to
+    the coordinator as a subscription """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    reader, writer = loop.run_until_complete(asyncio.open_connection(sock=sock, loop=loop))
+    forwarder = SubscriptionForwarder(writer)
+    schedule = SharedSchedule(entries)
+    def report():
+        forwarder.subscribe('worker', len(schedule.schedule), worker_num)
+    schedule.refresh_callbacks.append(report)
+    report()
+    asyncio.ensure_future(schedule.follow(reader), loop=loop)
+    loop.run_forever()
+
+
+def metrics_worker_main(worker_num, sock, entries):
+    """ worker that reports a counter of worker_num + 1 messages """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    reader, writer = loop.run_until_complete(asyncio.open_connection(sock=sock, loop=loop))
+    metrics = Metrics()
+    metrics.describe('msgs_total', 'counter', 'Messages')
+    metrics.inc('msgs_total', worker_num + 1, msg_type='302')
+    asyncio.ensure_future(report_metrics(writer, metrics, interval=0.1), loop=loop)
+    asyncio.ensure_future(SharedSchedule(entries).follow(reader), loop=loop)
+    loop.run_forever()
+
+
+def stuck_worker_main(worker_num, sock, entries):
+    """ worker that ignores SIGTERM and never exits by itself """
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    while True:
+        time.sleep(1)
+
+
+class TestWorkers(unittest.TestCase):
+    """ unittests for multi-process worker support """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        super(TestWorkers, self).setUp()
+
+
+    def tearDown(self):
+        self.loop.close()
+        super(TestWorkers, self).tearDown()
+
+
+    def test_frames(self):
+        """ test objects survive the worker link framing """
+        reader = asyncio.StreamReader(loop=self.loop)
+        entries = make_entries(3)
+        reader.feed_data(encode_frame(('schedule', entries)) +
+                         encode_frame(('subscribe', ('a', 1, 'b'))))
+        self.assertEqual(self.loop.run_until_complete(read_frame(reader)),
+                         ('schedule', entries))
+        self.assertEqual(self.loop.run_until_complete(read_frame(reader)),
+                         ('subscribe', ('a', 1, 'b')))
+
+
+    def test_shared_schedule(self):
+        """ test lookups answer from the entries loaded """
+        schedule = SharedSchedule(make_entries(2))
+        refreshed = []
+        schedule.refresh_callbacks.append(lambda: refreshed.append(True))
+        self.assertTrue(schedule.check_schedule('dev0'))
+        self.assertFalse(schedule.check_schedule('dev1'))
+        schedule.load(make_entries(3, datetime.datetime.now() - datetime.timedelta(hours=3)))
+        self.assertEqual(refreshed, [True])
+        self.assertFalse(schedule.check_schedule('dev0'))
+        self.assertTrue(schedule.check_schedule('dev1'))
+        self.assertEqual(sorted(schedule.index.names()), ['dev0', 'dev1', 'dev2'])
+
+
+    def test_follow(self):
+        """ test the worker loads schedules and stops when the link closes """
+        schedule = SharedSchedule()
+        reader = asyncio.StreamReader(loop=self.loop)
+        reader.feed_data(encode_frame(('schedule', make_entries(4))))
+        reader.feed_eof()
+        self.loop.run_until_complete(schedule.follow(reader))
+        self.assertEqual(len(schedule.schedule), 4)
+
+
+    def test_follow_after_stop(self):
+        """ test the link closing during shutdown doesn't stop the loop a
+        second time """
+        schedule = SharedSchedule()
+        reader = asyncio.StreamReader(loop=self.loop)
+        reader.feed_eof()
+        schedule.stopping = True
+        self.loop.run_until_complete(schedule.follow(reader))
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+
+    def test_stop_stuck_worker(self):
+        """ test a worker that ignores SIGTERM is killed after the timeout """
+        pool = WorkerPool(SharedSchedule(), count=1)
+        pool.start(stuck_worker_main)
+        pid = pool.pids[0]
+        time.sleep(0.1)
+        start = time.monotonic()
+        pool.stop(timeout=0.3)
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(pool.pids, [])
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+    def test_worker_refs(self):
+        """ test the coordinator and each worker number messages from
+        their own share of the refs """
+        settings = {'digits': 3, 'per_dest': True, 'ack_timeout': 30.0}
+        ref_nums = [RefNum(**worker_ref_settings(settings, offset, 2))
+                    for offset in range(3)]
+        refs = [set(ref_num.new('10.0.0.1', 27001) for _ in range(300))
+                for ref_num in ref_nums]
+        self.assertEqual([len(share) for share in refs], [300, 300, 300])
+        self.assertEqual(len(set.union(*refs)), 900)
+        self.assertEqual(settings, {'digits': 3, 'per_dest': True, 'ack_timeout': 30.0})
+
+
+    def test_worker_pool(self):
+        """ test forked workers get the schedule at start and on every
+        refresh, and their subscriptions reach the coordinator """
+        schedule = SharedSchedule(make_entries(2))
+        pool = WorkerPool(schedule, count=2, refresh_interval=3600)
+        pool.start(worker_main)
+        try:
+            recorder = SubscriptionRecorder(self.loop, 2)
+            pool.scheduler = recorder
+            pool.connect(self.loop)
+            self.loop.call_later(10, self.loop.stop)
+            self.loop.run_forever()
+            self.assertEqual(sorted(recorder.calls),
+                             [('worker', 2, 0), ('worker', 2, 1)])
+            recorder.wanted = 4
+            schedule.load(make_entries(5))
+            self.loop.run_forever()
+            self.assertEqual(sorted(recorder.calls[2:]),
+                             [('worker', 5, 0), ('worker', 5, 1)])
+        finally:
+            pool.stop()
+        self.loop.run_until_complete(asyncio.gather(*pool.tasks, return_exceptions=True))
+        self.assertEqual(pool.pids, [])
+
+
+    def test_worker_metrics(self):
+        """ test the metrics workers report are served by the coordinator """
+        metrics = Metrics(prefix='test_')
+        pool = WorkerPool(SharedSchedule(make_entries(2)), count=2,
+                          refresh_interval=3600, metrics=metrics)
+        pool.start(metrics_worker_main)
+
+        @asyncio.coroutine
+        def reported():
+            while len(metrics.workers) < 2:
+                yield from asyncio.sleep(0.05)
+
+        try:
+            pool.connect(self.loop)
+            self.loop.run_until_complete(asyncio.wait_for(reported(), 10))
+        finally:
+            pool.stop()
+        self.loop.run_until_complete(asyncio.gather(*pool.tasks, return_exceptions=True))
+        text = metrics.render()
+        self.assertIn('# TYPE test_msgs_total counter\n', text)
+        self.assertIn('test_msgs_total{msg_type="302",worker="0"} 1\n', text)
+        self.assertIn('test_msgs_total{msg_type="302",worker="1"} 2\n', text)
+
+
+
+    def test_worker_exit(self):
+        """ test each worker calls worker_exit before it exits """
+        temp_dir = tempfile.mkdtemp()
+        def worker_exit():
+            open(os.path.join(temp_dir, str(os.getpid())), 'w').close()
+        pool = WorkerPool(SharedSchedule(make_entries(1)), count=2,
+                          refresh_interval=3600)
+        pool.start(lambda worker_num, sock, entries: None, worker_exit=worker_exit)
+        try:
+            for pid in pool.pids:
+                os.waitpid(pid, 0)
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             sorted(str(pid) for pid in pool.pids))
+        finally:
+            pool.stop()
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
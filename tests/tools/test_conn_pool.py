@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+""" test_conn_pool.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.tools.conn_pool import ConnectionPool
+from bob_schedule_service.tools.message_handlers import MessageHandler
+
+
+# Define test class ***********************************************************
+class TestConnectionPool(unittest.TestCase):
+    """ unittests for outgoing connection pool """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.connections = 0
+        super(TestConnectionPool, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.mh = MessageHandler(self.loop, logger=self.log, framing='newline')
+        super(TestConnectionPool, self).setUp()
+
+
+    def tearDown(self):
+        self.mh.pool.close()
+        pending = asyncio.Task.all_tasks(loop=self.loop)
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(
+            asyncio.gather(*pending, loop=self.loop, return_exceptions=True))
+        self.loop.close()
+        super(TestConnectionPool, self).tearDown()
+
+
+    @asyncio.coroutine
+    def persistent_peer(self, reader, writer):
+        """ ACKs every message received until the client disconnects """
+        self.connections += 1
+        while True:
+            data = yield from reader.readline()
+            if not data:
+                break
+            writer.write(data.decode().split(',')[0].encode() + b'\n')
+            yield from writer.drain()
+        writer.close()
+
+
+    @asyncio.coroutine
+    def single_shot_peer(self, reader, writer):
+        """ ACKs one message then closes the socket """
+        self.connections += 1
+        data = yield from reader.read(200)
+        writer.write(data.decode().split(',')[0].encode())
+        yield from writer.drain()
+        writer.close()
+
+
+    def start_peer(self, handler):
+        server = self.loop.run_until_complete(
+            asyncio.start_server(handler, host='127.0.0.1', port=0, loop=self.loop))
+        return server, server.sockets[0].getsockname()[1]
+
+
+    def stop_peer(self, server):
+        server.close()
+        self.loop.run_until_complete(server.wait_closed())
+
+
+    def test_reuse_persistent_peer(self):
+        """ test messages to a peer that keeps its socket open share one
+        connection """
+        server, port = self.start_peer(self.persistent_peer)
+        for ref in ['101', '102', '103']:
+            msg = '%s,127.0.0.1,%s,127.0.0.1,27051,100' % (ref, port)
+            self.assertEqual(
+                self.loop.run_until_complete(self.mh.send_msg('127.0.0.1', port, msg)),
+                ref)
+        self.assertEqual(self.connections, 1)
+        self.mh.pool.close()
+        self.stop_peer(server)
+
+
+    def test_single_shot_peer(self):
+        """ test peers that close after each message still receive every
+        message """
+        server, port = self.start_peer(self.single_shot_peer)
+        for ref in ['101', '102', '103']:
+            msg = '%s,127.0.0.1,%s,127.0.0.1,27051,100' % (ref, port)
+            self.assertEqual(
+                self.loop.run_until_complete(self.mh.send_msg('127.0.0.1', port, msg)),
+                ref)
+        self.assertEqual(self.connections, 3)
+        self.stop_peer(server)
+
+
+    def test_evict_idle(self):
+        """ test idle connections are closed after the idle timeout """
+        server, port = self.start_peer(self.persistent_peer)
+        msg = '101,127.0.0.1,%s,127.0.0.1,27051,100' % port
+        self.loop.run_until_complete(self.mh.send_msg('127.0.0.1', port, msg))
+        self.assertEqual(len(self.mh.pool._idle[('127.0.0.1', port)]), 1)
+        self.mh.pool.idle_timeout = 0
+        self.mh.pool.evict_idle()
+        self.assertEqual(len(self.mh.pool._idle[('127.0.0.1', port)]), 0)
+        self.stop_peer(server)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+""" test_event_loop.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import logging
+import unittest
+import os
+import sys
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.tools.event_loop import install_loop_policy
+from bob_schedule_service.tools.event_loop import load_loop_policy
+
+
+# Define test class ***********************************************************
+class RecordingPolicy(asyncio.DefaultEventLoopPolicy):
+    """ standard loop policy counting the loops it creates """
+    created = 0
+
+    def new_event_loop(self):
+        RecordingPolicy.created += 1
+        return super().new_event_loop()
+
+
+class TestEventLoop(unittest.TestCase):
+    """ unittests for optional event loop policies """
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_event_loop')
+        super(TestEventLoop, self).setUp()
+
+
+    def tearDown(self):
+        asyncio.set_event_loop_policy(None)
+        super(TestEventLoop, self).tearDown()
+
+
+    def test_default(self):
+        """ test the asyncio loop needs no policy """
+        self.assertIsNone(load_loop_policy('asyncio', logger=self.logger))
+        self.assertIsNone(load_loop_policy('', logger=self.logger))
+
+
+    def test_import_path(self):
+        """ test policies can be named by module and class """
+        for name in ['asyncio:DefaultEventLoopPolicy', 'asyncio.DefaultEventLoopPolicy']:
+            self.assertIsInstance(load_loop_policy(name, logger=self.logger),
+                                  asyncio.DefaultEventLoopPolicy)
+
+
+    def test_fallback(self):
+        """ test unavailable loops fall back to asyncio with a warning """
+        for name in ['no_such_loop_module', 'no_such_module:Policy',
+                     'asyncio:NoSuchPolicy']:
+            with self.assertLogs(self.logger, logging.WARNING):
+                self.assertIsNone(load_loop_policy(name, logger=self.logger))
+        with self.assertLogs(self.logger, logging.WARNING):
+            self.assertEqual(install_loop_policy('no_such_loop_module', logger=self.logger),
+                             'asyncio')
+        loop = asyncio.new_event_loop()
+        self.assertIsInstance(loop, asyncio.AbstractEventLoop)
+        loop.close()
+
+
+    def test_install(self):
+        """ test the installed policy creates the loops """
+        RecordingPolicy.created = 0
+        name = RecordingPolicy.__module__ + ':RecordingPolicy'
+        self.assertEqual(install_loop_policy(name, logger=self.logger), name)
+        asyncio.new_event_loop().close()
+        self.assertEqual(RecordingPolicy.created, 1)
+
+
+    @unittest.skipIf(uvloop is None, 'uvloop is not installed')
+    def test_uvloop(self):
+        """ test the uvloop short name """
+        self.assertEqual(install_loop_policy('uvloop', logger=self.logger), 'uvloop')
+        loop = asyncio.new_event_loop()
+        self.assertIsInstance(loop, uvloop.Loop)
+        loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,7 +11,10 @@ import os
 import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.tools.field_checkers import check_fields
 from bob_schedule_service.tools.field_checkers import in_int_range
+from bob_schedule_service.tools.field_checkers import IPV4_FIELD
+from bob_schedule_service.tools.field_checkers import PORT_RANGE
 from bob_schedule_service.tools.field_checkers import is_valid_datetime
 
 
@@ -318,6 +321,39 @@ class TestFieldCheckers(unittest.TestCase):
         )
 
 
+class TestCheckFields(unittest.TestCase):
+    """ unittests for batch record validation """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        super(TestCheckFields, self).__init__(*args, **kwargs)
+
+
+    def test_in_int_range_limits(self):
+        """ test integer and string values against integer and string limits """
+        self.assertEqual(in_int_range('202', 100, 999, logger=self.log), True)
+        self.assertEqual(in_int_range(202, '100', '199', logger=self.log), False)
+        self.assertEqual(in_int_range('x', 100, 999, logger=self.log), False)
+
+
+    def test_check_fields(self):
+        """ test a whole message header is validated at once """
+        fields = '142,127.0.0.1,12000,192.168.5.45,13000,302,fylt1'.split(',')
+        self.assertEqual(check_fields(fields, logger=self.log), True)
+        fields[3] = '192.168.5.300'
+        self.assertEqual(check_fields(fields, logger=self.log), False)
+        self.assertEqual(check_fields(['142', '127.0.0.1', 12000], logger=self.log), False)
+
+
+    def test_check_fields_custom(self):
+        """ test records validated against a caller supplied list of checks """
+        checks = (IPV4_FIELD, PORT_RANGE)
+        self.assertEqual(check_fields(['10.0.0.1', 12000], checks, logger=self.log), True)
+        self.assertEqual(check_fields(['10.0.0.1', '9999'], checks, logger=self.log), False)
+
+
 
 if __name__ == "__main__":
     unittest.main()
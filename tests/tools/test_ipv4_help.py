@@ -37,6 +37,16 @@ class TestDst(unittest.TestCase):
         self.assertEqual(check_ipv4('127.0.0.1'), True)
 
 
+    def test_check_ipv4_octets(self):
+        """ test octet range and zero padding match the original regex """
+        self.assertEqual(check_ipv4('192.168.004.255'), True)
+        self.assertEqual(check_ipv4('192.168.4.256'), False)
+        self.assertEqual(check_ipv4('192.168.4.0255'), False)
+        self.assertEqual(check_ipv4('192.168.4'), False)
+        self.assertEqual(check_ipv4('192.168.4.4.4'), False)
+        self.assertEqual(check_ipv4(' 192.168.4.4'), False)
+
+
 
 
 
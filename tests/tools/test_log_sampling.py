@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+""" test_log_sampling.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.tools.log_sampling import SampledLogger
+
+
+# Define test class ***********************************************************
+class RecordList(logging.Handler):
+    """ handler that keeps every record it is given """
+    def __init__(self):
+        self.records = []
+        super().__init__()
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestSampledLogger(unittest.TestCase):
+    """ unittests for hot path logger wrapper """
+
+    def setUp(self):
+        self.handler = RecordList()
+        self.log = logging.getLogger('test_log_sampling')
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+        self.log.addHandler(self.handler)
+        super(TestSampledLogger, self).setUp()
+
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+        super(TestSampledLogger, self).tearDown()
+
+
+    def test_caller_info(self):
+        """ test records point at the calling function, not the wrapper """
+        logger = SampledLogger(self.log)
+        logger.debug('value: %s', 5)
+        logger.warning('warning')
+        self.assertEqual([x.getMessage() for x in self.handler.records],
+                         ['value: 5', 'warning'])
+        self.assertEqual(self.handler.records[0].funcName, 'test_caller_info')
+        self.assertEqual(self.handler.records[0].filename, 'test_log_sampling.py')
+
+
+    def test_off(self):
+        """ test debug calls are skipped while other levels still log """
+        logger = SampledLogger(self.log, mode='off')
+        logger.debug('skipped')
+        logger.info('kept')
+        self.assertEqual([x.getMessage() for x in self.handler.records], ['kept'])
+
+
+    def test_off_when_level_filtered(self):
+        """ test debug is disabled at startup when the logger filters it """
+        self.log.setLevel(logging.INFO)
+        logger = SampledLogger(self.log, mode='on')
+        self.assertEqual(logger.debug, logger.skip)
+
+
+    def test_sample(self):
+        """ test one debug call in every sample_rate calls is logged """
+        logger = SampledLogger(self.log, mode='sample', sample_rate=3)
+        for i in range(7):
+            logger.debug('msg %s', i)
+        self.assertEqual([x.args[0] for x in self.handler.records], [2, 5])
+
+
+    def test_report(self):
+        """ test logging time is totalled per message type """
+        logger = SampledLogger(self.log)
+        logger.msg_type = '302'
+        logger.debug('one')
+        logger.debug('two')
+        logger.msg_type = '100'
+        logger.debug('three')
+        totals = logger.report()
+        self.assertEqual(sorted(totals.keys()), ['100', '302'])
+        self.assertEqual(totals['302'][1], 2)
+        self.assertEqual(totals['100'][1], 1)
+        self.assertEqual(logger.report(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,7 +12,10 @@ import os
 import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.msg_processing import process_get_device_scheduled_states_msg
+from bob_schedule_service.msg_processing import process_get_service_stats_msg
 from bob_schedule_service.tools.message_handlers import MessageHandler
+from bob_schedule_service.tools.ref_num import RefNum
 
 
 # Define test class ***********************************************************
@@ -62,5 +65,451 @@ class TestMessageHandler(unittest.TestCase):
         asyncio.Task.all_tasks()
 
 
+class TestMessageOut(unittest.TestCase):
+    """ unittests for per-destination outgoing message tasks """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.received = []
+        super(TestMessageOut, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.mh = MessageHandler(self.loop, logger=self.log, send_timeout=0.2)
+        super(TestMessageOut, self).setUp()
+
+
+    def tearDown(self):
+        self.mh.pool.close()
+        pending = asyncio.Task.all_tasks(loop=self.loop)
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(
+            asyncio.gather(*pending, loop=self.loop, return_exceptions=True))
+        self.loop.close()
+        super(TestMessageOut, self).tearDown()
+
+
+    @asyncio.coroutine
+    def fast_peer(self, reader, writer):
+        data = yield from reader.read(200)
+        self.received.append(data.decode())
+        writer.write(data.decode().split(',')[0].encode())
+        yield from writer.drain()
+        writer.close()
+
+
+    @asyncio.coroutine
+    def flaky_peer(self, reader, writer):
+        # Closes the first two connections without an ACK
+        data = yield from reader.read(200)
+        self.received.append(data.decode().split(',')[0])
+        if len(self.received) > 2:
+            writer.write(data.decode().split(',')[0].encode())
+            yield from writer.drain()
+        writer.close()
+
+
+    @asyncio.coroutine
+    def wrong_ack_peer(self, reader, writer):
+        yield from reader.read(200)
+        writer.write(b'999')
+        yield from writer.drain()
+        writer.close()
+
+
+    @asyncio.coroutine
+    def hung_peer(self, reader, writer):
+        yield from reader.read(200)
+        yield from asyncio.sleep(10, loop=self.loop)
+
+
+    def start_peer(self, handler):
+        server = self.loop.run_until_complete(
+            asyncio.start_server(handler, host='127.0.0.1', port=0, loop=self.loop))
+        return server, server.sockets[0].getsockname()[1]
+
+
+    def test_no_head_of_line_blocking(self):
+        """ test a hung peer does not delay messages to other peers """
+        fast, fast_port = self.start_peer(self.fast_peer)
+        hung, hung_port = self.start_peer(self.hung_peer)
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        self.mh.msg_out_queue.put_nowait(
+            '101,127.0.0.1,%s,127.0.0.1,27051,100' % hung_port)
+        self.mh.msg_out_queue.put_nowait(
+            '102,127.0.0.1,%s,127.0.0.1,27051,100' % fast_port)
+        self.loop.run_until_complete(asyncio.sleep(0.1, loop=self.loop))
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(self.mh.send_failures, {})
+        self.loop.run_until_complete(asyncio.sleep(0.2, loop=self.loop))
+        self.assertEqual(self.mh.send_failures, {('127.0.0.1', hung_port): 1})
+        fast.close()
+        hung.close()
+
+
+    def test_connection_refused(self):
+        """ test failed connections are counted per destination """
+        closed, port = self.start_peer(self.fast_peer)
+        closed.close()
+        self.loop.run_until_complete(closed.wait_closed())
+        self.mh.retry_delay = 0.01
+        self.mh.max_retry_delay = 0.02
+        self.mh.max_retries = 1
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        for ref in ['101', '102']:
+            self.mh.msg_out_queue.put_nowait(
+                '%s,127.0.0.1,%s,127.0.0.1,27051,100' % (ref, port))
+        self.loop.run_until_complete(asyncio.sleep(0.2, loop=self.loop))
+        self.assertEqual(self.mh.send_failures, {('127.0.0.1', port): 4})
+
+
+    def test_retry_until_acked(self):
+        """ test messages are resent after a backoff until ACKed """
+        flaky, port = self.start_peer(self.flaky_peer)
+        self.mh.retry_delay = 0.01
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        for ref in ['101', '102']:
+            self.mh.msg_out_queue.put_nowait(
+                '%s,127.0.0.1,%s,127.0.0.1,27051,100' % (ref, port))
+        self.loop.run_until_complete(asyncio.sleep(0.2, loop=self.loop))
+        dest = ('dest', '127.0.0.1:%s' % port)
+        self.assertEqual(self.received, ['101', '101', '101', '102'])
+        self.assertEqual(self.mh.send_failures, {('127.0.0.1', port): 2})
+        self.assertEqual(self.mh.metrics.values[('messages_sent_total', (dest,))], 2)
+        # Only the message that was resent counts as retried
+        self.assertEqual(self.mh.metrics.values[('send_retries_total', (dest,))], 2)
+        self.assertEqual(len(self.mh.outstanding), 0)
+        flaky.close()
+
+
+    def test_retries_dropped(self):
+        """ test each message is only dropped after it has been sent
+        max_retries more times itself """
+        closed, port = self.start_peer(self.fast_peer)
+        closed.close()
+        self.loop.run_until_complete(closed.wait_closed())
+        self.mh.retry_delay = 0.01
+        self.mh.max_retry_delay = 0.02
+        self.mh.max_retries = 2
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        for ref in ['101', '102', '103']:
+            self.mh.msg_out_queue.put_nowait(
+                '%s,127.0.0.1,%s,127.0.0.1,27051,100' % (ref, port))
+        self.loop.run_until_complete(asyncio.sleep(0.3, loop=self.loop))
+        dest = ('dest', '127.0.0.1:%s' % port)
+        self.assertEqual(self.mh.send_failures, {('127.0.0.1', port): 9})
+        self.assertEqual(self.mh.metrics.values[('send_retries_total', (dest,))], 6)
+        self.assertEqual(self.mh.metrics.values[('messages_dropped_total', (dest,))], 3)
+        self.assertEqual(len(self.mh.outstanding), 0)
+
+
+    def test_unexpected_error(self):
+        """ test an unexpected send error is counted as a failure and the
+        destination's sender task keeps running """
+        fast, port = self.start_peer(self.fast_peer)
+        self.mh.retry_delay = 0.01
+        send_msg = self.mh.send_msg
+        calls = []
+
+        @asyncio.coroutine
+        def broken_send_msg(addr, port, msg):
+            calls.append(msg)
+            if len(calls) == 1:
+                raise ValueError('broken')
+            return (yield from send_msg(addr, port, msg))
+
+        self.mh.send_msg = broken_send_msg
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        self.mh.msg_out_queue.put_nowait('101,127.0.0.1,%s,127.0.0.1,27051,100' % port)
+        self.loop.run_until_complete(asyncio.sleep(0.1, loop=self.loop))
+        self.assertEqual(self.mh.send_failures, {('127.0.0.1', port): 1})
+        self.assertEqual(self.received, ['101,127.0.0.1,%s,127.0.0.1,27051,100' % port])
+        self.assertFalse(self.mh.dest_tasks[('127.0.0.1', port)].done())
+        fast.close()
+
+
+    def test_restart_sender_task(self):
+        """ test a stopped sender task is restarted by the next message """
+        fast, port = self.start_peer(self.fast_peer)
+        dest = ('127.0.0.1', port)
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        self.mh.msg_out_queue.put_nowait('101,127.0.0.1,%s,127.0.0.1,27051,100' % port)
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        self.mh.dest_tasks[dest].cancel()
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.assertTrue(self.mh.dest_tasks[dest].done())
+        self.mh.msg_out_queue.put_nowait('102,127.0.0.1,%s,127.0.0.1,27051,100' % port)
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        self.assertEqual([msg.split(',')[0] for msg in self.received], ['101', '102'])
+        self.assertFalse(self.mh.dest_tasks[dest].done())
+        fast.close()
+
+
+    def test_retry_backoff(self):
+        """ test the backoff doubles up to its limit, with jitter """
+        self.mh.retry_delay = 1.0
+        self.mh.max_retry_delay = 8.0
+        for rounds, delay in [(1, 1.0), (2, 2.0), (4, 8.0), (10, 8.0)]:
+            backoff = self.mh.retry_backoff(rounds)
+            self.assertTrue(delay / 2 <= backoff <= delay)
+
+
+    def test_ack_matching(self):
+        """ test ACKs are matched to their messages and unmatched ones
+        leave the message outstanding until it expires """
+        fast, fast_port = self.start_peer(self.fast_peer)
+        wrong, wrong_port = self.start_peer(self.wrong_ack_peer)
+        self.mh.retry_delay = 10.0
+        asyncio.ensure_future(self.mh.handle_msg_out(), loop=self.loop)
+        self.mh.msg_out_queue.put_nowait(
+            '101,127.0.0.1,%s,127.0.0.1,27051,100' % fast_port)
+        self.mh.msg_out_queue.put_nowait(
+            '102,127.0.0.1,%s,127.0.0.1,27051,100' % wrong_port)
+        self.loop.run_until_complete(asyncio.sleep(0.1, loop=self.loop))
+        self.assertEqual(list(self.mh.outstanding.pending),
+                         [(('127.0.0.1', wrong_port), '102')])
+        self.assertEqual(self.mh.outstanding.acked, 1)
+        self.assertEqual(self.mh.metrics.values[
+            ('acks_unmatched_total', (('dest', '127.0.0.1:%s' % wrong_port),))], 1)
+        self.mh.outstanding.timeout = 0.1
+        asyncio.ensure_future(self.mh.handle_ack_expiry(), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.2, loop=self.loop))
+        self.assertEqual(len(self.mh.outstanding), 0)
+        self.assertEqual(self.mh.outstanding.expired, 1)
+        fast.close()
+        wrong.close()
+
+
+class TestMessageIn(unittest.TestCase):
+    """ unittests for incoming message framing """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        super(TestMessageIn, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.mh = MessageHandler(self.loop, logger=self.log, framing='newline')
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.mh.handle_msg_in, host='127.0.0.1',
+                                 port=0, loop=self.loop))
+        self.port = self.server.sockets[0].getsockname()[1]
+        super(TestMessageIn, self).setUp()
+
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        super(TestMessageIn, self).tearDown()
+
+
+    @asyncio.coroutine
+    def exchange(self, data, close=True):
+        reader, writer = yield from asyncio.open_connection(
+            '127.0.0.1', self.port, loop=self.loop)
+        writer.write(data)
+        if close:
+            writer.write_eof()
+            acks = yield from reader.read()
+        else:
+            acks = yield from reader.read(200)
+        writer.close()
+        return acks
+
+
+    def drain_queue(self):
+        result = []
+        while not self.mh.msg_in_queue.empty():
+            result.append(self.mh.msg_in_queue.get_nowait())
+        return result
+
+
+    def test_legacy_message(self):
+        """ test legacy framing ACKs a single read without a terminator """
+        self.mh.framing = 'legacy'
+        msg = '101,127.0.0.1,27051,127.0.0.1,27001,100'
+        acks = self.loop.run_until_complete(self.exchange(msg.encode(), close=False))
+        self.assertEqual(acks, b'101')
+        self.assertEqual(self.drain_queue(), [msg])
+
+
+    def test_legacy_send(self):
+        """ test legacy framing sends each message unterminated on its own
+        connection and takes the ACK from a single read """
+        self.mh.framing = 'legacy'
+        for ref in ['101', '102']:
+            msg = '%s,127.0.0.1,%s,127.0.0.1,27001,303,fan,on' % (ref, self.port)
+            ack = self.loop.run_until_complete(asyncio.wait_for(
+                self.mh.send_msg('127.0.0.1', self.port, msg), 2, loop=self.loop))
+            self.assertEqual(ack, ref)
+            self.assertEqual(self.drain_queue(), [msg])
+        self.assertEqual(self.mh.pool._idle.get(('127.0.0.1', self.port), []), [])
+
+
+    def test_send_long_message(self):
+        """ test messages longer than the old 200 byte read are ACKed
+        while the sender's connection stays open """
+        msg = '101,127.0.0.1,%s,127.0.0.1,27001,302,%s' % (self.port, 'x' * 350)
+        ack = self.loop.run_until_complete(asyncio.wait_for(
+            self.mh.send_msg('127.0.0.1', self.port, msg), 2, loop=self.loop))
+        self.assertEqual(ack, '101')
+        self.assertEqual(self.drain_queue(), [msg])
+        self.mh.pool.close()
+
+
+    def test_invalid_utf8(self):
+        """ test a message that can't be decoded gets an empty ACK and
+        later messages on the connection are still handled """
+        msg = '102,127.0.0.1,27051,127.0.0.1,27001,100'
+        acks = self.loop.run_until_complete(
+            self.exchange(b'101,\xff\xfe\n' + msg.encode() + b'\n'))
+        self.assertEqual(acks, b'\n102\n')
+        self.assertEqual(self.drain_queue(), [msg])
+
+
+    def test_resent_message(self):
+        """ test a resent message is delivered again by default """
+        msg = '101,127.0.0.1,27051,127.0.0.1,27001,100'
+        for _ in range(2):
+            acks = self.loop.run_until_complete(self.exchange(msg.encode() + b'\n'))
+            self.assertEqual(acks, b'101\n')
+        self.assertEqual(self.drain_queue(), [msg, msg])
+
+
+    def test_duplicate_window(self):
+        """ test a resent message is ACKed again but only queued once
+        within the duplicate window, while a new message reusing the ref
+        is still queued """
+        self.mh.duplicate_window = 30
+        msg = '101,127.0.0.1,27051,127.0.0.1,27001,100'
+        other = '101,127.0.0.1,27051,127.0.0.1,27001,302,fan'
+        from_other_source = '101,127.0.0.1,27051,127.0.0.1,27002,100'
+        acks = self.loop.run_until_complete(self.exchange(
+            ('\n'.join([msg, msg, other, from_other_source]) + '\n').encode()))
+        self.assertEqual(acks, b'101\n101\n101\n101\n')
+        self.assertEqual(self.drain_queue(), [msg, other, from_other_source])
+        self.assertEqual(self.mh.metrics.values[('messages_duplicate_total', ())], 1)
+        self.mh.recent_msgs[('101', '127.0.0.1', '27001')] = (other, self.loop.time() - 31)
+        self.loop.run_until_complete(self.exchange(other.encode() + b'\n'))
+        self.assertEqual(self.drain_queue(), [other])
+
+
+    def test_pipelined_messages(self):
+        """ test several framed messages on one connection are each queued
+        and ACKed in order """
+        msgs = ['%s,127.0.0.1,27051,127.0.0.1,27001,302,dev%s' % (ref, ref)
+                for ref in range(101, 111)]
+        data = ''.join(msg + '\n' for msg in msgs).encode()
+        acks = self.loop.run_until_complete(self.exchange(data))
+        self.assertEqual(acks.decode().split('\n')[:-1],
+                         [str(ref) for ref in range(101, 111)])
+        self.assertEqual(self.drain_queue(), msgs)
+
+
+    def test_long_message(self):
+        """ test framed messages longer than a single read are not
+        truncated """
+        msg = '101,127.0.0.1,27051,127.0.0.1,27001,302,' + 'x' * 10000
+        acks = self.loop.run_until_complete(self.exchange(msg.encode() + b'\n'))
+        self.assertEqual(acks, b'101\n')
+        self.assertEqual(self.drain_queue(), [msg])
+
+
+
+class DeviceList(object):
+    """ schedule stand-in with a fixed set of devices, every other one
+    scheduled on """
+    def __init__(self, count):
+        self.dev_names = ['device%02d' % i for i in range(count)]
+        self.index = self
+
+    def names(self):
+        return self.dev_names
+
+    def check_schedule(self, name):
+        return self.dev_names.index(name) % 2 == 0
+
+
+class TestLargeReplies(unittest.TestCase):
+    """ unittests for replies longer than the old 200 byte read """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        self.message_types = {'get_device_scheduled_states_ack': '309',
+                              'get_service_stats_ack': '311'}
+        super(TestLargeReplies, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.default_loop = asyncio.get_event_loop()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.sender = MessageHandler(self.loop, logger=self.log, framing='newline')
+        self.receiver = MessageHandler(self.loop, logger=self.log, framing='newline')
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.receiver.handle_msg_in, host='127.0.0.1',
+                                 port=0, loop=self.loop))
+        self.port = self.server.sockets[0].getsockname()[1]
+        super(TestLargeReplies, self).setUp()
+
+
+    def tearDown(self):
+        self.sender.pool.close()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        asyncio.set_event_loop(self.default_loop)
+        super(TestLargeReplies, self).tearDown()
+
+
+    def send_reply(self, reply):
+        """ sends a reply to the receiver and returns the ACK and the
+        message the receiver queued """
+        ack = self.loop.run_until_complete(asyncio.wait_for(
+            self.sender.send_msg('127.0.0.1', self.port, reply), 2, loop=self.loop))
+        return ack, self.receiver.msg_in_queue.get_nowait()
+
+
+    def test_device_states_reply(self):
+        """ test a batched reply for many devices arrives whole """
+        request = '101,127.0.0.1,27051,127.0.0.1,%s,308,all' % self.port
+        replies = process_get_device_scheduled_states_msg(
+            self.log, RefNum(), DeviceList(40), request, self.message_types)
+        self.assertEqual(len(replies), 1)
+        self.assertGreater(len(replies[0]), 500)
+        ack, received = self.send_reply(replies[0])
+        self.assertEqual(ack, replies[0].split(',')[0])
+        self.assertEqual(received, replies[0])
+        self.assertEqual(received.split(',')[-2:], ['device39', 'off'])
+
+
+    def test_service_stats_reply(self):
+        """ test the stats reply, which is always longer than 200 bytes,
+        arrives whole """
+        for msg_type in ['302', '304', '306', '308']:
+            self.sender.metrics.inc('messages_received_total', msg_type=msg_type)
+        self.sender.metrics.observe('send_seconds', 0.01, dest='127.0.0.1:27001')
+        request = '101,127.0.0.1,27051,127.0.0.1,%s,310' % self.port
+        replies = process_get_service_stats_msg(
+            self.log, RefNum(), self.sender.metrics, request, self.message_types)
+        self.assertEqual(len(replies), 1)
+        self.assertGreater(len(replies[0]), 200)
+        ack, received = self.send_reply(replies[0])
+        self.assertEqual(ack, replies[0].split(',')[0])
+        self.assertEqual(received, replies[0])
+
+
 if __name__ == "__main__":
     unittest.main()
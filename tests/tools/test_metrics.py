@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+""" test_metrics.py:
+"""
+
+# Import Required Libraries (Standard, Third Party, Local) ********************
+import asyncio
+import logging
+import unittest
+import os
+import sys
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.tools.metrics import Metrics
+
+
+# Define test class ***********************************************************
+class TestMetrics(unittest.TestCase):
+    """ unittests for metrics registry """
+
+    def __init__(self, *args, **kwargs):
+        logging.basicConfig(stream=sys.stdout)
+        self.log = logging.getLogger(__name__)
+        self.log.level = logging.DEBUG
+        super(TestMetrics, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.metrics = Metrics(logger=self.log, prefix='test_')
+        self.metrics.describe('msgs_total', 'counter', 'Messages')
+        self.metrics.describe('handling_seconds', 'histogram', 'Handling time',
+                              buckets=(0.001, 0.01))
+        self.metrics.describe('depth', 'gauge', 'Queue depth')
+        super(TestMetrics, self).setUp()
+
+
+    def test_render_counter_gauge(self):
+        """ test counters and callback gauges in exposition format """
+        self.metrics.inc('msgs_total', msg_type='302')
+        self.metrics.inc('msgs_total', 2, msg_type='302')
+        self.metrics.gauge('depth', lambda: 4, queue='msg_in')
+        text = self.metrics.render()
+        self.assertIn('# TYPE test_msgs_total counter\n', text)
+        self.assertIn('test_msgs_total{msg_type="302"} 3\n', text)
+        self.assertIn('# TYPE test_depth gauge\n', text)
+        self.assertIn('test_depth{queue="msg_in"} 4\n', text)
+
+
+    def test_render_histogram(self):
+        """ test histogram buckets are cumulative and end with +Inf """
+        for value in [0.0005, 0.005, 0.005, 1.0]:
+            self.metrics.observe('handling_seconds', value)
+        text = self.metrics.render()
+        self.assertIn('test_handling_seconds_bucket{le="0.001"} 1\n', text)
+        self.assertIn('test_handling_seconds_bucket{le="0.01"} 3\n', text)
+        self.assertIn('test_handling_seconds_bucket{le="+Inf"} 4\n', text)
+        self.assertIn('test_handling_seconds_count 4\n', text)
+
+
+    def test_snapshot(self):
+        """ test the stats message form holds no commas """
+        self.metrics.inc('msgs_total', msg_type='302', dest='127.0.0.1:27001')
+        self.metrics.observe('handling_seconds', 0.5)
+        pairs = dict(self.metrics.snapshot())
+        self.assertEqual(pairs['msgs_total[dest=127.0.0.1:27001;msg_type=302]'], '1')
+        self.assertEqual(pairs['handling_seconds_count'], '1')
+        self.assertEqual(pairs['handling_seconds_sum'], '0.5')
+        for name, value in pairs.items():
+            self.assertNotIn(',', name + value)
+
+
+    def test_snapshot_precision(self):
+        """ test large counters and timestamps keep every digit """
+        self.metrics.inc('msgs_total', 1234567)
+        self.metrics.set('last_sync', 1792330123.456789)
+        pairs = dict(self.metrics.snapshot())
+        self.assertEqual(pairs['msgs_total'], '1234567')
+        self.assertEqual(pairs['last_sync'], '1792330123.456789')
+
+
+    def test_merge(self):
+        """ test metrics exported by workers are read with a worker label
+        and replaced by each new export """
+        worker = Metrics(logger=self.log)
+        worker.describe('msgs_total', 'counter', 'Messages')
+        worker.describe('handling_seconds', 'histogram', 'Handling time',
+                        buckets=(0.001, 0.01))
+        worker.inc('msgs_total', msg_type='302')
+        worker.observe('handling_seconds', 0.005)
+        self.metrics.inc('msgs_total', msg_type='302')
+        self.metrics.merge(0, worker.export())
+        worker.inc('msgs_total', msg_type='302')
+        self.metrics.merge(0, worker.export())
+        self.metrics.merge(1, worker.export())
+        text = self.metrics.render()
+        self.assertIn('test_msgs_total{msg_type="302"} 1\n', text)
+        self.assertIn('test_msgs_total{msg_type="302",worker="0"} 2\n', text)
+        self.assertIn('test_msgs_total{msg_type="302",worker="1"} 2\n', text)
+        self.assertIn('test_handling_seconds_bucket{worker="1",le="0.01"} 1\n', text)
+        self.assertEqual(text.count('# TYPE test_msgs_total counter'), 1)
+
+
+    def test_handle_http(self):
+        """ test the local endpoint answers with the text rendering """
+        self.metrics.inc('msgs_total')
+        loop = asyncio.new_event_loop()
+        try:
+            server = loop.run_until_complete(asyncio.start_server(
+                self.metrics.handle_http, host='127.0.0.1', port=0, loop=loop))
+            port = server.sockets[0].getsockname()[1]
+
+            @asyncio.coroutine
+            def scrape():
+                reader, writer = yield from asyncio.open_connection(
+                    '127.0.0.1', port, loop=loop)
+                writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                data = yield from reader.read()
+                writer.close()
+                return data.decode()
+
+            response = loop.run_until_complete(scrape())
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+        finally:
+            loop.close()
+        self.assertTrue(response.startswith('HTTP/1.0 200 OK'))
+        self.assertIn('test_msgs_total 1\n', response)
+
+
+if __name__ == "__main__":
+    unittest.main()
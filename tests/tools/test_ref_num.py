@@ -11,6 +11,7 @@ import os
 import sys
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bob_schedule_service.tools.ref_num import OutstandingRefs
 from bob_schedule_service.tools.ref_num import RefNum
 
 
@@ -22,7 +23,7 @@ class TestDst(unittest.TestCase):
         logging.basicConfig(stream=sys.stdout)
         self.log = logging.getLogger(__name__)
         self.log.level = logging.DEBUG
-        self.ref_num = RefNum(log=self.log)
+        self.ref_num = RefNum(logger=self.log)
         super(TestDst, self).__init__(*args, **kwargs)
 
 
@@ -46,5 +47,97 @@ class TestDst(unittest.TestCase):
         self.assertEqual(self.ref_num.new(), '100')
 
 
+class TestWideRefNum(unittest.TestCase):
+    """ unittests for wide and per-destination ref numbers """
+
+    def test_digits(self):
+        """ test the sequence covers every ref of the given width """
+        ref_num = RefNum(digits=6)
+        self.assertEqual(ref_num.new(), '100001')
+        ref_num.source = 999999
+        self.assertEqual(ref_num.new(), '100000')
+
+
+    def test_per_dest(self):
+        """ test each destination has its own sequence """
+        ref_num = RefNum(per_dest=True)
+        self.assertEqual(ref_num.new('10.0.0.1', '27001'), '101')
+        self.assertEqual(ref_num.new('10.0.0.1', 27001), '102')
+        self.assertEqual(ref_num.new('10.0.0.2', 27001), '101')
+        self.assertEqual(ref_num.new(), '101')
+
+
+    def test_invalid_port(self):
+        """ test a bad port falls back to the shared sequence """
+        ref_num = RefNum(per_dest=True)
+        self.assertEqual(ref_num.new('10.0.0.1', ''), '101')
+        self.assertEqual(ref_num.new('10.0.0.1', 'port'), '102')
+        self.assertEqual(ref_num.new('10.0.0.1', None), '103')
+        self.assertEqual(ref_num.new('10.0.0.1', 27001), '101')
+
+
+    def test_skip_outstanding(self):
+        """ test refs still waiting for an ACK are not reused """
+        ref_num = RefNum(per_dest=True)
+        dest = ('10.0.0.1', 27001)
+        ref_num.outstanding.add(dest, '101', 'msg')
+        ref_num.outstanding.add(dest, '102', 'msg')
+        self.assertEqual(ref_num.new(*dest), '103')
+        self.assertEqual(ref_num.new('10.0.0.2', 27001), '101')
+
+
+    def test_partition(self):
+        """ test processes given their own share of the refs never hand
+        out the same ref, before or after wrapping """
+        ref_nums = [RefNum(offset=offset, step=3) for offset in range(3)]
+        self.assertEqual([ref_num.new() for ref_num in ref_nums], ['103', '104', '105'])
+        refs = [set(ref_num.new() for _ in range(600)) for ref_num in ref_nums]
+        self.assertEqual([len(share) for share in refs], [300, 300, 300])
+        self.assertEqual(set.union(*refs), set(str(ref) for ref in range(100, 1000)))
+        ref_num = RefNum(offset=2, step=3, per_dest=True)
+        dest = ('10.0.0.1', 27001)
+        ref_num.outstanding.add(dest, '105', 'msg')
+        self.assertEqual(ref_num.new(*dest), '108')
+
+
+class TestOutstandingRefs(unittest.TestCase):
+    """ unittests for outstanding ACK table """
+
+    def setUp(self):
+        self.table = OutstandingRefs(timeout=10.0)
+        self.dest = ('10.0.0.1', 27001)
+        super(TestOutstandingRefs, self).setUp()
+
+
+    def test_ack(self):
+        """ test ACKs are matched to the message by destination and ref """
+        self.table.add(self.dest, '101', 'first', now=0.0)
+        self.table.add(self.dest, 102, 'second', now=1.0)
+        self.assertIsNone(self.table.ack(('10.0.0.2', 27001), '101'))
+        self.assertEqual(self.table.ack(self.dest, '102\n'), 'second')
+        self.assertIsNone(self.table.ack(self.dest, '102'))
+        self.assertEqual(len(self.table), 1)
+        self.assertEqual((self.table.acked, self.table.unmatched), (1, 2))
+
+
+    def test_expire(self):
+        """ test only messages older than the timeout are expired """
+        self.table.add(self.dest, '101', 'first', now=0.0)
+        self.table.add(self.dest, '102', 'second', now=5.0)
+        self.assertEqual(self.table.expire(now=9.0), [])
+        self.assertEqual(self.table.expire(now=12.0), [(self.dest, '101', 'first')])
+        self.assertEqual(self.table.expire(now=20.0), [(self.dest, '102', 'second')])
+        self.assertEqual((len(self.table), self.table.expired), (0, 2))
+
+
+    def test_replace(self):
+        """ test re-adding a ref resets its send time """
+        self.table.add(self.dest, '101', 'first', now=0.0)
+        self.table.add(self.dest, '102', 'second', now=1.0)
+        self.table.add(self.dest, '101', 'again', now=8.0)
+        self.assertEqual(self.table.expire(now=12.0), [(self.dest, '102', 'second')])
+        self.assertEqual(self.table.ack(self.dest, '101'), 'again')
+
+
 if __name__ == "__main__":
     unittest.main()